@@ -0,0 +1,8 @@
+"""
+Micro-benchmarks for the examples in `pep/`.
+
+These are not part of the test suite. Run one from the repository root with,
+for example:
+
+    python -m benchmarks.bench_compile
+"""
@@ -0,0 +1,68 @@
+"""
+Benchmark page latency when fragments come from slow backends.
+
+The "before" numbers await each fragment one after another and then call
+`html()`; the "after" numbers pass the awaitables straight to `async_html()`.
+"""
+
+import asyncio
+import time
+from string.templatelib import Template
+
+from pep.web import async_html, html
+
+from .common import bench
+
+DELAYS = [0.05, 0.02, 0.08, 0.03, 0.04]
+
+
+async def fetch(name: str, delay: float) -> Template:
+    await asyncio.sleep(delay)
+    return t'<section class="fragment"><h2>{name}</h2></section>'
+
+
+def page(a: object, b: object, c: object, d: object, e: object) -> Template:
+    return t'<main><header>{a}</header><div class="body">{b}{c}{d}</div>{e}</main>'
+
+
+async def sequential() -> float:
+    start = time.perf_counter()
+    fragments = [await fetch(f"f{i}", delay) for i, delay in enumerate(DELAYS)]
+    html(page(*fragments))
+    return time.perf_counter() - start
+
+
+async def concurrent() -> float:
+    start = time.perf_counter()
+    await async_html(page(*(fetch(f"f{i}", d) for i, d in enumerate(DELAYS))))
+    return time.perf_counter() - start
+
+
+async def latency() -> None:
+    before = min([await sequential() for _ in range(5)])
+    after = min([await concurrent() for _ in range(5)])
+    print(
+        f"slowest fragment {max(DELAYS) * 1e3:.0f} ms, sum {sum(DELAYS) * 1e3:.0f} ms"
+    )
+    print(f"{'await then html()':<48} {before * 1e3:12.2f} ms")
+    print(f"{'async_html()':<48} {after * 1e3:12.2f} ms")
+
+
+async def overhead(template: Template, number: int = 2_000) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        await async_html(template)
+    return (time.perf_counter() - start) / number
+
+
+def main() -> None:
+    asyncio.run(latency())
+    # The cost of async_html() for a template with nothing to await
+    template = page("a", "b", "c", "d", "e")
+    bench("html(), nothing to await", lambda: html(template))
+    after = asyncio.run(overhead(template))
+    print(f"{'async_html(), nothing to await':<48} {after * 1e6:12.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
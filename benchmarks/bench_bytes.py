@@ -0,0 +1,70 @@
+"""
+Benchmark producing UTF-8 encoded HTML, as a WSGI or ASGI response needs.
+
+The "before" path builds the Element tree, renders it to a string, and
+encodes the string. `html_bytes()` and `html_chunks()` write static markup
+that was encoded once per template shape, and only escape and encode the
+interpolated values.
+"""
+
+from string.templatelib import Template
+
+from pep.web import Element, html, html_bytes, html_chunks
+
+from .common import bench, compare
+
+
+def row(i: int) -> Template:
+    name = f"Item {i} & <friends>"
+    price = f"€{i}.00"
+    return t"""
+    <tr class="row">
+        <td class="id">{str(i)}</td>
+        <td class="name"><a href="/items/{str(i)}" title={name}>{name}</a></td>
+        <td class="price">{price}</td>
+    </tr>
+    """
+
+
+def page(rows: list[Element]) -> Template:
+    user = "Zoë"
+    return t"""
+    <html lang="en">
+        <head><title>Items for {user}</title></head>
+        <body class="listing">
+            <header><p class="welcome">Welcome back, <b>{user}</b>!</p></header>
+            <main><table class="data"><tbody>{Element.fragment(rows)}</tbody></table></main>
+            <footer><p>&copy; Example Shop. All rights reserved.</p></footer>
+        </body>
+    </html>
+    """
+
+
+def main() -> None:
+    template = row(42)
+    compare(
+        "one table row",
+        lambda: str(html(template)).encode(),
+        lambda: html_bytes(template),
+    )
+    bench("one table row (html_chunks)", lambda: html_chunks(template))
+
+    rows = [html(row(i)) for i in range(500)]
+    template = page(rows)
+    compare(
+        "page with 500 prebuilt rows",
+        lambda: str(html(template)).encode(),
+        lambda: html_bytes(template),
+    )
+
+    # A page that is mostly static markup around a few values
+    template = page([])
+    compare(
+        "mostly static page",
+        lambda: str(html(template)).encode(),
+        lambda: html_bytes(template),
+    )
+
+
+if __name__ == "__main__":
+    main()
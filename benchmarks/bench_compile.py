@@ -0,0 +1,45 @@
+"""
+Benchmark repeat renders of the same template shape with `html()`.
+
+The "before" numbers clear the compiled template cache before every call,
+which is equivalent to parsing every template from scratch.
+"""
+
+from string.templatelib import Template
+
+from pep.web import html, html_cache_clear
+
+from .common import compare
+
+
+def page(title: str, items: list[str], attrs: dict[str, str | None]) -> Template:
+    return t"""
+    <div class="page" {attrs}>
+        <h1 class="title">{title}</h1>
+        <p>Welcome back, <b>{items[0]}</b>. Here is what is new today.</p>
+        <ul class="items">
+            <li class="item">{items[0]}</li>
+            <li class="item">{items[1]}</li>
+            <li class="item">{items[2]}</li>
+        </ul>
+        <footer><a href="/about">About</a> <a href="/contact">Contact</a></footer>
+    </div>
+    """
+
+
+def main() -> None:
+    items = ["apples", "bananas", "cherries"]
+    attrs = {"id": "main", "data-user": "alice"}
+
+    def uncached() -> None:
+        html_cache_clear()
+        html(page("Fruit", items, attrs))
+
+    def cached() -> None:
+        html(page("Fruit", items, attrs))
+
+    compare("html() repeat render", uncached, cached)
+
+
+if __name__ == "__main__":
+    main()
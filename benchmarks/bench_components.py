@@ -0,0 +1,41 @@
+"""
+Benchmark a page whose navigation is a pure, fairly expensive component, with
+and without `memoize_component()`.
+"""
+
+from typing import Mapping, Sequence
+
+from pep.web import Element, html, memoize_component
+
+from .common import compare
+
+LINKS = [(f"/section/{i}", f"Section {i}") for i in range(40)]
+
+
+def Nav(
+    attributes: Mapping[str, str | None], children: Sequence[str | Element]
+) -> Element:
+    items = [
+        html(t'<li class="nav-item"><a href={href}>{label}</a></li>')
+        for href, label in LINKS
+    ]
+    return Element("nav", attributes, [Element("ul", {}, items), *children])
+
+
+CachedNav = memoize_component(maxsize=16)(Nav)
+
+
+def main() -> None:
+    title = "Welcome"
+    compare(
+        "page with a 40 link nav component",
+        lambda: html(t'<body><{Nav} id="nav">Menu</{Nav}><h1>{title}</h1></body>'),
+        lambda: html(
+            t'<body><{CachedNav} id="nav">Menu</{CachedNav}><h1>{title}</h1></body>'
+        ),
+    )
+    print(f"hit rate: {CachedNav.cache_info().hit_rate:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark rendering trees of increasing depth.
+
+"Before" is a recursive renderer, as `render_into()` was before it walked
+the tree with an explicit stack. It fails once the depth reaches the
+recursion limit.
+"""
+
+import sys
+from typing import Callable
+
+from pep.web import Element, _escape_text, _render_start_tag
+
+from .common import bench, compare
+
+
+def recursive_render_into(element: Element, write: Callable[[str], object]) -> None:
+    if element.tag:
+        write(_render_start_tag(element))
+        if not element.children:
+            return
+    for child in element.children:
+        if isinstance(child, Element):
+            recursive_render_into(child, write)
+        else:
+            write(_escape_text(child))
+    if element.tag:
+        write(f"</{element.tag}>")
+
+
+def recursive_str(element: Element) -> str:
+    chunks: list[str] = []
+    recursive_render_into(element, chunks.append)
+    return "".join(chunks)
+
+
+def make_tree(depth: int, breadth: int) -> Element:
+    element = Element("span", {"class": "leaf"}, ["leaf & co"])
+    for level in range(depth):
+        siblings = [Element("b", {}, [f"{level}"]) for _ in range(breadth - 1)]
+        element = Element("div", {"data-level": str(level)}, [element, *siblings])
+    return element
+
+
+def main() -> None:
+    print(f"recursion limit: {sys.getrecursionlimit()}")
+    for depth in (10, 100, 1_000, 10_000, 100_000):
+        tree = make_tree(depth, breadth=3)
+        try:
+            bench(f"depth {depth:,}, recursive", lambda: recursive_str(tree), repeat=3)
+        except RecursionError:
+            print(f"{f'depth {depth:,}, recursive':<48} {'RecursionError':>12}")
+        bench(f"depth {depth:,}, str()", lambda: str(tree), repeat=3)
+
+    # Shallow and wide, like most real pages
+    wide = Element("ul", {}, [make_tree(2, breadth=3) for _ in range(2_000)])
+    compare("shallow and wide", lambda: recursive_str(wide), lambda: str(wide))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark diffing large trees that differ in small ways, against rendering
+and sending the whole new tree.
+"""
+
+import json
+import timeit
+
+from pep.web import Element, ElementPool
+from pep.webdiff import diff
+
+ROWS = 10_000
+
+
+def row(key: int, label: str) -> Element:
+    return Element(
+        "tr",
+        {"data-key": str(key), "class": "row"},
+        [Element("td", {}, [str(key)]), Element("td", {"class": "label"}, [label])],
+    )
+
+
+def table(rows: list[Element]) -> Element:
+    return Element("table", {"class": "data"}, [Element("tbody", {}, rows)])
+
+
+def best(fn: object) -> float:
+    timer = timeit.Timer(fn)  # type: ignore[arg-type]
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def main() -> None:
+    rows = [row(i, f"Item {i}") for i in range(ROWS)]
+    old = table(rows)
+    changes = {
+        "one text change": rows[:500] + [row(500, "Changed")] + rows[501:],
+        "one insert": rows[:500] + [row(-1, "New")] + rows[500:],
+        "one removal": rows[:500] + rows[501:],
+        "one move": [rows[-1]] + rows[:-1],
+        "rebuilt, unchanged": [row(i, f"Item {i}") for i in range(ROWS)],
+    }
+    render = best(lambda: str(old))
+    size = len(str(old).encode())
+    print(f"{ROWS:,} rows: rendering the whole table takes {render * 1e3:.1f} ms")
+    print(f"and sends {size / 1024:.0f} KiB")
+    for label, new_rows in changes.items():
+        new = table(new_rows)
+        elapsed = best(lambda: diff(old, new))
+        patches = diff(old, new)
+        payload = json.dumps([patch.to_json() for patch in patches])
+        print(
+            f"{label:<20} {elapsed * 1e3:8.1f} ms {len(patches):4} patches"
+            f" {len(payload.encode()):6} bytes"
+        )
+
+    # Interned trees share their unchanged subtrees, which diff() skips
+    pool = ElementPool()
+    old = pool.intern(old)
+    new = pool.intern(table([row(i, f"Item {i}") for i in range(ROWS)]))
+    elapsed = best(lambda: diff(old, new))
+    print(f"{'rebuilt, interned':<20} {elapsed * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
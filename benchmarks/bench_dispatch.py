@@ -0,0 +1,71 @@
+"""
+Benchmark processing interpolation values in content and attributes.
+
+"Before" is the `isinstance` chain the processors used to walk, with numbers
+turned into strings by the caller, as they had to be. "After" passes values
+straight to the registry, where each type's processor is one dict lookup
+away.
+"""
+
+from string.templatelib import Template
+from typing import Iterable, Mapping, Sequence, cast
+
+from pep import web
+from pep.web import Element, Markup, html
+
+from .common import compare
+
+
+def chained_content(value: object) -> Sequence[str | Element]:
+    if isinstance(value, Element):
+        return (value,)
+    if isinstance(value, Template):
+        return (html(value),)
+    if hasattr(value, "__html__") and not isinstance(value, Markup):
+        return (Markup(value.__html__()),)
+    if isinstance(value, str):
+        return (value,)
+    if isinstance(value, Iterable) and not isinstance(value, Mapping):
+        children = cast(Sequence[str | Element], web._LazyChildren(value))
+        return (Element("", {}, children),)
+    raise web.HTMLParseError(f"Unsupported content interpolation: {type(value)}")
+
+
+def chained_attribute(value: object) -> str:
+    if hasattr(value, "__html__") and not isinstance(value, Markup):
+        return Markup(value.__html__())
+    if isinstance(value, str):
+        return value
+    raise web.HTMLParseError(f"Unsupported attribute interpolation: {type(value)}")
+
+
+VALUES: list[object] = [*range(300), *(i * 1.25 for i in range(300))]
+STRINGS = [str(value) for value in VALUES]
+ELEMENTS = [Element("b", {}, ["x"]) for _ in range(300)]
+
+
+def main() -> None:
+    compare(
+        "600 numbers in content",
+        lambda: [chained_content(str(value)) for value in VALUES],
+        lambda: list(map(web._process_content_interpolation, VALUES)),
+    )
+    compare(
+        "600 numbers in attributes",
+        lambda: [chained_attribute(str(value)) for value in VALUES],
+        lambda: list(map(web._process_attribute_interpolation, VALUES)),
+    )
+    compare(
+        "600 strings in content",
+        lambda: list(map(chained_content, STRINGS)),
+        lambda: list(map(web._process_content_interpolation, STRINGS)),
+    )
+    compare(
+        "300 elements in content",
+        lambda: list(map(chained_content, ELEMENTS)),
+        lambda: list(map(web._process_content_interpolation, ELEMENTS)),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark the memory used per Element node in a large cached page.
+
+"Before" is the original layout: a frozen dataclass without slots holding a
+dict of attributes and a list of children, with names that aren't interned.
+"""
+
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Mapping, Sequence
+
+from pep.web import Element
+
+ROWS = 20_000
+
+
+@dataclass(frozen=True)
+class OldElement:
+    tag: str
+    attributes: Mapping[str, str | None]
+    children: Sequence["str | OldElement"]
+
+
+def make_table(element: Callable[..., object]) -> object:
+    # Names are built at runtime, as they are when parsed from a template
+    tr, td, cls = "".join(["t", "r"]), "".join(["t", "d"]), "".join(["cla", "ss"])
+    rows = [
+        element(
+            tr,
+            {cls: "row", "data-id": str(i)},
+            [element(td, {cls: "id"}, [str(i)]), element(td, {}, [f"Item {i}"])],
+        )
+        for i in range(ROWS)
+    ]
+    return element("table", {cls: "data"}, rows)
+
+
+def bytes_per_node(label: str, element: Callable[..., object]) -> None:
+    tracemalloc.start()
+    table = make_table(element)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = ROWS * 3 + 1
+    print(f"{label:<24} {size / nodes:10.1f} bytes/node {size / 2**20:10.2f} MiB")
+    del table
+
+
+def main() -> None:
+    print(f"A {ROWS:,} row table ({ROWS * 3 + 1:,} elements, with their text)")
+    bytes_per_node("dict/list dataclass", OldElement)
+    bytes_per_node("compact Element", Element)
+
+
+if __name__ == "__main__":
+    main()
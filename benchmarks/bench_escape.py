@@ -0,0 +1,75 @@
+"""
+Benchmark the cost of escaping when rendering text-heavy pages.
+
+"Before" escapes every text child and attribute value unconditionally, as the
+renderer used to. "After" skips strings with nothing to escape, and passes
+trusted `Markup` (such as a fragment rendered earlier and cached) through
+untouched.
+"""
+
+from html import escape
+
+from pep import web
+from pep.web import Element, Markup
+
+from .common import compare
+
+WORDS = "the quick brown fox jumps over the lazy dog".split()
+
+
+def article(paragraphs: int, special: bool) -> Element:
+    suffix = " & <more>" if special else ""
+    return Element(
+        "article",
+        {"class": "post", "data-author": "alice"},
+        [
+            Element("p", {"title": f"paragraph {i}"}, [" ".join(WORDS * 8) + suffix])
+            for i in range(paragraphs)
+        ],
+    )
+
+
+def always_escape_text(text: str) -> str:
+    return escape(text, quote=False)
+
+
+def always_escape_attribute_value(value: str) -> str:
+    return escape(value, quote=True)
+
+
+def render_always_escaping(element: Element) -> str:
+    text, attribute = web._escape_text, web._escape_attribute_value
+    web._escape_text = always_escape_text
+    web._escape_attribute_value = always_escape_attribute_value
+    try:
+        return str(element)
+    finally:
+        web._escape_text, web._escape_attribute_value = text, attribute
+
+
+def main() -> None:
+    plain = article(500, special=False)
+    compare(
+        "500 paragraphs, nothing to escape",
+        lambda: render_always_escaping(plain),
+        lambda: str(plain),
+    )
+    special = article(500, special=True)
+    compare(
+        "500 paragraphs, all need escaping",
+        lambda: render_always_escaping(special),
+        lambda: str(special),
+    )
+
+    # A page that embeds a cached sidebar, rendered earlier
+    sidebar = article(200, special=True)
+    cached = str(sidebar)
+    compare(
+        "page with a cached sidebar",
+        lambda: str(Element("main", {}, [plain, sidebar])),
+        lambda: str(Element("main", {}, [plain, Markup(cached)])),
+    )
+
+
+if __name__ == "__main__":
+    main()
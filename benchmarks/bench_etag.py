@@ -0,0 +1,53 @@
+"""
+Benchmark serving a page with Content-Length and ETag headers.
+
+"Before" renders with `str()`, encodes, and hashes the body, each in a pass
+of its own. "After" uses `html_tagged()`, which hashes the UTF-8 chunks as
+they are rendered, and `html_conditional()`, which skips rendering when the
+client's ETag still matches the page's shape and values.
+"""
+
+import hashlib
+from string.templatelib import Template
+
+from pep.web import ETagStore, html, html_conditional, html_tagged
+
+from .common import compare
+
+
+def row(i: int) -> Template:
+    name = f"Item {i} & friends"
+    return t'<tr class="row"><td>{str(i)}</td><td><a href="/items">{name}</a></td></tr>'
+
+
+def page(rows: int) -> Template:
+    return t"""
+    <html>
+        <head><title>{"Items"}</title></head>
+        <body><table>{[row(i) for i in range(rows)]}</table></body>
+    </html>
+    """
+
+
+def separate_passes(template: Template) -> tuple[bytes, int, str]:
+    body = str(html(template)).encode()
+    return body, len(body), f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def main() -> None:
+    compare(
+        "body + length + ETag, 200 rows",
+        lambda: separate_passes(page(200)),
+        lambda: html_tagged(page(200)),
+    )
+    store = ETagStore()
+    etag = html_conditional(page(200), None, store).etag
+    compare(
+        "conditional request, ETag matches",
+        lambda: separate_passes(page(200))[2] == etag,
+        lambda: html_conditional(page(200), etag, store),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark pages whose sidebar rarely changes.
+
+"Before" builds the whole page, sidebar included, on every render. "After"
+wraps the sidebar in `Cached`, so it is built once and later renders reuse
+the built element (memory) or its stored HTML (disk).
+"""
+
+import tempfile
+from string.templatelib import Template
+
+from pep.web import Cached, DiskBackend, FragmentCache, html
+
+from .common import compare
+
+
+def sidebar() -> Template:
+    links = [
+        t'<li><a href="/categories/{str(i)}">{f"Category {i}"}</a></li>'
+        for i in range(100)
+    ]
+    return t'<aside class="sidebar"><ul>{links}</ul></aside>'
+
+
+def page(aside: object) -> Template:
+    return t"""
+    <html>
+        <head><title>{"Items"}</title></head>
+        <body><main><h1>{"Items & friends"}</h1></main>{aside}</body>
+    </html>
+    """
+
+
+def main() -> None:
+    memory = FragmentCache()
+    compare(
+        "page with a 100-link sidebar, memory",
+        lambda: str(html(page(sidebar()))),
+        lambda: str(html(page(Cached("sidebar", sidebar, cache=memory)))),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        disk = FragmentCache(DiskBackend(directory))
+        compare(
+            "page with a 100-link sidebar, disk",
+            lambda: str(html(page(sidebar()))),
+            lambda: str(html(page(Cached("sidebar", sidebar, cache=disk)))),
+        )
+    print(f"memory: {memory.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark the cost of instrumentation, and show the table `RenderStats`
+prints for a small page.
+
+With no hooks registered, rendering should cost the same as it did before
+hooks existed; with a `RenderStats` hook registered, each phase is timed and
+counted.
+"""
+
+from string.templatelib import Template
+from typing import Mapping, Sequence
+
+from pep.web import Element, RenderStats, html, html_bytes, render_hooks
+
+from .common import bench
+
+
+def Card(
+    attributes: Mapping[str, str | None], children: Sequence[str | Element]
+) -> Element:
+    return Element("div", {"class": "card", **attributes}, children)
+
+
+def row(i: int) -> Template:
+    name = f"Item {i} & friends"
+    return (
+        t'<li class="row"><{Card} id={str(i)}><a href="/items">{name}</a></{Card}></li>'
+    )
+
+
+def page() -> Template:
+    rows = [html(row(i)) for i in range(50)]
+    return t"""
+    <html>
+        <head><title>{"Items"}</title></head>
+        <body><ul class="items">{rows}</ul></body>
+    </html>
+    """
+
+
+def main() -> None:
+    bench("html() + str(), no hooks", lambda: str(html(page())))
+    bench("html_bytes(), no hooks", lambda: html_bytes(page()))
+    stats = RenderStats()
+    with render_hooks(stats):
+        bench("html() + str(), RenderStats", lambda: str(html(page())))
+        bench("html_bytes(), RenderStats", lambda: html_bytes(page()))
+    print()
+    stats.print_table()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark interning Element trees that repeat identical subtrees.
+
+Measures the traced memory of a large cached tree before and after
+`intern_element()`, and the time to compare two equal deep trees.
+"""
+
+import tracemalloc
+
+from pep.web import Element, ElementPool
+
+from .common import compare
+
+ROWS = 10_000
+
+
+def make_tree() -> Element:
+    # Build the names at runtime so that nothing is shared by accident
+    rows = [
+        Element(
+            "".join(["l", "i"]),
+            {"".join(["cla", "ss"]): "".join(["it", "em"])},
+            [Element("i", {"class": "icon icon-check"}, []), "".join(["Do", "ne"])],
+        )
+        for _ in range(ROWS)
+    ]
+    return Element("ul", {}, rows)
+
+
+def traced_size(make: object) -> tuple[object, int]:
+    tracemalloc.start()
+    result = make()  # type: ignore[operator]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main() -> None:
+    tree, plain = traced_size(make_tree)
+    pool = ElementPool()
+    interned, size = traced_size(lambda: pool.intern(make_tree()))
+    print(f"{ROWS:,} identical rows: {plain / 2**20:.2f} MiB plain", end=" ")
+    print(f"vs {size / 2**20:.2f} MiB interned ({len(pool)} distinct elements)")
+
+    other = make_tree()
+    again = pool.intern(other)
+    compare("== on two equal trees", lambda: tree == other, lambda: interned == again)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark peak memory when streaming a large generated table.
+
+"Before" builds every row Element up front and wraps them in a fragment;
+"after" interpolates a generator, whose rows are built one at a time as the
+table is rendered.
+"""
+
+import os
+from typing import Iterator
+
+from pep.web import Element, html
+
+from .common import measure
+
+ROWS = 100_000
+
+
+def row(i: int) -> Element:
+    return html(t'<tr class="row"><td>{str(i)}</td><td>Item {str(i)}</td></tr>')
+
+
+def eager_table() -> Element:
+    rows = Element.fragment([row(i) for i in range(ROWS)])
+    return html(t'<table class="data">{rows}</table>')
+
+
+def lazy_table() -> Element:
+    rows: Iterator[Element] = (row(i) for i in range(ROWS))
+    return html(t'<table class="data">{rows}</table>')
+
+
+def main() -> None:
+    print(f"Streaming a {ROWS:,} row table to /dev/null")
+    with open(os.devnull, "w") as devnull:
+        measure("list of Elements", lambda: eager_table().render_into(devnull.write))
+        measure("generator", lambda: lazy_table().render_into(devnull.write))
+
+
+if __name__ == "__main__":
+    main()
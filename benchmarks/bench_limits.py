@@ -0,0 +1,57 @@
+"""
+Benchmark the overhead of `render_limits()` when no limit is hit.
+
+"Before" builds and renders a page with no limits in effect; "after" does
+the same inside a `render_limits()` block with generous limits, so every
+element and chunk is counted and checked.
+"""
+
+from string.templatelib import Template
+
+from pep.web import Element, html, html_bytes, render_limits
+
+from .common import compare
+
+
+def row(i: int) -> Template:
+    name = f"Item {i} & friends"
+    return t'<tr class="row"><td>{str(i)}</td><td><a href="/items">{name}</a></td></tr>'
+
+
+def page(rows: int) -> Template:
+    return t"""
+    <html>
+        <head><title>{"Items"}</title></head>
+        <body><table>{[row(i) for i in range(rows)]}</table></body>
+    </html>
+    """
+
+
+def limited(fn: object) -> object:
+    with render_limits(
+        max_nodes=1_000_000, max_depth=1_000, max_bytes=100_000_000, max_seconds=60
+    ):
+        return fn()  # type: ignore
+
+
+def main() -> None:
+    compare(
+        "html() + str(), 200 rows",
+        lambda: str(html(page(200))),
+        lambda: limited(lambda: str(html(page(200)))),
+    )
+    element: Element = html(page(200))
+    compare(
+        "str() of a built page, 200 rows",
+        lambda: element._render_str(),
+        lambda: limited(element._render_str),
+    )
+    compare(
+        "html_bytes(), 200 rows",
+        lambda: html_bytes(page(200)),
+        lambda: limited(lambda: html_bytes(page(200))),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark building deeply nested component trees with `html()`.
+
+The "before" numbers restore the old behavior of rendering each nested
+`Element` or `Template` to a string and feeding it back through the parser.
+"""
+
+import time
+from string.templatelib import Template
+from typing import Mapping, Sequence
+
+from pep import web
+from pep.web import Element, html
+
+from .stdlib_parser import ElementBuilder, StdlibTemplateParser
+
+DEPTHS = [10, 50, 100, 200]
+
+
+def reparse_content_interpolation(value: object) -> Sequence[str | Element]:
+    if isinstance(value, Template):
+        value = html(value)
+    if isinstance(value, Element):
+        parser = StdlibTemplateParser()
+        parser.stack.append(ElementBuilder("", {}))
+        parser.feed(str(value))
+        parser.close()
+        return parser.stack[0].children
+    return (value,)
+
+
+def Box(attributes: Mapping[str, str | None], children: Sequence[str | Element]):
+    return Element("section", {"class": "box", **attributes}, children)
+
+
+def build(depth: int) -> Element:
+    inner = html(t"<span>leaf</span>")
+    for level in range(depth):
+        name = f"level-{level}"
+        inner = html(t"<{Box} id={name}><h2>{name}</h2>{inner}</{Box}>")
+    return inner
+
+
+def timed(depth: int) -> float:
+    start = time.perf_counter()
+    build(depth)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    after = {depth: timed(depth) for depth in DEPTHS}
+    original = web._process_content_interpolation
+    web._process_content_interpolation = reparse_content_interpolation
+    try:
+        before = {depth: timed(depth) for depth in DEPTHS}
+    finally:
+        web._process_content_interpolation = original
+
+    print(f"{'depth':>8} {'before (ms)':>14} {'after (ms)':>14}")
+    for depth in DEPTHS:
+        print(f"{depth:>8} {before[depth] * 1e3:14.2f} {after[depth] * 1e3:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
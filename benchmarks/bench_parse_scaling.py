@@ -0,0 +1,65 @@
+"""
+Benchmark how parsing scales with the number of children of one element.
+
+The "append" parser is the standard library based parser as it was before it
+collected children in builders: it appends each child with `Element.append()`,
+which copies all of the element's existing children every time. It is only
+run for the smaller sizes because it is quadratic.
+"""
+
+import time
+
+from pep.web import Element, HTMLTemplateParser
+
+from .stdlib_parser import StdlibTemplateParser
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+BEFORE_LIMIT = 10_000
+
+
+class AppendingParser(StdlibTemplateParser):
+    """The parser as it was before it collected children in builders."""
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_data()
+        self.stack.append(Element(tag, dict(attrs), []))
+
+    def handle_endtag(self, tag):
+        self.flush_data()
+        element = self.stack.pop()
+        if not self.stack:
+            self.root = element
+        else:
+            self.stack[-1] = self.stack[-1].append(element)
+
+    def flush_data(self):
+        data = "".join(self.data).strip()
+        self.data.clear()
+        if data:
+            self.stack[-1] = self.stack[-1].append(data)
+
+
+def parse(parser: HTMLTemplateParser | StdlibTemplateParser, markup: str) -> float:
+    start = time.perf_counter()
+    parser.feed(markup)
+    parser.close()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(
+        f"{'children':>10} {'append (ms)':>14} {'stdlib (ms)':>14} {'current (ms)':>14}"
+    )
+    for size in SIZES:
+        markup = "<table>" + "<tr><td>cell</td></tr>" * size + "</table>"
+        if size <= BEFORE_LIMIT:
+            before = f"{parse(AppendingParser(), markup) * 1e3:14.2f}"
+        else:
+            before = f"{'(skipped)':>14}"
+        stdlib = parse(StdlibTemplateParser(), markup)
+        current = parse(HTMLTemplateParser(), markup)
+        print(f"{size:>10} {before} {stdlib * 1e3:14.2f} {current * 1e3:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark finding elements in a large document.
+
+"Before" walks the whole tree with hand-written recursion for each lookup,
+as post-processing steps used to. "After" uses the query methods on
+`Element`, which build an index of the tree on first use and answer later
+lookups from it.
+"""
+
+import time
+from typing import Callable, Iterator
+
+from pep.web import Element, ElementIndex
+
+from .common import compare
+
+
+def document(rows: int) -> Element:
+    def row(i: int) -> Element:
+        link = Element("a", {"href": f"/items/{i}", "class": "item-link"}, [f"#{i}"])
+        cells = [Element("td", {"class": "cell"}, [link]), Element("td", {}, [str(i)])]
+        return Element("tr", {"id": f"row-{i}", "class": "row"}, cells)
+
+    form = Element(
+        "form",
+        {"method": "post"},
+        [Element("input", {"type": "text", "name": "q"}, [])],
+    )
+    table = Element("table", {"class": "data"}, [row(i) for i in range(rows)])
+    body = Element("body", {}, [Element("main", {"id": "main"}, [table, form])])
+    head = Element("head", {}, [Element("script", {"src": "/app.js"}, [])])
+    return Element("html", {}, [head, body])
+
+
+def walk(element: Element) -> Iterator[Element]:
+    yield element
+    for child in element.children:
+        if isinstance(child, Element):
+            yield from walk(child)
+
+
+def naive_by_id(root: Element, value: str) -> Element | None:
+    return next((e for e in walk(root) if e.attributes.get("id") == value), None)
+
+
+def naive_by_class(root: Element, name: str) -> list[Element]:
+    return [e for e in walk(root) if name in (e.attributes.get("class") or "").split()]
+
+
+def naive_form_inputs(root: Element) -> list[Element]:
+    return [
+        e
+        for form in walk(root)
+        if form.tag == "form"
+        for e in walk(form)
+        if e.tag == "input"
+    ]
+
+
+def timed(label: str, fn: Callable[[], object]) -> None:
+    start = time.perf_counter()
+    fn()
+    print(f"{label:<48} {(time.perf_counter() - start) * 1e3:12.2f} ms")
+
+
+def main() -> None:
+    root = document(5_000)
+    # Building the index is a one-off walk, paid by the first query
+    timed("index 5,000 rows (first query)", lambda: ElementIndex.of(root))
+    compare(
+        "find by id",
+        lambda: naive_by_id(root, "row-4000"),
+        lambda: root.find_by_id("row-4000"),
+    )
+    compare(
+        "find all by class",
+        lambda: naive_by_class(root, "item-link"),
+        lambda: root.find_all_by_class("item-link"),
+    )
+    compare(
+        "form inputs (select 'form input')",
+        lambda: naive_form_inputs(root),
+        lambda: root.select("form input"),
+    )
+    compare(
+        "100 id lookups",
+        lambda: [naive_by_id(root, f"row-{i * 50}") for i in range(100)],
+        lambda: [root.find_by_id(f"row-{i * 50}") for i in range(100)],
+        repeat=3,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Benchmark rendering a batch of pages with `render_many()` and a varying
+number of worker processes.
+
+Each page is CPU-bound: a table of rows built with `html()`. Ideally the
+throughput grows close to linearly with the number of cores.
+"""
+
+import os
+from string.templatelib import Template
+
+from pep.web import PageJob, html, render_many
+
+PAGES = 2_000
+
+
+def product_page(number: int) -> Template:
+    rows = [
+        html(t'<tr class="row"><td>{str(i)}</td><td>Item {str(number + i)}</td></tr>')
+        for i in range(100)
+    ]
+    title = f"Page {number}"
+    return t"<html><body><h1>{title}</h1><table>{rows}</table></body></html>"
+
+
+def main() -> None:
+    jobs = [PageJob(product_page, (number,)) for number in range(PAGES)]
+    cpus = os.cpu_count() or 1
+    print(f"{PAGES:,} pages, {cpus} CPUs")
+    baseline = None
+    for processes in sorted({1, 2, 4, cpus}):
+        report = render_many(jobs, processes=processes)
+        baseline = baseline or report.pages_per_second
+        print(
+            f"{processes:>3} processes {report.pages_per_second:10.0f} pages/s"
+            f" {report.bytes_per_second / 2**20:8.1f} MiB/s"
+            f" {report.pages_per_second / baseline:6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
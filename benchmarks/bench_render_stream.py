@@ -0,0 +1,59 @@
+"""
+Benchmark peak memory and time when rendering a large, nested page.
+
+The "before" renderer is the old recursive `__str__`, which built the full
+string of every subtree at every level of nesting.
+"""
+
+import os
+from html import escape
+
+from pep.web import Element, _render_attributes_mapping
+
+from .common import measure
+
+
+def old_str(element: Element) -> str:
+    children = "".join(
+        old_str(child) if isinstance(child, Element) else escape(child, quote=False)
+        for child in element.children
+    )
+    if not element.tag:
+        return children
+    attributes = _render_attributes_mapping(element.attributes)
+    start = f"<{element.tag} {attributes}" if attributes else f"<{element.tag}"
+    if not element.children:
+        return f"{start} />"
+    return f"{start}>{children}</{element.tag}>"
+
+
+def make_page(depth: int, breadth: int, rows: int) -> Element:
+    if depth == 0:
+        return Element(
+            "table",
+            {"class": "data"},
+            [
+                Element("tr", {}, [Element("td", {}, [f"row {i} & <cell>"])])
+                for i in range(rows)
+            ],
+        )
+    return Element(
+        "section",
+        {"data-depth": str(depth)},
+        [make_page(depth - 1, breadth, rows) for _ in range(breadth)],
+    )
+
+
+def main() -> None:
+    page = make_page(depth=4, breadth=4, rows=200)
+    size = len(str(page))
+    print(f"Rendered page size: {size / 2**20:.2f} MiB")
+    measure("old recursive str()", lambda: old_str(page))
+    measure("str()", lambda: str(page))
+    measure('"".join(iter_chunks())', lambda: "".join(page.iter_chunks()))
+    with open(os.devnull, "w") as devnull:
+        measure("render_into(devnull.write)", lambda: page.render_into(devnull.write))
+
+
+if __name__ == "__main__":
+    main()
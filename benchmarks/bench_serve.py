@@ -0,0 +1,117 @@
+"""
+Benchmark serving pages over ASGI and WSGI, in-process.
+
+"Before" is the hand-rolled response every service used to write: render
+with `str(html(...)).encode()` and send the body in one go. "After" uses
+`ASGIResponse` / `WSGIResponse`, which stream the page as it renders. Both
+are called through the in-process test clients, which record latency (time
+to first chunk) and throughput.
+"""
+
+import asyncio
+import time
+from string.templatelib import Template
+from typing import Callable
+
+from pep.web import html
+from pep.webserve import (
+    ASGIResponse,
+    ASGITestClient,
+    ClientResponse,
+    WSGIResponse,
+    WSGITestClient,
+)
+
+from .common import compare
+
+
+def row(i: int) -> Template:
+    name = f"Item {i} & friends"
+    return t'<tr class="row"><td>{str(i)}</td><td><a href="/items">{name}</a></td></tr>'
+
+
+def page(rows: int) -> Template:
+    return t"""
+    <html>
+        <head><title>{"Items"}</title></head>
+        <body><table>{(row(i) for i in range(rows))}</table></body>
+    </html>
+    """
+
+
+async def slow_rows(delay: float) -> Template:
+    await asyncio.sleep(delay)
+    return page(200)
+
+
+def slow_page(delay: float) -> Template:
+    rows = slow_rows(delay)
+    return t"<html><body><h1>{'Items'}</h1>{rows}</body></html>"
+
+
+def hand_rolled_asgi(rows: int) -> Callable:
+    async def app(scope: dict, receive: Callable, send: Callable) -> None:
+        body = str(html(page(rows))).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/html; charset=utf-8")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def hand_rolled_wsgi(rows: int) -> Callable:
+    def app(environ: dict, start_response: Callable) -> list[bytes]:
+        body = str(html(page(rows))).encode()
+        start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+        return [body]
+
+    return app
+
+
+def report(label: str, responses: list[ClientResponse], seconds: float) -> None:
+    first = sum(r.first_chunk for r in responses) / len(responses)
+    size = sum(len(r.body) for r in responses)
+    print(
+        f"{label:<40} first chunk {first * 1e3:7.2f} ms, "
+        f"{len(responses) / seconds:7.1f} req/s, {size / seconds / 2**20:6.1f} MiB/s"
+    )
+
+
+def load(label: str, get: Callable[[], ClientResponse], requests: int = 50) -> None:
+    start = time.perf_counter()
+    responses = [get() for _ in range(requests)]
+    report(label, responses, time.perf_counter() - start)
+
+
+def main() -> None:
+    rows = 2_000
+    compare(
+        f"ASGI, {rows:,} rows",
+        lambda: ASGITestClient(hand_rolled_asgi(rows)).get(),
+        lambda: ASGITestClient(ASGIResponse(page(rows))).get(),
+    )
+    compare(
+        f"WSGI, {rows:,} rows",
+        lambda: WSGITestClient(hand_rolled_wsgi(rows)).get(),
+        lambda: WSGITestClient(WSGIResponse(page(rows))).get(),
+    )
+    print()
+    load("ASGI, hand-rolled", lambda: ASGITestClient(hand_rolled_asgi(rows)).get())
+    load("ASGIResponse", lambda: ASGITestClient(ASGIResponse(page(rows))).get())
+    load("WSGI, hand-rolled", lambda: WSGITestClient(hand_rolled_wsgi(rows)).get())
+    load("WSGIResponse", lambda: WSGITestClient(WSGIResponse(page(rows))).get())
+    # A page waiting 50 ms on a backend: the heading goes out straight away
+    load(
+        "ASGIResponse, 50 ms backend",
+        lambda: ASGITestClient(ASGIResponse(slow_page(0.05))).get(),
+        requests=10,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark static subtree hoisting on pages with a varying share of static
+markup.
+
+Each page has 40 sections; some are static and the rest have a dynamic
+heading. "Before" rebuilds and re-renders every section on every call, as
+`html()` did before static subtrees were built and rendered once per
+template shape.
+"""
+
+from string.templatelib import Interpolation, Template
+
+from pep.web import _build_element, _compile, _CompiledElement, html
+
+from .common import compare
+
+SECTIONS = 40
+
+STATIC = (
+    '<section class="card"><h2>About us</h2><p class="lead">We sell '
+    "<b>shrubberies</b> &amp; garden tools.</p><ul><li>Open daily</li>"
+    "<li>Free delivery</li></ul></section>"
+)
+
+
+def make_page(static_share: float) -> Template:
+    static_sections = round(SECTIONS * static_share)
+    args: list[str | Interpolation] = ['<main class="page">']
+    for i in range(SECTIONS):
+        if i < static_sections:
+            args.append(STATIC)
+        else:
+            args.append('<section class="card"><h2>')
+            args.append(Interpolation(f"Heading {i}", "heading"))
+            args.append('</h2><p class="lead">Details</p></section>')
+    args.append("</main>")
+    return Template(*args)
+
+
+def without_static(compiled: _CompiledElement) -> _CompiledElement:
+    children = tuple(
+        without_static(child) if isinstance(child, _CompiledElement) else child
+        for child in compiled.children
+    )
+    return _CompiledElement(compiled.tag, compiled.attributes, children)
+
+
+def main() -> None:
+    for share in (0.0, 0.5, 0.9, 1.0):
+        template = make_page(share)
+        root = without_static(_compile(template.strings).root)
+        interpolations = template.interpolations
+        compare(
+            f"{share:.0%} static sections",
+            lambda: str(_build_element(root, interpolations)),
+            lambda: str(html(template)),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure time-to-first-chunk for a page whose body waits on slow backends.
+
+"Before" awaits the whole page with `async_html()` and renders it, so the
+first byte goes out only when the slowest fragment is ready. "After" streams
+it with `stream_html()`, which sends the head and static shell straight away.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from string.templatelib import Template
+from typing import AsyncIterator
+
+from pep.web import FLUSH, async_html, stream_html
+
+DELAYS = [0.05, 0.02, 0.08, 0.03, 0.04]
+
+
+@dataclass(frozen=True)
+class Timing:
+    """When a response's first and last chunks arrived, in seconds."""
+
+    first_chunk: float
+    total: float
+    chunks: int
+
+
+async def timed(chunks: AsyncIterator[str]) -> Timing:
+    """Consume a stream of chunks, timing when they arrive."""
+    start = time.perf_counter()
+    first, count = None, 0
+    async for _ in chunks:
+        count += 1
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return Timing(first if first is not None else total, total, count)
+
+
+def by_total(timing: Timing) -> float:
+    return timing.total
+
+
+async def fetch(name: str, delay: float) -> Template:
+    await asyncio.sleep(delay)
+    return t'<section class="fragment"><h2>{name}</h2></section>'
+
+
+def page() -> Template:
+    a, b, c, d, e = (fetch(f"f{i}", delay) for i, delay in enumerate(DELAYS))
+    return t"""
+    <html lang="en">
+        <head>
+            <title>Dashboard</title>
+            <link rel="stylesheet" href="/static/site.css" />
+            <script src="/static/site.js" defer></script>
+        </head>
+        {FLUSH}
+        <body>
+            <nav class="top"><a href="/">Home</a><a href="/reports">Reports</a></nav>
+            <main><header>{a}</header><div class="body">{b}{c}{d}</div>{e}</main>
+        </body>
+    </html>
+    """
+
+
+async def whole_page() -> AsyncIterator[str]:
+    yield str(await async_html(page()))
+
+
+async def run() -> None:
+    before = min([await timed(whole_page()) for _ in range(5)], key=by_total)
+    after = min([await timed(stream_html(page())) for _ in range(5)], key=by_total)
+    print(f"slowest fragment {max(DELAYS) * 1e3:.0f} ms")
+    for label, timing in (("async_html()", before), ("stream_html()", after)):
+        print(
+            f"{label:<24} first chunk {timing.first_chunk * 1e3:8.2f} ms"
+            f"  last {timing.total * 1e3:8.2f} ms  ({timing.chunks} chunks)"
+        )
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
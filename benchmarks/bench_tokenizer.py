@@ -0,0 +1,74 @@
+"""
+Benchmark compiling large templates with the purpose-built parser in
+`pep.web` against the original parser built on `html.parser.HTMLParser`.
+
+Compilation is what happens the first time `html()` sees a template shape.
+"""
+
+from string.templatelib import Template
+
+from pep.web import _compile
+
+from .common import compare
+from .stdlib_parser import compile_strings
+
+
+def product_page(products: list[dict[str, str]], user: str, nav: dict) -> Template:
+    return t"""
+    <html lang="en">
+        <!-- The product listing page -->
+        <head>
+            <title>Products for {user}</title>
+            <style>.price {{ color: green; }} .sale > b {{ color: red; }}</style>
+        </head>
+        <body class="listing" {nav}>
+            <header id="top">
+                <nav><a href="/">Home</a> &middot; <a href="/cart">Cart</a></nav>
+                <p class="welcome">Welcome back, <b>{user}</b>!</p>
+            </header>
+            <main>
+                <article class="product" data-sku={products[0]["sku"]}>
+                    <h2>{products[0]["name"]}</h2>
+                    <img src={products[0]["image"]} alt="{products[0]["name"]} photo" />
+                    <p class="price">{products[0]["price"]}</p>
+                    <button type="button" disabled>Add to cart</button>
+                </article>
+                <article class="product" data-sku={products[1]["sku"]}>
+                    <h2>{products[1]["name"]}</h2>
+                    <img src={products[1]["image"]} alt="{products[1]["name"]} photo" />
+                    <p class="price sale"><b>{products[1]["price"]}</b></p>
+                    <button type="button">Add to cart</button>
+                </article>
+            </main>
+            <footer><p>&copy; Example Shop. All rights reserved.</p></footer>
+        </body>
+    </html>
+    """
+
+
+def generated_table(rows: int) -> Template:
+    body = "".join(
+        f'<tr class="row-{i % 2}"><td>{i}</td><td>Item {i}</td><td>&euro;{i}.00</td></tr>'
+        for i in range(rows)
+    )
+    return Template(f'<table class="data"><tbody>{body}</tbody></table>')
+
+
+def main() -> None:
+    product = {"sku": "A1", "name": "Shrubbery", "image": "s.jpg", "price": "$9"}
+    page = product_page([product, product], "alice", {"data-theme": "dark"})
+    compare(
+        "compile product page",
+        lambda: compile_strings(page.strings),
+        lambda: _compile.__wrapped__(page.strings),
+    )
+    table = generated_table(2_000)
+    compare(
+        "compile 2,000 row table",
+        lambda: compile_strings(table.strings),
+        lambda: _compile.__wrapped__(table.strings),
+    )
+
+
+if __name__ == "__main__":
+    main()
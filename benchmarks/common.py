@@ -0,0 +1,40 @@
+"""Small helpers shared by the benchmarks."""
+
+import time
+import timeit
+import tracemalloc
+from typing import Callable
+
+
+def bench(label: str, fn: Callable[[], object], repeat: int = 5) -> float:
+    """Time `fn`, print the best time per call, and return it in seconds."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    print(f"{label:<48} {best * 1e6:12.2f} us/call")
+    return best
+
+
+def compare(
+    label: str,
+    baseline: Callable[[], object],
+    candidate: Callable[[], object],
+    repeat: int = 5,
+) -> float:
+    """Time two ways of doing the same thing and print the speedup."""
+    before = bench(f"{label} (before)", baseline, repeat)
+    after = bench(f"{label} (after)", candidate, repeat)
+    speedup = before / after
+    print(f"{'':<48} {speedup:12.2f}x faster")
+    return speedup
+
+
+def measure(label: str, fn: Callable[[], object]) -> None:
+    """Call `fn` once and print its time and peak traced memory."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<48} {elapsed * 1e3:10.1f} ms {peak / 2**20:10.2f} MiB peak")
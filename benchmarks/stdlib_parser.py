@@ -0,0 +1,138 @@
+"""
+The `html()` template compiler as it was when it was built on the standard
+library's `html.parser.HTMLParser`, kept as a baseline for benchmarks.
+
+Interpolations are fed to the parser as placeholder "slots", and the parsed
+`Element` tree is then converted to the same compiled form that `pep.web`
+uses today.
+"""
+
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+
+from pep.web import (
+    Element,
+    HTMLParseError,
+    _CompiledAttribute,
+    _CompiledElement,
+    _CompiledSpread,
+    _CompiledTemplate,
+    _CompiledText,
+    _Parts,
+)
+
+_SLOT_START = "\ue000"
+_SLOT_END = "\ue001"
+_SLOT_RE = re.compile(f"x{_SLOT_START}(\\d+){_SLOT_END}")
+
+
+def make_slot(index: int) -> str:
+    return f"x{_SLOT_START}{index}{_SLOT_END}"
+
+
+def split_slots(text: str) -> str | _Parts:
+    pieces = _SLOT_RE.split(text)
+    if len(pieces) == 1:
+        return text
+    return tuple(
+        int(piece) if i % 2 else piece for i, piece in enumerate(pieces) if piece
+    )
+
+
+@dataclass
+class ElementBuilder:
+    tag: str
+    attributes: dict[str, str | None]
+    children: list[str | Element] = field(default_factory=list)
+
+    def build(self) -> Element:
+        return Element(self.tag, self.attributes, self.children)
+
+
+class StdlibTemplateParser(HTMLParser):
+    root: Element | None
+    stack: list[ElementBuilder]
+    data: list[str]
+    dynamic_end_tags: list[tuple[str, str]]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.stack = []
+        self.root = None
+        self.data = []
+        self.dynamic_end_tags = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self.flush_data()
+        if self.root is not None:
+            raise HTMLParseError(f"Multiple root elements ({self.root.tag} and {tag})")
+        self.stack.append(ElementBuilder(tag, dict(attrs)))
+
+    def handle_endtag(self, tag: str) -> None:
+        self.flush_data()
+        builder = self.stack.pop()
+        if builder.tag != tag:
+            if _SLOT_START not in builder.tag + tag:
+                raise HTMLParseError(f"Unexpected end tag: {tag}")
+            self.dynamic_end_tags.append((builder.tag, tag))
+        element = builder.build()
+        if not self.stack:
+            self.root = element
+        else:
+            self.stack[-1].children.append(element)
+
+    def handle_data(self, data: str) -> None:
+        self.data.append(data)
+
+    def flush_data(self) -> None:
+        data = "".join(self.data).strip()
+        self.data.clear()
+        if not data:
+            return
+        if not self.stack:
+            raise HTMLParseError(f"Data outside of root element: {data}")
+        self.stack[-1].children.append(data)
+
+    def close(self) -> None:
+        super().close()
+        self.flush_data()
+
+
+def compile_element(element: Element) -> _CompiledElement:
+    attributes: list[_CompiledAttribute | _CompiledSpread] = []
+    for key, value in element.attributes.items():
+        name = split_slots(key)
+        if value is None and isinstance(name, tuple) and len(name) == 1:
+            if isinstance(name[0], int):
+                attributes.append(_CompiledSpread(name[0]))
+                continue
+        attributes.append(
+            _CompiledAttribute(name, None if value is None else split_slots(value))
+        )
+    children: list[str | _CompiledText | _CompiledElement] = []
+    for child in element.children:
+        if isinstance(child, Element):
+            children.append(compile_element(child))
+        else:
+            text = split_slots(child)
+            children.append(_CompiledText(text) if isinstance(text, tuple) else text)
+    return _CompiledElement(
+        split_slots(element.tag), tuple(attributes), tuple(children)
+    )
+
+
+def compile_strings(strings: tuple[str, ...]) -> _CompiledTemplate:
+    """Compile a template's strings with the standard library's parser."""
+    parser = StdlibTemplateParser()
+    for index, s in enumerate(strings):
+        parser.feed(s)
+        if index < len(strings) - 1:
+            parser.feed(make_slot(index))
+    parser.close()
+    if not parser.root:
+        raise HTMLParseError("No root element")
+    dynamic_end_tags = tuple(
+        (split_slots(start), split_slots(end)) for start, end in parser.dynamic_end_tags
+    )
+    return _CompiledTemplate(compile_element(parser.root), dynamic_end_tags)
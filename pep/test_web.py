@@ -1,9 +1,63 @@
-from string.templatelib import Template
+import asyncio
+import gc
+import gzip
+import io
+import sys
+import time
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from string.templatelib import Interpolation, Template
 from typing import Mapping, Sequence
 
 import pytest
 
-from .web import Element, HTMLParseError, html
+from .web import (
+    FLUSH,
+    Cached,
+    CompressingWriter,
+    DiskBackend,
+    Element,
+    ElementPool,
+    ETagStore,
+    FragmentCache,
+    HTMLParseError,
+    HTMLTemplateParser,
+    InterpolationProcessors,
+    Markup,
+    MemoizedComponent,
+    MemoryBackend,
+    NotModified,
+    PageJob,
+    RenderEvent,
+    RenderLimitExceeded,
+    RenderStats,
+    TaggedHTML,
+    _CompiledAttribute,
+    _CompiledSpread,
+    add_render_hook,
+    async_html,
+    attribute_processors,
+    content_processors,
+    html,
+    html_bytes,
+    html_cache_clear,
+    html_cache_info,
+    html_chunks,
+    html_conditional,
+    html_tagged,
+    intern_element,
+    iter_compressed,
+    memoize_component,
+    remove_render_hook,
+    render_hooks,
+    render_limits,
+    render_many,
+    stream_html,
+)
 
 # ---------------------------------------------------------------------------
 # Tests for the Element class (mostly, its __str__ method)
@@ -83,6 +137,137 @@ def test_element_child_str_escape():
     assert str(element) == '<div>&lt;script&gt;alert("evil")&lt;/script&gt;</div>'
 
 
+def test_element_markup_child_not_escaped():
+    element = Element("div", {}, [Markup("<b>bold</b>"), "<i>"])
+    assert str(element) == "<div><b>bold</b>&lt;i&gt;</div>"
+
+
+def test_element_markup_attribute_not_escaped():
+    element = Element("a", {"title": Markup("Fish &amp; chips")}, [])
+    assert str(element) == '<a title="Fish &amp; chips" />'
+
+
+def test_element_escapes_quotes_in_attributes():
+    element = Element("a", {"title": 'it\'s "quoted"'}, [])
+    assert str(element) == '<a title="it&#x27;s &quot;quoted&quot;" />'
+
+
+def test_element_compact_layout():
+    element = Element("div", {"id": "x", "class": "y"}, ["text"])
+    assert not hasattr(element, "__dict__")
+    assert element.children == ("text",)
+    assert element.attributes == {"class": "y", "id": "x"}
+    assert element.attributes["id"] == "x"
+    assert list(element.attributes) == ["id", "class"]
+    assert dict(**element.attributes) == {"id": "x", "class": "y"}
+    with pytest.raises(KeyError):
+        element.attributes["missing"]
+
+
+def test_element_interns_names():
+    tag = "".join(["sec", "tion"])
+    name = "".join(["data-", "x"])
+    element = Element(tag, {name: "1"}, [])
+    assert element.tag is sys.intern("section")
+    assert next(iter(element.attributes)) is sys.intern("data-x")
+
+
+def test_element_equality_ignores_container_types():
+    assert Element("p", {"a": "1"}, ["x"]) == Element("p", {"a": "1"}, ("x",))
+    first = Element("p", {"a": "1", "b": None}, [])
+    assert first == Element("p", {"b": None, "a": "1"}, [])
+    assert Element("p", {}, ["x"]) != Element("p", {}, ["y"])
+
+
+def test_element_hash():
+    first = Element("p", {"a": "1", "b": "2"}, [Element("br", {}, [])])
+    second = Element("p", {"b": "2", "a": "1"}, (Element("br", {}, ()),))
+    assert first == second
+    assert hash(first) == hash(second)
+    assert len({first, second, Element("p", {}, [])}) == 2
+
+
+def test_element_pool_shares_subtrees():
+    pool = ElementPool()
+    tree = Element(
+        "ul",
+        {},
+        [Element("li", {}, [Element("i", {"class": "icon"}, []), "x"]) for _ in "abc"],
+    )
+    interned = pool.intern(tree)
+    assert interned == tree
+    first, second, third = interned.children
+    assert first is second is third
+    assert pool.intern(Element("i", {"class": "icon"}, [])) is first.children[0]
+    assert pool.intern(tree) is interned
+
+
+def test_element_pool_deep_tree():
+    pool = ElementPool()
+    deep = Element("span", {}, ["leaf"])
+    for _ in range(5_000):
+        deep = Element("span", {}, [deep])
+    interned = pool.intern(deep)
+    assert str(interned) == str(deep)
+    assert pool.intern(deep) is interned
+    assert len(pool) == 5_001
+
+
+def test_element_pool_keeps_markup_apart():
+    pool = ElementPool()
+    plain = pool.intern(Element("p", {}, ["<b>"]))
+    trusted = pool.intern(Element("p", {}, [Markup("<b>")]))
+    assert plain is not trusted
+    assert str(trusted) == "<p><b></p>"
+
+
+def test_element_pool_is_weak():
+    pool = ElementPool()
+    element = pool.intern(Element("div", {}, [Element("span", {}, ["x"])]))
+    assert len(pool) == 2
+    del element
+    gc.collect()
+    assert len(pool) == 0
+
+
+def test_intern_element():
+    first = intern_element(html(t"<p>{'same'}</p>"))
+    assert intern_element(html(t"<p>{'same'}</p>")) is first
+
+
+def test_element_iter_chunks():
+    element = Element("ul", {"id": "items"}, [Element("li", {}, ["<One>"])])
+    chunks = list(element.iter_chunks())
+    assert chunks == ['<ul id="items">', "<li>", "&lt;One&gt;", "</li>", "</ul>"]
+    assert "".join(chunks) == str(element)
+
+
+def test_element_render_into_list():
+    element = Element("div", {}, [Element("br", {}, []), "text"])
+    parts: list[str] = []
+    element.render_into(parts.append)
+    assert parts == ["<div>", "<br />", "text", "</div>"]
+
+
+def test_element_render_into_file():
+    element = Element.fragment([Element("p", {}, ["hello"]), "world"])
+    stream = io.StringIO()
+    element.render_into(stream.write)
+    assert stream.getvalue() == "<p>hello</p>world"
+
+
+def test_element_bytes():
+    element = Element("p", {"title": "café"}, ["<€>", Element("br", {}, [])])
+    assert bytes(element) == str(element).encode()
+
+
+def test_element_render_bytes_into():
+    element = Element("div", {}, [Element("br", {}, []), "text"])
+    parts: list[bytes] = []
+    element.render_bytes_into(parts.append)
+    assert parts == [b"<div>", b"<br />", b"text", b"</div>"]
+
+
 # ---------------------------------------------------------------------------
 # Tests for the html() template processing function
 # ---------------------------------------------------------------------------
@@ -145,6 +330,29 @@ def test_html_nested_template_text():
     expected = Element("p", {}, [Element("script", {}, ["alert('good')"])])
 
 
+def test_html_nested_element_is_spliced():
+    item = Element("li", {}, ["  One  "])
+    template: Template = t"<ul>{item}</ul>"
+    element = html(template)
+    assert element.children[0] is item
+
+
+def test_html_nested_fragment():
+    items = Element.fragment([Element("li", {}, ["One"]), Element("li", {}, ["Two"])])
+    template: Template = t"<ul>{items}</ul>"
+    element = html(template)
+    assert str(element) == "<ul><li>One</li><li>Two</li></ul>"
+
+
+def test_html_nested_text_and_elements():
+    name = "Alice"
+    bold = html(t"<b>{name}</b>")
+    template: Template = t"<p>Hello, {bold} and welcome!</p>"
+    element = html(template)
+    expected = Element("p", {}, ["Hello,", Element("b", {}, ["Alice"]), "and welcome!"])
+    assert element == expected
+
+
 def test_html_p_with_attributes():
     text = 'Hello, "world!"'
     template: Template = t'<p class="greeting">{text}</p>'
@@ -244,3 +452,1389 @@ def test_html_tag_callable_interpolation():
         [Element("b", {}, ["FUN!"]), "Magic!"],
     )
     assert element == expected
+
+
+def test_html_attribute_partial_interpolation():
+    size = "large"
+    template: Template = t'<p class="greeting {size}">Hi</p>'
+    element = html(template)
+    expected = Element("p", {"class": "greeting large"}, ["Hi"])
+    assert element == expected
+
+
+def test_html_text_interpolation_joins_static_text():
+    name = "Alice"
+    template: Template = t"<p>  Hello, {name}!  </p>"
+    element = html(template)
+    expected = Element("p", {}, ["Hello, Alice!"])
+    assert element == expected
+
+
+def test_html_tag_interpolation_mismatch():
+    start, end = "p", "div"
+    template: Template = t"<{start}>Hello</{end}>"
+    with pytest.raises(HTMLParseError):
+        _ = html(template)
+
+
+def test_html_markup_content():
+    trusted = Markup("<em>cached</em>")
+    element = html(t"<p>Before {trusted} after</p>")
+    assert element == Element("p", {}, ["Before", trusted, "after"])
+    assert str(element) == "<p>Before<em>cached</em>after</p>"
+
+
+def test_html_markup_attribute():
+    trusted = Markup("a &amp; b")
+    untrusted = "<c>"
+    element = html(t'<div title="{trusted} {untrusted}" />')
+    assert str(element) == '<div title="a &amp; b &lt;c&gt;" />'
+
+
+def test_html_dunder_html_content():
+    class Safe:
+        def __html__(self) -> str:
+            return "<br />"
+
+    assert str(html(t"<p>{Safe()}</p>")) == "<p><br /></p>"
+
+
+def test_html_list_content():
+    items = ["one", html(t"<b>two</b>"), t"<i>{'three'}</i>"]
+    element = html(t"<div>{items}</div>")
+    assert str(element) == "<div>one<b>two</b><i>three</i></div>"
+    # Lists are built right away, so they can be rendered again, and equal
+    # lists build equal (and equally hashed) elements
+    assert str(element) == "<div>one<b>two</b><i>three</i></div>"
+    again = html(t"<div>{items}</div>")
+    assert again == element
+    assert hash(again) == hash(element)
+
+
+def test_html_generator_content_is_lazy():
+    consumed: list[int] = []
+
+    def rows():
+        for i in range(3):
+            consumed.append(i)
+            yield t"<li>{str(i)}</li>"
+
+    element = html(t"<ul>{rows()}</ul>")
+    assert consumed == []
+    chunks = element.iter_chunks()
+    assert next(chunks) == "<ul>"
+    assert next(chunks) == "<li>"
+    assert consumed == [0]
+    assert "".join(chunks) == "0</li><li>1</li><li>2</li></ul>"
+
+
+def test_html_nested_iterables():
+    groups = (["a", "b"], ("c",))
+    assert str(html(t"<p>{groups}</p>")) == "<p>abc</p>"
+
+
+def test_html_iterable_bad_item():
+    with pytest.raises(HTMLParseError):
+        html(t"<p>{[object()]}</p>")
+    # Lazy items are only processed when rendered
+    element = html(t"<p>{(item for item in [object()])}</p>")
+    with pytest.raises(HTMLParseError):
+        str(element)
+
+
+def test_html_numbers_and_dates():
+    count, price, ratio = 3, Decimal("9.50"), 0.5
+    when = date(2025, 4, 1)
+    template: Template = t"<p data-n={count} title={ratio}>{count}, {price}, {when}</p>"
+    assert str(html(template)) == '<p data-n="3" title="0.5">3, 9.50, 2025-04-01</p>'
+    stamp = datetime(2025, 4, 1, 12, 30)
+    assert str(html(t"<time datetime={stamp}>{stamp}</time>")) == (
+        '<time datetime="2025-04-01T12:30:00">2025-04-01T12:30:00</time>'
+    )
+
+
+def test_html_bools_unsupported():
+    with pytest.raises(HTMLParseError, match="content"):
+        html(t"<p>{True}</p>")
+    with pytest.raises(HTMLParseError, match="attribute"):
+        html(t"<p title={False}>x</p>")
+
+
+def test_html_bytes_unsupported():
+    data = b"hi"
+    with pytest.raises(HTMLParseError, match="content"):
+        html(t"<p>{data}</p>")
+    with pytest.raises(HTMLParseError, match="content"):
+        html(t"<p>{bytearray(data)}</p>")
+    with pytest.raises(HTMLParseError, match="attribute"):
+        html(t"<p title={data}>x</p>")
+
+
+@dataclass
+class _Money:
+    cents: int
+
+    def __html__(self) -> str:
+        return f"<b>${self.cents / 100:.2f}</b>"
+
+
+def test_interpolation_processors_register():
+    processors = InterpolationProcessors[str]("attribute", lambda value: "html")
+    processors.register(int, lambda value: f"int {value}")
+
+    @processors.register(Mapping)
+    def _(value: object) -> str:
+        return "mapping"
+
+    assert processors(3) == "int 3"
+    assert processors(True) == "int True"
+    assert processors({}) == "mapping"
+    assert processors(Markup("x")) == "html"
+    with pytest.raises(HTMLParseError, match="Unsupported attribute"):
+        processors("text")
+    assert set(processors.cache) == {int, bool, dict, Markup, str}
+    # Registering clears the cache, and exact matches beat __html__
+    processors.register(Markup, lambda value: "markup")
+    assert not processors.cache
+    assert processors(Markup("x")) == "markup"
+
+
+def test_content_processors_register_domain_type():
+    money = _Money(1250)
+    assert str(html(t"<p>{money}</p>")) == "<p><b>$12.50</b></p>"
+    content_processors.register(_Money, lambda value: (f"{value.cents} cents",))
+    attribute_processors.register(_Money, lambda value: str(value.cents))
+    try:
+        element = html(t"<p data-cents={money}>{money}</p>")
+        assert str(element) == '<p data-cents="1250">1250 cents</p>'
+    finally:
+        content_processors.unregister(_Money)
+        attribute_processors.unregister(_Money)
+    assert str(html(t"<p>{money}</p>")) == "<p><b>$12.50</b></p>"
+
+
+def test_html_static_subtrees_are_shared():
+    def render(value: str) -> Element:
+        return html(t'<div><ul class="nav"><li>Home</li></ul><p>{value}</p></div>')
+
+    first, second = render("a"), render("b")
+    assert first.children[0] is second.children[0]
+    assert first.children[0] == Element(
+        "ul", {"class": "nav"}, [Element("li", {}, ["Home"])]
+    )
+    assert list(first.iter_chunks()) == [
+        "<div>",
+        '<ul class="nav"><li>Home</li></ul>',
+        "<p>",
+        "a",
+        "</p>",
+        "</div>",
+    ]
+
+
+def test_html_static_template():
+    first = html(t'<p class="x">Fish &amp; chips</p>')
+    assert first is html(t'<p class="x">Fish &amp; chips</p>')
+    assert str(first) == '<p class="x">Fish &amp; chips</p>'
+    # Rebuilding the element renders it from scratch
+    assert first.append("!") == Element("p", {"class": "x"}, ["Fish & chips", "!"])
+    assert str(first.append("!")) == '<p class="x">Fish &amp; chips!</p>'
+
+
+DEPTH = 50_000
+
+
+def test_element_render_deep_tree():
+    element = Element("b", {}, ["core"])
+    for _ in range(DEPTH):
+        element = Element("i", {}, [element, "x"])
+    expected = "<i>" * DEPTH + "<b>core</b>" + "x</i>" * DEPTH
+    assert str(element) == expected
+    assert "".join(element.iter_chunks()) == expected
+    assert bytes(element) == expected.encode()
+
+
+def test_html_deep_template():
+    def Wrap(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        return Element("span", attributes, children)
+
+    depth = 20_000
+    template = Template(
+        "<div>" * depth + "<",
+        Interpolation(Wrap, "Wrap"),
+        ">",
+        Interpolation("deep", "value"),
+        "</",
+        Interpolation(Wrap, "Wrap"),
+        ">" + "</div>" * depth,
+    )
+    expected = "<div>" * depth + "<span>deep</span>" + "</div>" * depth
+    assert str(html(template)) == expected
+    assert html_bytes(template) == expected.encode()
+
+
+def _document() -> Element:
+    links: Template = t"""
+    <ul class="nav main">
+        <li class="item"><a href="/" class="nav-link active">Home</a></li>
+        <li class="item"><a href="/about" class="nav-link">About</a></li>
+    </ul>
+    """
+    return html(t"""
+    <html>
+        <head><script src="/app.js"></script></head>
+        <body>
+            <nav id="top">{links}</nav>
+            <main id="main">
+                <form method="post" action="/login">
+                    <input type="text" name="user" required />
+                    <input type="password" name="password" />
+                </form>
+                <p>After the <a href="#top">form</a></p>
+            </main>
+        </body>
+    </html>
+    """)
+
+
+def test_element_find_by_id_class_and_tag():
+    document = _document()
+    main = document.find_by_id("main")
+    assert main is not None and main.tag == "main"
+    assert document.find_by_id("missing") is None
+    assert [a.attributes["href"] for a in document.find_all_by_class("nav-link")] == [
+        "/",
+        "/about",
+    ]
+    assert len(document.find_all_by_class("item")) == 2
+    assert [str(e) for e in document.find_all_by_tag("a")][-1] == (
+        '<a href="#top">form</a>'
+    )
+    assert document.find_all_by_tag("table") == []
+    # Queries on a subtree only see the subtree
+    assert main.find_all_by_class("nav-link") == []
+    assert len(main.find_all_by_tag("input")) == 2
+
+
+def test_element_select():
+    document = _document()
+    assert [e.attributes["href"] for e in document.select("a")] == [
+        "/",
+        "/about",
+        "#top",
+    ]
+    assert [e.attributes["href"] for e in document.select("nav a")] == ["/", "/about"]
+    assert [e.attributes["href"] for e in document.select("main > p > a")] == ["#top"]
+    assert document.select("body > a") == []
+    assert len(document.select("ul.nav.main > li.item")) == 2
+    assert document.select("ul.nav.missing") == []
+    assert document.select_one("a.nav-link.active") == document.find_all_by_tag("a")[0]
+    assert [e.attributes["name"] for e in document.select("input[required]")] == [
+        "user"
+    ]
+    assert len(document.select("form[method=post] input")) == 2
+    assert document.select("input[type='password']")[0].attributes["name"] == (
+        "password"
+    )
+    assert [e.tag for e in document.select("#main, script, #top")] == [
+        "script",
+        "nav",
+        "main",
+    ]
+    assert len(document.select("*")) == 16
+    assert document.select_one("table") is None
+
+
+@pytest.mark.parametrize("selector", ["", "a >", "> a", "a > > b", "a,", "p#", "a!"])
+def test_element_select_invalid(selector: str):
+    with pytest.raises(ValueError):
+        Element("p", {}, []).select(selector)
+
+
+def test_element_index_shared_subtrees_and_fragments():
+    item = Element("li", {"class": "item"}, ["x"])
+    items = Element.fragment([item, item])
+    root = Element("ul", {}, [items, item])
+    # A shared element is found at each place, and fragments are transparent
+    assert root.find_all_by_class("item") == [item, item, item]
+    assert len(root.select("ul > li")) == 3
+
+
+def test_element_index_list_and_lazy_children():
+    items = [t"<li>{str(i)}</li>" for i in range(2)]
+    assert len(html(t"<ul>{items}</ul>").select("ul li")) == 2
+    rows = (t"<li>{str(i)}</li>" for i in range(2))
+    element = html(t"<ul>{rows}</ul>")
+    with pytest.raises(TypeError):
+        element.find_all_by_tag("li")
+
+
+def test_element_index_released_with_tree():
+    element = html(t"<ul><li id='a'>{'x'}</li></ul>")
+    assert element.find_by_id("a") is not None
+    ref = weakref.ref(element)
+    del element
+    gc.collect()
+    assert ref() is None
+
+
+def test_element_index_deep_tree():
+    element = Element("b", {"id": "core"}, ["core"])
+    for _ in range(DEPTH):
+        element = Element("i", {}, [element])
+    assert element.find_by_id("core") == Element("b", {"id": "core"}, ["core"])
+    assert len(element.select("i > b#core")) == 1
+
+
+# ---------------------------------------------------------------------------
+# Tests for the compiled template cache
+# ---------------------------------------------------------------------------
+
+
+def _render_greeting(name: str) -> Element:
+    return html(t'<p class="greeting">Hello, {name}!</p>')
+
+
+def test_html_cache_reuses_template_shape():
+    html_cache_clear()
+    first = _render_greeting("Alice")
+    second = _render_greeting("Bob")
+    info = html_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+    assert first == Element("p", {"class": "greeting"}, ["Hello, Alice!"])
+    assert second == Element("p", {"class": "greeting"}, ["Hello, Bob!"])
+
+
+def test_html_cache_clear():
+    _ = _render_greeting("Alice")
+    html_cache_clear()
+    assert html_cache_info().currsize == 0
+    _ = _render_greeting("Alice")
+    assert html_cache_info().misses == 1
+
+
+# ---------------------------------------------------------------------------
+# Tests for the HTMLTemplateParser
+# ---------------------------------------------------------------------------
+
+
+def test_parser_many_children():
+    markup = "<ul>" + "".join(f"<li>{i}</li>" for i in range(1000)) + "</ul>"
+    element = html(Template(markup))
+    expected = Element("ul", {}, [Element("li", {}, [str(i)]) for i in range(1000)])
+    assert element == expected
+
+
+def test_parser_unexpected_end_tag():
+    parser = HTMLTemplateParser()
+    with pytest.raises(HTMLParseError):
+        parser.feed("<div><p>Hello</div></p>")
+
+
+def test_html_nested_component_templates():
+    def Box(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        return Element("div", {"class": "box", **attributes}, children)
+
+    inner = t"<{Box} id='inner'>Inside</{Box}>"
+    template: Template = t"<{Box} id='outer'>{inner}</{Box}>"
+    element = html(template)
+    expected = Element(
+        "div",
+        {"class": "box", "id": "outer"},
+        [Element("div", {"class": "box", "id": "inner"}, ["Inside"])],
+    )
+    assert element == expected
+
+
+def test_parser_unclosed_element():
+    parser = HTMLTemplateParser()
+    parser.feed("<div><p>Hello</p>")
+    with pytest.raises(HTMLParseError):
+        _ = parser.close()
+
+
+def test_parser_interpolation_contexts():
+    parser = HTMLTemplateParser()
+    for index, s in enumerate(["<", " ", " data-", '="', ' x"></', ">"]):
+        if index:
+            parser.feed_interpolation(index - 1)
+        parser.feed(s)
+    compiled = parser.close()
+    assert compiled.root.tag == (0,)
+    assert compiled.root.attributes == (
+        _CompiledSpread(1),
+        _CompiledAttribute(("data-", 2), (3, " x")),
+    )
+    assert compiled.dynamic_end_tags == (((0,), (4,)),)
+
+
+def test_html_tag_name_partial_interpolation():
+    level = "2"
+    template: Template = t"<h{level}>Title</h{level}>"
+    element = html(template)
+    assert element == Element("h2", {}, ["Title"])
+
+
+def test_html_attribute_name_interpolation():
+    name = "user"
+    template: Template = t'<p data-{name}="yes" hidden>Hi</p>'
+    element = html(template)
+    assert element == Element("p", {"data-user": "yes", "hidden": None}, ["Hi"])
+
+
+def test_html_comments_ignored():
+    secret = "hidden"
+    template: Template = t"<p><!-- {secret} -->Visible</p>"
+    element = html(template)
+    assert element == Element("p", {}, ["Visible"])
+
+
+def test_html_character_references():
+    template: Template = t'<p title="a &amp; b">1 &lt; 2</p>'
+    element = html(template)
+    assert element == Element("p", {"title": "a & b"}, ["1 < 2"])
+
+
+def test_html_raw_text_elements():
+    template: Template = t"<script>if (a < b && c) {{ go(); }}</script>"
+    element = html(template)
+    assert element == Element("script", {}, ["if (a < b && c) { go(); }"])
+
+
+# ---------------------------------------------------------------------------
+# Tests for the async_html() template processing function
+# ---------------------------------------------------------------------------
+
+
+async def _slow(value: object, delay: float = 0.1) -> object:
+    await asyncio.sleep(delay)
+    return value
+
+
+async def test_async_html_same_as_html():
+    name = "Alice"
+    template: Template = t'<p class="greeting">Hello, {name}!</p>'
+    assert await async_html(template) == html(template)
+
+
+async def test_async_html_awaitable_content_and_attribute():
+    template: Template = t"<p class={_slow('greeting')}>{_slow('Hello')}</p>"
+    element = await async_html(template)
+    assert element == Element("p", {"class": "greeting"}, ["Hello"])
+
+
+async def test_async_html_nested_templates():
+    first: Template = t"<b>{_slow('one')}</b>"
+    second: Template = t"<i>{_slow('two')}</i>"
+    template: Template = t"<p>{_slow(first)} and {second}</p>"
+    element = await async_html(template)
+    one, two = Element("b", {}, ["one"]), Element("i", {}, ["two"])
+    assert element == Element("p", {}, [one, "and", two])
+
+
+async def test_async_html_concurrent():
+    template: Template = t"<p>{_slow('a', 0.2)}{_slow('b', 0.2)}{_slow('c', 0.2)}</p>"
+    start = time.perf_counter()
+    element = await async_html(template)
+    assert time.perf_counter() - start < 0.4
+    assert element == Element("p", {}, ["abc"])
+
+
+async def test_async_html_limit():
+    template: Template = t"<p>{_slow('a', 0.1)}{_slow('b', 0.1)}{_slow('c', 0.1)}</p>"
+    start = time.perf_counter()
+    element = await async_html(template, limit=1)
+    assert time.perf_counter() - start >= 0.3
+    assert element == Element("p", {}, ["abc"])
+
+
+async def test_async_html_async_components():
+    async def Slow(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        await asyncio.sleep(0.2)
+        return Element("div", {"class": "slow", **attributes}, children)
+
+    template: Template = t"""
+    <{Slow} id="outer">
+        <{Slow} id="first">One</{Slow}>
+        <{Slow} id="second">Two</{Slow}>
+    </{Slow}>
+    """
+    start = time.perf_counter()
+    element = await async_html(template)
+    # The two inner components run concurrently, then the outer one runs
+    assert time.perf_counter() - start < 0.6
+    expected = Element(
+        "div",
+        {"class": "slow", "id": "outer"},
+        [
+            Element("div", {"class": "slow", "id": "first"}, ["One"]),
+            Element("div", {"class": "slow", "id": "second"}, ["Two"]),
+        ],
+    )
+    assert element == expected
+
+
+# ---------------------------------------------------------------------------
+# Tests for instrumentation hooks
+# ---------------------------------------------------------------------------
+
+
+def _card(
+    attributes: Mapping[str, str | None], children: Sequence[str | Element]
+) -> Element:
+    return Element("div", {"class": "card", **attributes}, children)
+
+
+def test_render_hooks_events():
+    html_cache_clear()
+    events: list[RenderEvent] = []
+    name = "A & B"
+    with render_hooks(events.append):
+        element = html(t"<main><{_card} id='x'><p>{name}</p></{_card}></main>")
+        text = str(element)
+    assert text == '<main><div class="card" id="x"><p>A &amp; B</p></div></main>'
+    parse, component, build, render = events
+    phases = [event.phase for event in events]
+    assert phases == ["parse", "component", "build", "render"]
+    assert parse.shape == build.shape == render.shape
+    assert build.shape == "<main><{} id='x'><p>{}</p></{}></main>"
+    assert component.shape == "_card"
+    assert build.counts == {"elements": 3}
+    assert render.counts == {"bytes": len(text), "escapes": 3}
+    assert all(event.seconds >= 0 for event in events)
+
+
+def test_render_hooks_no_render_while_compiling():
+    html_cache_clear()
+    events: list[RenderEvent] = []
+    with render_hooks(events.append):
+        html(t"<main><section><h1>Static</h1><p>text</p></section>{'x'}</main>")
+    assert [event.phase for event in events] == ["parse", "build"]
+
+
+def test_render_hooks_escapes_per_thread():
+    events: list[RenderEvent] = []
+
+    def render(count: int) -> None:
+        names = [str(i) for i in range(count)]
+        for _ in range(50):
+            str(html(t"<p>{names}</p>"))
+
+    with render_hooks(events.append):
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(render, [1, 2, 3, 4] * 4))
+    counts = {event.counts["escapes"] for event in events if event.phase == "render"}
+    assert counts == {1, 2, 3, 4}
+
+
+def test_render_hooks_html_bytes_and_async():
+    events: list[RenderEvent] = []
+    with render_hooks(events.append):
+        data = html_bytes(t"<p>{'café'}</p>")
+        asyncio.run(async_html(t"<p>{_slow('x', 0)}</p>"))
+    render = next(event for event in events if event.phase == "render")
+    assert render.shape == "<p>{}</p>"
+    assert render.counts["bytes"] == len(data)
+    assert [event.phase for event in events if event.phase != "parse"] == [
+        "render",
+        "build",
+    ]
+
+
+def test_render_hooks_add_remove():
+    events: list[RenderEvent] = []
+    add_render_hook(events.append)
+    try:
+        html(t"<p>{'x'}</p>")
+    finally:
+        remove_render_hook(events.append)
+    count = len(events)
+    assert count
+    # Nothing is reported (or counted) once the hook is removed
+    str(html(t"<p>{'x'}</p>"))
+    assert len(events) == count
+    with pytest.raises(ValueError):
+        remove_render_hook(events.append)
+
+
+def test_render_stats_table():
+    stats = RenderStats()
+    with render_hooks(stats):
+        for i in range(3):
+            str(html(t"<ul><li>{str(i)}</li><{_card}>{str(i)}</{_card}></ul>"))
+    rows = {(row[0], row[1]): (row[2], row[4]) for row in stats.rows()}
+    shape = "<ul><li>{}</li><{}>{}</{}></ul>"
+    assert rows[(shape, "build")] == (3, {"elements": 9})
+    assert rows[(shape, "render")][0] == 3
+    assert rows[("_card", "component")] == (3, {})
+    buffer = io.StringIO()
+    stats.print_table(buffer)
+    lines = buffer.getvalue().splitlines()
+    assert lines[0].split() == (
+        "phase calls total ms us/call elements bytes escapes shape".split()
+    )
+    assert any(line.startswith("component") and "_card" in line for line in lines)
+    stats.clear()
+    assert stats.rows() == []
+
+
+# ---------------------------------------------------------------------------
+# Tests for render limits
+# ---------------------------------------------------------------------------
+
+
+def _rows(count: int) -> Template:
+    rows = [t"<tr><td>{str(i)}</td></tr>" for i in range(count)]
+    return t"<table>{rows}</table>"
+
+
+def test_render_limits_not_hit():
+    template = _rows(10)
+    with render_limits(max_nodes=100, max_depth=10, max_bytes=1000, max_seconds=5) as b:
+        text = str(html(template))
+        data = html_bytes(template)
+    assert text == str(html(template))
+    assert data == text.encode()
+    assert b.nodes_built == 2 * (1 + 20)
+    # The list of rows is rendered as a fragment
+    assert b.nodes_rendered == 2 * 22
+    assert b.bytes_rendered == 2 * len(text)
+    assert b.depth == 0
+
+
+def test_render_limits_nodes():
+    rows: list[Element] = []
+    with render_limits(max_nodes=50) as budget:
+        with pytest.raises(RenderLimitExceeded) as info:
+            for i in range(30):
+                rows.append(html(t"<tr><td>{str(i)}</td></tr>"))
+    assert (info.value.limit, info.value.value) == ("max_nodes", 50)
+    assert len(rows) == 25
+    assert budget.nodes_built == 52
+    # Elements made outside templates (or lazily, while rendering) are caught
+    # when they're rendered
+    big = Element("ul", {}, [Element("li", {}, [str(i)]) for i in range(100)])
+    with render_limits(max_nodes=50):
+        with pytest.raises(RenderLimitExceeded, match="max_nodes"):
+            str(big)
+    with render_limits(max_nodes=50):
+        with pytest.raises(RenderLimitExceeded, match="max_nodes"):
+            str(html(_rows(30)))
+
+
+def test_render_limits_depth():
+    template: Template = t"<b>deep</b>"
+    for _ in range(20):
+        template = t"<i>{template}</i>"
+    with render_limits(max_depth=30):
+        html(template)
+    with render_limits(max_depth=10):
+        with pytest.raises(RenderLimitExceeded, match="max_depth"):
+            html(template)
+    element = Element("b", {}, [])
+    for _ in range(20):
+        element = Element("i", {}, [element])
+    with render_limits(max_depth=10):
+        with pytest.raises(RenderLimitExceeded, match="max_depth"):
+            "".join(element.iter_chunks())
+
+
+def _nested(depth: int) -> Template:
+    template: Template = t"<b>deep</b>"
+    for _ in range(depth - 1):
+        template = t"<i>{template}</i>"
+    return template
+
+
+def test_render_limits_depth_where_inserted():
+    # The nested template goes in at depth 1, beside a deeper sibling
+    inner = _nested(5)
+    outer = t"<main><section><p>{'x'}</p></section>{inner}</main>"
+    with render_limits(max_depth=6) as budget:
+        text = str(html(outer))
+        assert budget.depth == 0
+    with render_limits(max_depth=5):
+        with pytest.raises(RenderLimitExceeded, match="max_depth"):
+            html(outer)
+    assert text.count("<i>") == 4
+
+
+def test_render_limits_bytes_stop_early():
+    chunks: list[str] = []
+    items = (f"line {i} é" for i in range(1_000_000))
+    element = html(t"<pre>{items}</pre>")
+    with render_limits(max_bytes=1000):
+        with pytest.raises(RenderLimitExceeded, match="max_bytes"):
+            element.render_into(chunks.append)
+    assert 900 < sum(len(chunk.encode()) for chunk in chunks) <= 1000
+
+
+def test_render_limits_static_pages():
+    html_cache_clear()
+    rows = "".join(f"<li>Row {i}</li>" for i in range(60))
+    strings = (f"<main><ul>{rows}</ul><p>", "</p></main>")
+    page = Template(strings[0], Interpolation("x", "x"), strings[1])
+    size = len(str(html(page)))
+    assert 900 < size < 1000
+    # Compiling a new shape isn't charged to the render that needed it
+    for _ in range(2):
+        html_cache_clear()
+        with render_limits(max_bytes=1000):
+            str(html(page))
+    # Prerendered static HTML is still charged when it's rendered
+    static = Template(f"<main>{f'<ul>{rows}</ul>' * 20}</main>")
+    with render_limits(max_bytes=100):
+        with pytest.raises(RenderLimitExceeded, match="max_bytes"):
+            str(html(static))
+
+
+def test_render_limits_time():
+    def Slow(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        time.sleep(0.03)
+        return Element("div", attributes, children)
+
+    template: Template = t"<main><{Slow}>a</{Slow}><{Slow}>b</{Slow}></main>"
+    with render_limits(max_seconds=0.02):
+        with pytest.raises(RenderLimitExceeded, match="max_seconds"):
+            html(template)
+    with render_limits(max_seconds=1):
+        html(template)
+
+
+async def test_render_limits_async():
+    template: Template = t"<div><p>{_slow('a', 0)}</p><p>b</p><p>c</p></div>"
+    with render_limits(max_nodes=3):
+        with pytest.raises(RenderLimitExceeded):
+            await async_html(template)
+    with render_limits(max_depth=6):
+        await async_html(_async_nested())
+    with render_limits(max_depth=5):
+        with pytest.raises(RenderLimitExceeded, match="max_depth"):
+            await async_html(_async_nested())
+
+
+def _async_nested() -> Template:
+    inner = _nested(5)
+    return t"<main><section><p>{_slow('x', 0)}</p></section>{inner}</main>"
+
+
+async def test_render_limits_stream():
+    with render_limits(max_depth=6, max_nodes=20) as budget:
+        chunks = [chunk async for chunk in stream_html(_async_nested())]
+    assert "".join(chunks) == str(await async_html(_async_nested()))
+    assert budget.nodes_rendered == 8
+    assert budget.bytes_rendered == len("".join(chunks))
+    for limits in ({"max_depth": 5}, {"max_nodes": 7}, {"max_bytes": 50}):
+        with render_limits(**limits):
+            with pytest.raises(RenderLimitExceeded, match=next(iter(limits))):
+                async for chunk in stream_html(_async_nested()):
+                    pass
+
+
+# ---------------------------------------------------------------------------
+# Tests for the stream_html() function
+# ---------------------------------------------------------------------------
+
+
+async def _collect(template: Template, **kwargs) -> list[tuple[float, str]]:
+    """Stream a template, returning each chunk with the time it arrived."""
+    start = time.perf_counter()
+    return [
+        (time.perf_counter() - start, chunk)
+        async for chunk in stream_html(template, **kwargs)
+    ]
+
+
+def _page(title: object, body: object, footer: object = "bye") -> Template:
+    return t"""
+    <html>
+        <head><title>{title}</title></head>
+        <body class="page">
+            <main id={"main"}>{body}</main><footer>{footer}</footer>
+        </body>
+    </html>
+    """
+
+
+async def test_stream_html_same_as_async_html():
+    items = [t"<li>{str(i)}</li>" for i in range(3)]
+    for make_template in (
+        lambda: t'<p class="greeting">Hello, {"Alice"}!</p>',
+        lambda: t"<p>{''}</p>",
+        lambda: t"<ul>{items}</ul>",
+        lambda: _page("Home", t"<p>{_slow('slow')}</p>", _slow(Markup("<i>x</i>"))),
+    ):
+        expected = str(await async_html(make_template()))
+        chunks = await _collect(make_template(), buffer_size=0)
+        assert "".join(chunk for _, chunk in chunks) == expected
+        chunks = await _collect(make_template())
+        assert "".join(chunk for _, chunk in chunks) == expected
+    # Without anything to wait for, small pages are sent in one chunk
+    chunks = await _collect(_page("Home", Element("p", {}, ["text"])))
+    assert len(chunks) == 1
+
+
+async def test_stream_html_first_chunk_before_slow_values():
+    chunks = await _collect(_page("Home", _slow("slow", 0.2)))
+    (first_time, first), (last_time, last) = chunks
+    assert first_time < 0.1 <= 0.2 <= last_time
+    assert first.endswith('<title>Home</title></head><body class="page">')
+    assert last == '<main id="main">slow</main><footer>bye</footer></body></html>'
+
+
+async def test_stream_html_values_resolve_concurrently():
+    template = _page(_slow("Home", 0.2), _slow("body", 0.2), _slow("bye", 0.2))
+    chunks = await _collect(template)
+    assert chunks[-1][0] < 0.4
+    assert "".join(chunk for _, chunk in chunks) == str(
+        html(_page("Home", "body", "bye"))
+    )
+
+
+async def test_stream_html_flush():
+    template: Template = t"""
+    <body><header>Menu</header>{FLUSH}<main>{'text'}</main></body>
+    """
+    chunks = [chunk for _, chunk in await _collect(template)]
+    assert chunks == ["<body><header>Menu</header>", "<main>text</main></body>"]
+    assert str(html(template)) == "".join(chunks)
+
+
+async def test_stream_html_buffer_size():
+    items = [t"<li>{str(i)}</li>" for i in range(100)]
+    template: Template = t"<ul>{items}</ul>"
+    chunks = [chunk for _, chunk in await _collect(template, buffer_size=100)]
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+    assert "".join(chunks) == str(html(template))
+
+
+async def test_stream_html_async_components():
+    async def Slow(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        await asyncio.sleep(0.1)
+        return Element("div", attributes, children)
+
+    template: Template = t"<main><h1>Title</h1><{Slow} id='x'>{'text'}</{Slow}></main>"
+    chunks = await _collect(template, buffer_size=0)
+    assert chunks[0][1] == "<main>"
+    title, slow = Element("h1", {}, ["Title"]), Element("div", {"id": "x"}, ["text"])
+    expected = Element("main", {}, [title, slow])
+    assert "".join(chunk for _, chunk in chunks) == str(expected)
+
+
+async def test_stream_html_cancels_on_close():
+    cancelled = asyncio.Event()
+
+    async def forever() -> str:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "never"
+
+    stream = stream_html(_page("Home", forever()))
+    assert "<title>Home</title>" in await anext(stream)
+    await asyncio.sleep(0.01)
+    await stream.aclose()
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+
+# ---------------------------------------------------------------------------
+# Tests for the html_bytes() and html_chunks() functions
+# ---------------------------------------------------------------------------
+
+
+def _assert_same_bytes(template: Template) -> None:
+    expected = str(html(template)).encode()
+    assert html_bytes(template) == expected
+    assert b"".join(html_chunks(template)) == expected
+
+
+def test_html_bytes_static():
+    _assert_same_bytes(t'<div class="a &amp; b"><p>Fish &amp; chips</p><br /></div>')
+
+
+def test_html_bytes_dynamic_attributes():
+    value = '"quoted" & <angled>'
+    _assert_same_bytes(t'<a href="/{value}" title={value} hidden>link</a>')
+
+
+def test_html_bytes_text():
+    name = "<Alice> & café"
+    _assert_same_bytes(t"<p>Hello, {name}! <b>{name}</b> bye</p>")
+
+
+def test_html_bytes_empty_text():
+    empty = ""
+    _assert_same_bytes(t"<p>{empty}</p>")
+    assert html_bytes(t"<p>{empty}</p>") == b"<p />"
+
+
+def test_html_bytes_spread_fallback():
+    attributes = {"id": "x", "class": "y"}
+    _assert_same_bytes(t'<div class="z" {attributes}><span>{"text"}</span></div>')
+
+
+def test_html_bytes_nested():
+    item = html(t"<li>{'one'}</li>")
+    items = t"<li>two</li>"
+    _assert_same_bytes(t"<ul>{item}{items}</ul>")
+
+
+def test_html_bytes_components():
+    def Card(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        return Element("section", {"class": "card", **attributes}, children)
+
+    _assert_same_bytes(t'<main><{Card} id="c">Body</{Card}></main>')
+
+
+def test_html_chunks():
+    value = "x"
+    chunks = html_chunks(t'<div class="a"><p>static</p><p>{value}</p></div>')
+    assert chunks == [
+        b"<div",
+        b' class="a"',
+        b">",
+        b"<p>static</p>",
+        b"<p",
+        b">",
+        b"x",
+        b"</p>",
+        b"</div>",
+    ]
+
+
+def test_html_bytes_markup():
+    trusted = Markup("<b>ok</b>")
+    title = Markup("&lt;trusted&gt;")
+    _assert_same_bytes(t"<p title={title}>{trusted}</p>")
+    assert html_bytes(t"<p title={title}>{trusted}</p>") == (
+        b'<p title="&lt;trusted&gt;"><b>ok</b></p>'
+    )
+
+
+# ---------------------------------------------------------------------------
+# Tests for memoized components
+# ---------------------------------------------------------------------------
+
+
+def _counting_nav() -> tuple[MemoizedComponent, list[int]]:
+    calls: list[int] = []
+
+    @memoize_component(maxsize=2)
+    def Nav(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        calls.append(1)
+        return Element("nav", attributes, children)
+
+    return Nav, calls
+
+
+def test_memoize_component_reuses_subtree():
+    Nav, calls = _counting_nav()
+    first = html(t'<div><{Nav} id="top"><a href="/">Home</a></{Nav}></div>')
+    second = html(t'<div><{Nav} id="top"><a href="/">Home</a></{Nav}></div>')
+    assert first == second
+    assert first.children[0] is second.children[0]
+    assert len(calls) == 1
+    info = Nav.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+    assert info.hit_rate == 0.5
+
+
+def test_memoize_component_keys_on_inputs():
+    Nav, calls = _counting_nav()
+    for label in ["a", "b", "a"]:
+        html(t"<{Nav}>{label}</{Nav}>")
+    html(t'<{Nav} id="a">a</{Nav}>')
+    html(t"<{Nav}>{Markup('a')}</{Nav}>")
+    assert len(calls) == 4
+
+
+def test_memoize_component_lru_bound():
+    Nav, calls = _counting_nav()
+    for label in ["a", "b", "c", "a"]:
+        html(t"<{Nav}>{label}</{Nav}>")
+    assert len(calls) == 4
+    assert Nav.cache_info().currsize == 2
+    Nav.cache_clear()
+    assert Nav.cache_info() == (0, 0, 2, 0)
+
+
+def test_memoize_component_ttl():
+    now = [0.0]
+
+    def Footer(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        return Element("footer", attributes, children)
+
+    Footer = MemoizedComponent(Footer, ttl=10, timer=lambda: now[0])
+    first = html(t"<{Footer}>Bye</{Footer}>")
+    now[0] = 5
+    assert html(t"<{Footer}>Bye</{Footer}>") is first
+    now[0] = 11
+    assert html(t"<{Footer}>Bye</{Footer}>") is not first
+    assert Footer.cache_info().misses == 2
+
+
+def test_memoize_component_ttl_evicts_expired():
+    now = [0.0]
+
+    def Footer(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        return Element("footer", attributes, children)
+
+    Footer = MemoizedComponent(Footer, ttl=10, timer=lambda: now[0])
+    for label in ["a", "b", "c"]:
+        html(t"<{Footer}>{label}</{Footer}>")
+    assert Footer.cache_info().currsize == 3
+    # Expired entries are dropped when they are looked up...
+    now[0] = 11
+    html(t"<{Footer}>a</{Footer}>")
+    # ...and when anything else is stored
+    assert Footer.cache_info().currsize == 1
+    # Entries evicted long before they expire don't pile up either
+    Footer = MemoizedComponent(Footer.component, maxsize=2, ttl=3600)
+    for i in range(1000):
+        Footer({}, [str(i)])
+    assert Footer.cache_info().currsize == 2
+    assert len(Footer._expiries) <= 4
+
+
+def test_memoize_component_deep_children():
+    Nav, calls = _counting_nav()
+    deep = Element("span", {}, ["leaf"])
+    for _ in range(5_000):
+        deep = Element("span", {}, [deep])
+    html(t"<{Nav}>{deep}</{Nav}>")
+    html(t"<{Nav}>{deep}</{Nav}>")
+    assert len(calls) == 1
+
+
+async def test_memoize_component_async():
+    calls: list[int] = []
+
+    @memoize_component()
+    async def Nav(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        calls.append(1)
+        return Element("nav", attributes, children)
+
+    first = await async_html(t"<{Nav}>Home</{Nav}>")
+    second = await async_html(t"<{Nav}>Home</{Nav}>")
+    assert first is second
+    assert len(calls) == 1
+
+
+def test_memoize_component_lazy_children_not_cached():
+    Nav, calls = _counting_nav()
+    html(t"<{Nav}>{(item for item in 'ab')}</{Nav}>")
+    html(t"<{Nav}>{(item for item in 'ab')}</{Nav}>")
+    assert len(calls) == 2
+    assert Nav.cache_info().currsize == 0
+
+
+# ---------------------------------------------------------------------------
+# Tests for cached fragments
+# ---------------------------------------------------------------------------
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _sidebar(calls: list[str], name: str) -> Template:
+    calls.append(name)
+    return t'<aside class="sidebar"><h2>{name}</h2></aside>'
+
+
+@pytest.mark.parametrize("backend", ["memory", "disk"])
+def test_cached_fragment(backend: str, tmp_path):
+    store = MemoryBackend() if backend == "memory" else DiskBackend(tmp_path)
+    clock = _Clock()
+    cache = FragmentCache(store, timer=clock)
+    calls: list[str] = []
+
+    def page(name: str) -> Element:
+        sidebar = Cached(
+            f"sidebar:{name}", lambda: _sidebar(calls, name), ttl=60, cache=cache
+        )
+        return html(t"<main><p>{name}</p>{sidebar}</main>")
+
+    expected = (
+        "<main><p>A &amp; B</p>"
+        '<aside class="sidebar"><h2>A &amp; B</h2></aside></main>'
+    )
+    assert str(page("A & B")) == expected
+    assert str(page("A & B")) == expected
+    assert calls == ["A & B"]
+    assert cache.cache_info() == (1, 1, 1)
+    assert cache.cache_info().hit_rate == 0.5
+
+    # Entries expire after their TTL
+    clock.now += 61
+    assert str(page("A & B")) == expected
+    assert calls == ["A & B", "A & B"]
+
+    # Invalidation by key prefix
+    str(page("C"))
+    assert cache.invalidate("sidebar:A") == 1
+    assert cache.cache_info().currsize == 1
+    str(page("A & B"))
+    assert calls == ["A & B", "A & B", "C", "A & B"]
+
+    cache.cache_clear()
+    assert cache.cache_info() == (0, 0, 0)
+
+
+def test_cached_fragment_memory_keeps_elements():
+    cache = FragmentCache()
+    items = (t"<li>{str(i)}</li>" for i in range(3))
+    element = html(t"<ul>{items}</ul>")
+    cached = Cached("list", element, cache=cache)
+    first = html(t"<div>{cached}</div>")
+    second = html(t"<div>{cached}</div>")
+    # The same (pre-rendered) element is reused, lazy children and all
+    assert first.children[0] is second.children[0]
+    expected = "<div><ul><li>0</li><li>1</li><li>2</li></ul></div>"
+    assert str(first) == str(second) == expected
+    # The element passed in is left as it was
+    assert element._markup is None
+
+
+def test_cached_fragment_disk_shared(tmp_path):
+    first = FragmentCache(DiskBackend(tmp_path))
+    first.fetch(Cached("nav", t"<nav>{'Home'}</nav>"))
+    # Another process (here, another cache) sees the same fragments
+    second = FragmentCache(DiskBackend(tmp_path))
+    fragment = second.fetch(Cached("nav", lambda: pytest.fail("not cached")))
+    assert fragment == Markup("<nav>Home</nav>")
+    assert second.cache_info() == (1, 0, 1)
+
+
+def test_cached_fragment_disk_corrupt(tmp_path):
+    cache = FragmentCache(DiskBackend(tmp_path))
+    cache.fetch(Cached("nav", t"<nav>{'Home'}</nav>"))
+    (path,) = tmp_path.glob("*.html")
+    path.write_text('{"key": "na', encoding="utf-8")
+    # A file cut short is a miss, and is replaced
+    fragment = cache.fetch(Cached("nav", t"<nav>{'Away'}</nav>"))
+    assert str(fragment) == "<nav>Away</nav>"
+    assert cache.cache_info() == (0, 2, 1)
+    path.write_bytes(b"\xff\xfe")
+    assert cache.invalidate("nav") == 0
+    assert not path.exists()
+
+
+def test_cached_fragment_unsupported_content():
+    with pytest.raises(HTMLParseError):
+        html(t"<div>{Cached('bad', lambda: 42, cache=FragmentCache())}</div>")
+
+
+# ---------------------------------------------------------------------------
+# Tests for html_tagged() and html_conditional()
+# ---------------------------------------------------------------------------
+
+
+def _greeting(name: str) -> Template:
+    items = [t"<li>{str(i)}</li>" for i in range(3)]
+    return t'<div class="greeting"><p>Hello, {name}!</p><ul>{items}</ul></div>'
+
+
+def test_html_tagged():
+    tagged = html_tagged(_greeting("Ünïcode & co"))
+    body = html_bytes(_greeting("Ünïcode & co"))
+    assert tagged.body == body
+    assert tagged.content_length == len(body)
+    assert tagged.etag.startswith('"') and tagged.etag.endswith('"')
+    assert tagged.headers() == [
+        ("Content-Length", str(len(body))),
+        ("ETag", tagged.etag),
+    ]
+    # The same output has the same ETag, however it was produced
+    assert html_tagged(html(_greeting("Ünïcode & co"))) == tagged
+    assert html_tagged(_greeting("Someone else")).etag != tagged.etag
+
+
+def test_html_tagged_element_hooks():
+    element = html(_greeting("Ünïcode & co"))
+    events: list[RenderEvent] = []
+    with render_hooks(events.append):
+        tagged = html_tagged(element)
+    assert tagged == html_tagged(_greeting("Ünïcode & co"))
+    (render,) = events
+    assert render.phase == "render"
+    assert render.counts["bytes"] == tagged.content_length
+
+
+def test_html_tagged_limits():
+    with render_limits(max_nodes=100):
+        tagged = html_tagged(_greeting("World"))
+    assert tagged == html_tagged(_greeting("World"))
+    with pytest.raises(RenderLimitExceeded):
+        with render_limits(max_nodes=3):
+            html_tagged(_greeting("World"))
+
+
+def test_html_conditional():
+    store = ETagStore()
+    tagged = html_conditional(_greeting("World"), None, store)
+    assert isinstance(tagged, TaggedHTML)
+    assert len(store) == 1
+
+    calls: list[str] = []
+
+    def name() -> str:
+        calls.append("called")
+        return "World"
+
+    # A matching stored ETag answers without rendering again, so a pure
+    # component isn't even called
+    def Greeting(
+        attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> Element:
+        return html(_greeting(name()))
+
+    component = t"<{Greeting} />"
+    first = html_conditional(component, None, store)
+    assert isinstance(first, TaggedHTML)
+    assert calls == ["called"]
+    assert html_conditional(component, first.etag, store) == NotModified(first.etag)
+    assert html_conditional(component, f'"other", W/{first.etag}', store) == (
+        NotModified(first.etag)
+    )
+    assert calls == ["called"]
+
+    # Anything else renders the page
+    assert html_conditional(component, '"other"', store) == first
+    assert html_conditional(_greeting("Else"), tagged.etag, store) != tagged
+    assert calls == ["called", "called"]
+
+
+def test_html_conditional_unkeyable():
+    store = ETagStore()
+    items = (t"<li>{str(i)}</li>" for i in range(3))
+    page = html_conditional(t"<ul>{items}</ul>", None, store)
+    assert isinstance(page, TaggedHTML)
+    assert len(store) == 0
+    # Unkeyable pages are still compared with the ETag once rendered
+    items = (t"<li>{str(i)}</li>" for i in range(3))
+    assert html_conditional(t"<ul>{items}</ul>", page.etag, store) == (
+        NotModified(page.etag)
+    )
+
+
+def test_html_conditional_store_evicts():
+    store = ETagStore(maxsize=2)
+    for name in ("a", "b", "c"):
+        html_conditional(_greeting(name), None, store)
+    assert len(store) == 2
+    store.clear()
+    assert len(store) == 0
+
+
+# ---------------------------------------------------------------------------
+# Tests for compressing HTML as it is rendered
+# ---------------------------------------------------------------------------
+
+
+def _footer_page(rows: int) -> Template:
+    # A static footer long enough to be compressed once per shape
+    links = "".join(f'<li><a href="/pages/{i}">Page {i}</a></li>' for i in range(50))
+    items = [t"<li>{str(i)} &amp; {chr(65 + i % 26)}</li>" for i in range(rows)]
+    return Template(
+        "<html><body><ul>",
+        Interpolation(items, "items"),
+        f"</ul><footer><ul>{links}</ul></footer></body></html>",
+    )
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress", [("gzip", gzip.decompress), ("deflate", zlib.decompress)]
+)
+def test_iter_compressed(encoding, decompress):
+    expected = str(html(_footer_page(2000))).encode()
+    compressed = b"".join(iter_compressed(_footer_page(2000), encoding))
+    assert decompress(compressed) == expected
+    # The footer was compressed once, and spliced in again the second time
+    assert b"".join(iter_compressed(_footer_page(2000), encoding)) == compressed
+
+    element = html(_footer_page(10))
+    compressed = b"".join(iter_compressed(element, encoding, level=1))
+    assert decompress(compressed) == str(element).encode()
+
+
+def test_iter_compressed_chunks():
+    chunks = list(iter_compressed(_footer_page(20000), buffer_size=4096))
+    assert len(chunks) > 2
+    assert all(len(chunk) >= 4096 for chunk in chunks[:-1])
+    assert gzip.decompress(b"".join(chunks)) == html_bytes(_footer_page(20000))
+
+
+def test_compressing_writer():
+    out = io.BytesIO()
+    element = html(t"<p>{'Ünïcode & co'}</p>")
+    writer = CompressingWriter(out.write)
+    element.render_into(writer)
+    writer.close()
+    assert gzip.decompress(out.getvalue()) == str(element).encode()
+
+    with pytest.raises(ValueError):
+        CompressingWriter(out.write, encoding="br")
+
+
+# ---------------------------------------------------------------------------
+# Tests for render_many()
+# ---------------------------------------------------------------------------
+
+
+def _article_page(title: str, body: str = "") -> Template:
+    return t"<article><h1>{title}</h1><p>{body}</p></article>"
+
+
+def test_render_many_in_order():
+    jobs = [PageJob(_article_page, (f"Post {i}",), {"body": "<b>"}) for i in range(5)]
+    report = render_many(jobs, processes=1)
+    assert report.results == [
+        f"<article><h1>Post {i}</h1><p>&lt;b&gt;</p></article>" for i in range(5)
+    ]
+    assert report.bytes_rendered == sum(len(page) for page in report.results)
+    assert report.pages_per_second > 0
+
+
+def test_render_many_to_files(tmp_path):
+    jobs = [
+        PageJob(_article_page, ("Café",), path=tmp_path / "posts" / "cafe.html"),
+        PageJob(Element.fragment, (["plain"],)),
+    ]
+    report = render_many(jobs, processes=1)
+    assert report.results == [None, "plain"]
+    written = (tmp_path / "posts" / "cafe.html").read_bytes()
+    assert written == "<article><h1>Café</h1><p /></article>".encode()
+
+
+def test_render_many_process_pool():
+    jobs = [PageJob(Element.fragment, ([f"page {i}"],)) for i in range(10)]
+    report = render_many(jobs, processes=2, chunksize=3)
+    assert report.results == [f"page {i}" for i in range(10)]
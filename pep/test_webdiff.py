@@ -0,0 +1,179 @@
+import random
+
+from .web import Element, Markup, html
+from .webdiff import (
+    InsertChild,
+    MoveChild,
+    RemoveAttribute,
+    RemoveChild,
+    ReplaceNode,
+    ReplaceText,
+    SetAttribute,
+    apply_patches,
+    diff,
+)
+
+
+def _check(old: Element, new: Element) -> list:
+    patches = diff(old, new)
+    patched = apply_patches(old, patches)
+    assert isinstance(patched, Element)
+    # The patched tree may have fragments spliced in where `new` has them
+    assert diff(patched, new) == []
+    # Which renders as `new` does, once that is in the browser's form (where,
+    # say, an element whose children are all empty text has no children)
+    assert str(patched) == str(apply_patches(new, []))
+    return patches
+
+
+def _items(*keys: str) -> Element:
+    return Element(
+        "ul", {}, [Element("li", {"data-key": key}, [f"Item {key}"]) for key in keys]
+    )
+
+
+def test_diff_identical():
+    tree = html(t"<div><p>{'hello'}</p></div>")
+    assert _check(tree, tree) == []
+    assert _check(tree, html(t"<div><p>{'hello'}</p></div>")) == []
+
+
+def test_diff_text():
+    old = html(t"<div><p>{'hello'}</p></div>")
+    new = html(t"<div><p>{'goodbye'}</p></div>")
+    assert _check(old, new) == [ReplaceText((0, 0), "goodbye")]
+
+
+def test_diff_attributes():
+    old = Element("a", {"href": "/", "title": "Home", "hidden": None}, [])
+    new = Element("a", {"href": "/about", "hidden": None, "class": "x"}, [])
+    assert _check(old, new) == [
+        RemoveAttribute((), "title"),
+        SetAttribute((), "href", "/about"),
+        SetAttribute((), "class", "x"),
+    ]
+
+
+def test_diff_replace_node():
+    old = Element("div", {}, [Element("p", {}, ["x"]), "text"])
+    new = Element("div", {}, [Element("span", {}, ["x"]), Element("b", {}, [])])
+    assert _check(old, new) == [
+        ReplaceNode((0,), Element("span", {}, ["x"])),
+        ReplaceNode((1,), Element("b", {}, [])),
+    ]
+    assert _check(old, Element("section", {}, [])) == [
+        ReplaceNode((), Element("section", {}, []))
+    ]
+
+
+def test_diff_keyed_insert_and_remove():
+    assert _check(_items("a", "b", "c"), _items("a", "x", "c")) == [
+        RemoveChild((), 1),
+        InsertChild((), 1, Element("li", {"data-key": "x"}, ["Item x"])),
+    ]
+
+
+def test_diff_keyed_move():
+    patches = _check(_items("a", "b", "c", "d"), _items("d", "a", "b", "c"))
+    assert patches == [MoveChild((), 3, 0)]
+
+
+def test_diff_keyed_move_with_change():
+    old = _items("a", "b")
+    new = Element(
+        "ul",
+        {},
+        [Element("li", {"data-key": "b"}, ["Changed"]), old.children[0]],
+    )
+    assert _check(old, new) == [MoveChild((), 1, 0), ReplaceText((0, 0), "Changed")]
+
+
+def test_diff_unkeyed_children():
+    old = Element("div", {}, ["a", Element("br", {}, []), "b"])
+    new = Element("div", {}, ["a", Element("br", {}, []), "c", "d"])
+    # Adjacent text is a single text node in the browser
+    assert _check(old, new) == [ReplaceText((2,), "cd")]
+
+
+def test_diff_fragments():
+    old = html(t"<ul>{['a', 'b']}<li>{'x'}</li></ul>")
+    new = html(t"<ul>{['a', 'c']}<li>{'y'}</li></ul>")
+    patches = _check(old, new)
+    assert patches == [ReplaceText((0,), "ac"), ReplaceText((1, 0), "y")]
+    assert [patch.to_json() for patch in patches] == [
+        ["text", [0], "ac"],
+        ["text", [1, 0], "y"],
+    ]
+
+    rows = [t"<li data-key={k}>{k}</li>" for k in "abc"]
+    reordered = [t"<li data-key={k}>{k}</li>" for k in "cab"]
+    old = html(t"<ul><li>{'first'}</li>{rows}</ul>")
+    new = html(t"<ul><li>{'first'}</li>{reordered}</ul>")
+    assert _check(old, new) == [MoveChild((), 3, 1)]
+
+
+def test_diff_lazy_children():
+    before = (t"<li>{k}</li>" for k in "ab")
+    after = (t"<li>{k}</li>" for k in "ac")
+    old = html(t"<ul>{before}</ul>")
+    new = html(t"<ul>{after}</ul>")
+    assert diff(old, new) == [ReplaceText((1, 0), "c")]
+
+
+def test_diff_markup():
+    old = html(t"<p>{Markup('<b>x</b>')}</p>")
+    new = html(t"<p>{Markup('<b>y</b>')}</p>")
+    patches = _check(old, new)
+    assert patches == [ReplaceNode((0,), Markup("<b>y</b>"))]
+    assert patches[0].to_json() == ["replace", [0], ["html", "<b>y</b>"]]
+    # Markup and equal plain text are different nodes
+    assert _check(new, html(t"<p>{'<b>y</b>'}</p>")) == [ReplaceNode((0,), "<b>y</b>")]
+
+
+def test_diff_random_lists():
+    rng = random.Random(750)
+    keys = [str(i) for i in range(30)]
+    for _ in range(200):
+        old = rng.sample(keys, rng.randint(0, 15))
+        new = rng.sample(keys, rng.randint(0, 15))
+        _check(_items(*old), _items(*new))
+
+
+def test_diff_text_left_next_to_text():
+    old = html(t"<p><b>{'New'}</b>Hello</p>")
+    new = html(t"<p>Hello<b>{'New'}</b></p>")
+    assert _check(old, new) == [
+        ReplaceNode((0,), "Hello"),
+        ReplaceNode((1,), Element("b", {}, ["New"])),
+    ]
+
+
+def _random_tree(rng: random.Random, depth: int = 0) -> Element:
+    children: list[str | Element] = []
+    for _ in range(rng.randint(0, 4)):
+        choice = rng.random()
+        if choice < 0.35:
+            children.append(rng.choice(["a", "b", "Hello", ""]))
+        elif choice < 0.45:
+            children.append(Markup(rng.choice(["<i>x</i>", "&amp;"])))
+        elif depth < 3 and choice < 0.6:
+            children.append(Element.fragment(_random_tree(rng, depth + 1).children))
+        elif depth < 3:
+            attributes = {"data-key": rng.choice("xyz")} if rng.random() < 0.3 else {}
+            tag = rng.choice(["b", "i", "li"])
+            element = _random_tree(rng, depth + 1)
+            children.append(Element(tag, attributes, element.children))
+    return Element("div", {}, children)
+
+
+def test_diff_random_trees():
+    rng = random.Random(16)
+    for _ in range(2000):
+        _check(_random_tree(rng), _random_tree(rng))
+
+
+def test_patch_to_json():
+    patches = diff(_items("a"), _items("b", "a"))
+    assert [patch.to_json() for patch in patches] == [
+        ["insert", [], 0, ["html", '<li data-key="b">Item b</li>']],
+    ]
@@ -0,0 +1,227 @@
+import asyncio
+from string.templatelib import Template
+
+import pytest
+
+from .web import Element, html
+from .webserve import (
+    ASGIResponse,
+    ASGITestClient,
+    WSGIResponse,
+    WSGITestClient,
+    _headers,
+)
+
+
+def _page(rows: int) -> Template:
+    items = [t"<li>{f'Item {i} & co'}</li>" for i in range(rows)]
+    return t"<html><body><ul>{items}</ul></body></html>"
+
+
+async def _fragment(name: str, delay: float) -> Template:
+    await asyncio.sleep(delay)
+    return t"<section>{name}</section>"
+
+
+def _async_page() -> Template:
+    slow = _fragment("Slow", 0.05)
+    return t"<html><body><h1>{'Title'}</h1>{slow}</body></html>"
+
+
+def test_asgi_streams_template():
+    app = ASGIResponse(_page(1000), headers=[("Cache-Control", "no-cache")])
+    response = ASGITestClient(app).get()
+    assert response.status == 200
+    assert response.header("content-type") == "text/html; charset=utf-8"
+    assert response.header("cache-control") == "no-cache"
+    assert response.header("content-length") is None
+    assert response.text == str(html(_page(1000)))
+    # Several chunks, and an empty one to end the body
+    assert len(response.chunks) > 2
+    assert response.chunks[-1] == b""
+
+
+def test_asgi_element_not_streamed():
+    element = html(_page(10))
+    response = ASGITestClient(ASGIResponse(element, status=404, stream=False)).get()
+    assert response.status == 404
+    assert response.body == bytes(element)
+    assert response.header("content-length") == str(len(bytes(element)))
+    assert response.header("etag") is not None
+    assert len(response.chunks) == 1
+
+
+def test_asgi_async_template():
+    response = ASGITestClient(ASGIResponse(_async_page())).get()
+    assert response.text == (
+        "<html><body><h1>Title</h1><section>Slow</section></body></html>"
+    )
+    # The heading went out before the slow fragment was ready
+    assert response.chunks[0] == b"<html><body><h1>Title</h1>"
+    assert response.first_chunk < 0.05 <= response.total
+
+
+def test_asgi_awaitable_content():
+    async def view() -> Element:
+        return html(t"<p>{'Hello'}</p>")
+
+    response = ASGITestClient(ASGIResponse(view(), stream=False)).get()
+    assert response.text == "<p>Hello</p>"
+
+
+def test_asgi_back_pressure():
+    rendered: list[int] = []
+
+    def rows():
+        for i in range(5):
+            rendered.append(i)
+            yield t"<li>{str(i)}</li>"
+
+    sent: list[int] = []
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.body":
+            # Only what has been sent so far has been rendered
+            sent.append(len(rendered))
+
+    async def receive() -> dict:
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    app = ASGIResponse(t"<ul>{rows()}</ul>", buffer_size=0)
+    asyncio.run(app({"type": "http"}, receive, send))
+    # Each row was rendered only once the chunk before it had been sent
+    assert sent[0] == 0 and sent[-1] == 5
+    assert all(0 <= later - earlier <= 1 for earlier, later in zip(sent, sent[1:]))
+
+
+def test_asgi_disconnect_stops_rendering():
+    rendered: list[int] = []
+
+    def rows():
+        for i in range(100):
+            rendered.append(i)
+            yield t"<li>{str(i)}</li>"
+
+    async def main() -> None:
+        disconnect = asyncio.Event()
+
+        async def receive() -> dict:
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            if len(rendered) >= 10:
+                disconnect.set()
+            await asyncio.sleep(0)
+
+        app = ASGIResponse(t"<ul>{rows()}</ul>", buffer_size=0)
+        await app({"type": "http"}, receive, send)
+
+    asyncio.run(main())
+    assert len(rendered) < 15
+
+
+def test_wsgi_streams_template():
+    app = WSGIResponse(_page(1000), status=201)
+    response = WSGITestClient(app).get()
+    assert response.status == 201
+    assert response.header("Content-Type") == "text/html; charset=utf-8"
+    assert response.text == str(html(_page(1000)))
+    assert len(response.chunks) > 1
+
+
+def test_wsgi_not_streamed():
+    response = WSGITestClient(WSGIResponse(_page(10), stream=False)).get()
+    assert response.body == bytes(html(_page(10)))
+    assert response.header("Content-Length") == str(len(response.body))
+    assert response.header("ETag") is not None
+
+
+def test_wsgi_async_template():
+    response = WSGITestClient(WSGIResponse(_async_page())).get()
+    assert response.text == (
+        "<html><body><h1>Title</h1><section>Slow</section></body></html>"
+    )
+    assert response.first_chunk < 0.05 <= response.total
+
+
+def test_wsgi_back_pressure():
+    rendered: list[int] = []
+
+    def rows():
+        for i in range(100):
+            rendered.append(i)
+            yield t"<li>{str(i)}</li>"
+
+    chunks = WSGIResponse(t"<ul>{rows()}</ul>", buffer_size=0)(
+        {}, lambda status, headers: None
+    )
+    iterator = iter(chunks)
+    next(iterator)
+    next(iterator)
+    assert len(rendered) == 1
+    chunks.close()  # type: ignore
+    assert len(rendered) == 1
+
+
+def test_headers_override():
+    headers = _headers([("X-Frame", "DENY"), ("content-length", "9")], 3, '"e"')
+    assert headers == [
+        ("X-Frame", "DENY"),
+        ("Content-Type", "text/html; charset=utf-8"),
+        ("Content-Length", "3"),
+        ("ETag", '"e"'),
+    ]
+    # A Content-Type given by the caller is kept
+    headers = _headers([("content-type", "image/svg+xml"), ("X-Frame", "DENY")], 3)
+    assert headers == [
+        ("content-type", "image/svg+xml"),
+        ("X-Frame", "DENY"),
+        ("Content-Length", "3"),
+    ]
+
+
+def _Broken(attributes: object, children: object) -> Element:
+    raise ValueError("broken")
+
+
+def _broken_rows():
+    yield t"<li>{'fine'}</li>"
+    raise ValueError("broken")
+
+
+def _broken_pages() -> list[Template]:
+    # Each fails before its first chunk is ready: in a component, in a lazy
+    # list of rows, and in a component around a value that's awaited
+    return [
+        t"<main><{_Broken} /></main>",
+        t"<ul>{_broken_rows()}</ul>",
+        t"<{_Broken}>{_fragment('x', 0)}</{_Broken}>",
+    ]
+
+
+def test_asgi_error_before_start():
+    for stream in (True, False):
+        for content in _broken_pages():
+            messages: list[dict] = []
+
+            async def send(message: dict) -> None:
+                messages.append(message)
+
+            async def receive() -> dict:
+                await asyncio.sleep(1)
+                return {"type": "http.disconnect"}
+
+            app = ASGIResponse(content, stream=stream)
+            with pytest.raises(ValueError):
+                asyncio.run(app({"type": "http"}, receive, send))
+            # Nothing was sent, so the server can still send a 500
+            assert messages == []
+
+
+def test_wsgi_error_before_start():
+    for stream in (True, False):
+        for content in _broken_pages():
+            with pytest.raises(ValueError):
+                WSGITestClient(WSGIResponse(content, stream=stream)).get()
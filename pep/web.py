@@ -10,18 +10,53 @@ Because this is example code, we limit the set of HTML features we support;
 we can imagine a *lot* of additional features that a more complete system
 would ideally support.
 
-We also attempt to avoid using external libraries, or parsing to multiple
-intermediate representations, to keep the code as simple as possible.
+We also attempt to avoid using external libraries to keep the code as simple
+as possible. We do allow ourselves one intermediate representation: each
+distinct template "shape" (its static strings) is parsed once into a compiled
+form that remembers where each interpolation sits, so that rendering the same
+t-string literal again only needs to substitute new values.
 """
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import inspect
+import io
+import json
+import os
 import re
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass, field
-from html import escape
-from html.parser import HTMLParser
+from datetime import date, datetime
+from datetime import time as time_of_day
+from decimal import Decimal
+from enum import IntEnum, auto
+from fractions import Fraction
+from functools import cached_property, lru_cache, update_wrapper
+from html import escape, unescape
+from pathlib import Path
 from string.templatelib import Interpolation, Template
-from typing import Callable, Literal, Mapping, Sequence, cast
+from sys import intern
+from typing import (
+    IO,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Protocol,
+    Sequence,
+    cast,
+)
 
 
 class HTMLParseError(Exception):
@@ -30,14 +65,54 @@ class HTMLParseError(Exception):
     pass
 
 
+class RenderLimitExceeded(Exception):
+    """Building or rendering HTML went over a limit set with `render_limits()`."""
+
+    def __init__(self, limit: str, value: float) -> None:
+        super().__init__(f"Exceeded the {limit} limit of {value}")
+        self.limit = limit
+        self.value = value
+
+
+class Markup(str):
+    """
+    A string of trusted HTML, which is rendered as-is rather than escaped.
+
+    Use this for markup that is already safe, such as HTML rendered earlier
+    and cached. Never wrap untrusted input in `Markup`.
+    """
+
+    __slots__ = ()
+
+    def __html__(self) -> Markup:
+        """Return the markup itself (the protocol shared with other libraries)."""
+        return self
+
+
 # ---------------------------------------------------------------------------
 # Utility code to render parts of an HTML element
 # ---------------------------------------------------------------------------
 
 
+def _escape_text(text: str) -> str:
+    """Escape text content, unless it's trusted or has nothing to escape."""
+    if isinstance(text, Markup) or not ("&" in text or "<" in text or ">" in text):
+        return text
+    return escape(text, quote=False)
+
+
+def _escape_attribute_value(value: str) -> str:
+    """Escape a quoted attribute value, unless it's trusted or already safe."""
+    if isinstance(value, Markup) or not (
+        "&" in value or "<" in value or ">" in value or '"' in value or "'" in value
+    ):
+        return value
+    return escape(value, quote=True)
+
+
 def _render_str_attribute(key: str, value: str) -> str:
-    """Render a string attribute and its untrusted value."""
-    return f'{key}="{escape(value, quote=True)}"'
+    """Render a string attribute and its (possibly untrusted) value."""
+    return f'{key}="{_escape_attribute_value(value)}"'
 
 
 def _render_none_attribute(key: str) -> str:
@@ -57,16 +132,29 @@ def _render_attributes_mapping(mapping: Mapping[str, str | None]) -> str:
     return " ".join(_render_attribute(key, value) for key, value in mapping.items())
 
 
-def _render_children(children: Sequence[str | Element]) -> str:
-    """Render a sequence of children."""
-    parts = []
-    for child in children:
-        if isinstance(child, Element):
-            parts.append(str(child))
-        else:
-            child = escape(child, quote=False)
-            parts.append(child)
-    return "".join(parts)
+def _render_start_tag(element: Element) -> str:
+    """Render the start tag of an element, which may also be its end."""
+    attributes_str = _render_attributes_mapping(element.attributes)
+    start = f"<{element.tag} {attributes_str}" if attributes_str else f"<{element.tag}"
+    # If there's no children, render the tag directly
+    return f"{start}>" if element.children else f"{start} />"
+
+
+def _open_element(element: Element) -> tuple[str, str | None]:
+    """
+    Render the markup that opens an element.
+
+    Also return the end tag if the children still need to be rendered, or
+    None if the opening markup is all there is.
+    """
+    if element._markup is not None:
+        return element._markup, None
+    if not element.tag:
+        # If there's no tag, render the children directly
+        return "", ""
+    # TODO handle indentation and pretty-printing
+    start = _render_start_tag(element)
+    return (start, f"</{element.tag}>") if element.children else (start, None)
 
 
 # ---------------------------------------------------------------------------
@@ -74,7 +162,68 @@ def _render_children(children: Sequence[str | Element]) -> str:
 # ---------------------------------------------------------------------------
 
 
-@dataclass(frozen=True)
+class _Attributes(Mapping[str, str | None]):
+    """
+    A compact, read-only mapping of attributes, stored as a tuple of pairs.
+
+    Elements rarely have more than a handful of attributes, so a linear
+    search is fine, and the pairs take much less memory than a dict.
+    """
+
+    __slots__ = ("pairs",)
+
+    def __init__(self, pairs: tuple[tuple[str, str | None], ...]) -> None:
+        self.pairs = pairs
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping[str, str | None]) -> _Attributes:
+        """Copy a mapping, interning its names."""
+        if not mapping:
+            return _NO_ATTRIBUTES
+        return cls(
+            tuple(
+                [
+                    (intern(name) if type(name) is str else name, value)
+                    for name, value in mapping.items()
+                ]
+            )
+        )
+
+    def __getitem__(self, name: str) -> str | None:
+        for key, value in self.pairs:
+            if key == name:
+                return value
+        raise KeyError(name)
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        # Avoid the KeyError that Mapping.get() relies on for missing names
+        for key, value in self.pairs:
+            if key == name:
+                return value
+        return default
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, _ in self.pairs)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def items(self) -> tuple[tuple[str, str | None], ...]:  # type: ignore[override]
+        """Return the (name, value) pairs, in order."""
+        return self.pairs
+
+    def __repr__(self) -> str:
+        return repr(dict(self.pairs))
+
+    def __hash__(self) -> int:
+        # Equality ignores order (as for a dict), so the hash must too
+        return hash(frozenset(self.pairs))
+
+
+_NO_ATTRIBUTES = _Attributes(())
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True, eq=False)
 class Element:
     """
     A simple representation of an HTML element.
@@ -86,51 +235,744 @@ class Element:
 
     Hopefully it's a useful starting point for thinking about how to build
     a more robust HTML templating system.
+
+    To keep large trees small, elements are stored compactly: the tag and
+    attribute names are interned, the attributes are kept as a tuple of
+    pairs behind a read-only mapping, and the children as a tuple.
     """
 
     tag: str  # An empty string indicates a fragment
     attributes: Mapping[str, str | None]
     children: Sequence[str | Element]
+    # The HTML of a static subtree, rendered once and shared by every render
+    _markup: str | None = field(default=None, init=False, repr=False, compare=False)
+    # The structural hash, computed when first needed
+    _hash: int | None = field(default=None, init=False, repr=False, compare=False)
+    # The index of the tree, built by the first query
+    _index: ElementIndex | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @classmethod
     def empty(cls) -> Element:
         """Create an empty element."""
-        return cls("", {}, [])
+        return cls("", _NO_ATTRIBUTES, ())
 
     @classmethod
     def fragment(cls, children: Sequence[str | Element]) -> Element:
         """Create a fragment element (empty tag)."""
-        return cls("", {}, list(children))
+        return cls("", _NO_ATTRIBUTES, tuple(children))
 
     def __post_init__(self):
-        """Validate the element after it's been created."""
-        if self.attributes and not self.tag:
+        """Validate the element after it's been created, and compact it."""
+        if not self.tag and self.attributes:
             raise ValueError("Fragments cannot have attributes, only children")
+        # The dataclass is frozen, so fields must be replaced the hard way
+        tag = intern(self.tag) if type(self.tag) is str else self.tag
+        if tag is not self.tag:
+            object.__setattr__(self, "tag", tag)
+        if type(self.attributes) is not _Attributes:
+            attributes = _Attributes.from_mapping(self.attributes)
+            object.__setattr__(self, "attributes", attributes)
+        # Lazy children stay lazy; anything else becomes a tuple
+        if type(self.children) is not tuple and not isinstance(
+            self.children, _LazyChildren
+        ):
+            object.__setattr__(self, "children", tuple(self.children))
+
+    def __eq__(self, other: object) -> bool:
+        """Compare elements structurally."""
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        other = cast(Element, other)
+        if (
+            self._hash is not None
+            and other._hash is not None
+            and self._hash != other._hash
+        ):
+            return False
+        return (
+            self.tag == other.tag
+            and self.attributes == other.attributes
+            and self.children == other.children
+        )
+
+    def __hash__(self) -> int:
+        """Hash the element structurally, caching the result."""
+        if self._hash is None:
+            value = hash((self.tag, self.attributes, self.children))
+            object.__setattr__(self, "_hash", value)
+        return cast(int, self._hash)
 
     def append(self, child: str | Element) -> Element:
         """Append a child to the element."""
-        return Element(self.tag, self.attributes, list(self.children) + [child])
+        return Element(self.tag, self.attributes, (*self.children, child))
+
+    def iter_chunks(self) -> Iterator[str]:
+        """
+        Render the element to HTML, one chunk at a time, in document order.
+
+        Each piece of markup is rendered exactly once, so the full HTML string
+        never needs to exist in memory unless the caller builds it.
+        """
+        if (budget := _budget.get()) is not None:
+            yield from _limited_chunks((self,), budget)
+            return
+        start, end = _open_element(self)
+        if start:
+            yield start
+        if end is None:
+            return
+        # Walk the tree with an explicit stack of the ancestors' remaining
+        # children, so that deep trees don't hit the recursion limit
+        stack: list[tuple[Iterator[str | Element], str]] = []
+        children: Iterator[str | Element] = iter(self.children)
+        while True:
+            for child in children:
+                if not isinstance(child, Element):
+                    yield _escape_text(child)
+                    continue
+                start, child_end = _open_element(child)
+                if start:
+                    yield start
+                if child_end is not None:
+                    stack.append((children, end))
+                    children, end = iter(child.children), child_end
+                    break
+            else:
+                if end:
+                    yield end
+                if not stack:
+                    return
+                children, end = stack.pop()
+
+    def render_into(self, write: Callable[[str], object]) -> None:
+        """
+        Render the element to HTML, passing each chunk to `write`.
+
+        `write` may be, for instance, the `write()` method of a text file or
+        the `append()` method of a list. This produces the same chunks as
+        `iter_chunks()`, but avoids the overhead of a generator.
+        """
+        if (budget := _budget.get()) is not None:
+            _render_limited(self, write, budget)
+            return
+        start, end = _open_element(self)
+        if start:
+            write(start)
+        if end is None:
+            return
+        # The same walk as in iter_chunks(), with _open_element() inlined
+        stack: list[tuple[Iterator[str | Element], str]] = []
+        children: Iterator[str | Element] = iter(self.children)
+        while True:
+            for child in children:
+                if not isinstance(child, Element):
+                    write(_escape_text(child))
+                    continue
+                if child._markup is not None:
+                    write(child._markup)
+                    continue
+                if tag := child.tag:
+                    write(_render_start_tag(child))
+                    grandchildren = child.children
+                    if not grandchildren:
+                        continue
+                    if (
+                        type(grandchildren) is tuple
+                        and len(grandchildren) == 1
+                        and not isinstance(grandchildren[0], Element)
+                    ):
+                        # A common leaf, like <td>text</td>, needs no frame
+                        write(_escape_text(grandchildren[0]))
+                        write(f"</{tag}>")
+                        continue
+                    stack.append((children, end))
+                    children, end = iter(child.children), f"</{tag}>"
+                else:
+                    stack.append((children, end))
+                    children, end = iter(child.children), ""
+                break
+            else:
+                if end:
+                    write(end)
+                if not stack:
+                    return
+                children, end = stack.pop()
+
+    def render_bytes_into(self, write: Callable[[bytes], object]) -> None:
+        """
+        Render the element to UTF-8 encoded HTML, passing each chunk to `write`.
+
+        The chunks are the same as those of `render_into()`, but encoded.
+        """
+        self.render_into(lambda chunk: write(chunk.encode()))
 
     def __str__(self) -> str:
         """Render the element to an HTML string."""
-        # If there's no tag, render the children directly
-        if not self.tag:
-            return _render_children(self.children)
+        if self._markup is not None:
+            if (budget := _budget.get()) is not None:
+                # Charged as render_into() would: one node, and its HTML
+                budget.render_node(1)
+                budget.render_chunk(self._markup)
+            return self._markup
+        if _hooks:
+            return _timed_render(_element_shape(self), self._render_str)
+        return self._render_str()
+
+    def _render_str(self) -> str:
+        """Render the element to an HTML string, without instrumentation."""
+        buffer = io.StringIO()
+        self.render_into(buffer.write)
+        return buffer.getvalue()
+
+    def __bytes__(self) -> bytes:
+        """Render the element to UTF-8 encoded HTML."""
+        # Encoding the whole page at once is cheaper than encoding each chunk
+        return str(self).encode()
+
+    # Queries use an index of the tree, built on first use (see ElementIndex)
+
+    def find_by_id(self, value: str) -> Element | None:
+        """Return the first element in the tree whose id is `value`, if any."""
+        return ElementIndex.of(self).find_by_id(value)
+
+    def find_all_by_class(self, name: str) -> list[Element]:
+        """Return the elements in the tree that have the class `name`."""
+        return ElementIndex.of(self).find_all_by_class(name)
+
+    def find_all_by_tag(self, tag: str) -> list[Element]:
+        """Return the elements in the tree with the given tag."""
+        return ElementIndex.of(self).find_all_by_tag(tag)
+
+    def select(self, selector: str) -> list[Element]:
+        """Return the elements in the tree that match a CSS selector."""
+        return ElementIndex.of(self).select(selector)
+
+    def select_one(self, selector: str) -> Element | None:
+        """Return the first element in the tree that matches a CSS selector."""
+        return ElementIndex.of(self).select_one(selector)
+
+
+class ElementPool:
+    """
+    A pool that shares one instance of each distinct Element structure.
+
+    Interning a tree returns an equal tree in which identical subtrees (say,
+    repeated icons or rows) are the same object, which saves memory and lets
+    equality checks stop at identity. The pool only holds weak references,
+    so elements that are no longer used elsewhere are dropped from it.
+    """
+
+    def __init__(self) -> None:
+        self._elements: weakref.WeakValueDictionary[tuple, Element] = (
+            weakref.WeakValueDictionary()
+        )
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def intern(self, element: Element) -> Element:
+        """Return the pool's instance of `element`, adding it if needed."""
+        if isinstance(element.children, _LazyChildren):
+            # Interning would consume the children
+            return element
+        # Intern children before their parents, walking the tree with an
+        # explicit stack so that deep trees don't hit the recursion limit.
+        # Each frame is an element, its remaining children, and those of its
+        # children interned so far.
+        stack: list[tuple[Element, Iterator[str | Element], list[str | Element]]] = []
+        current, pending, done = element, iter(element.children), []
+        while True:
+            for child in pending:
+                if isinstance(child, Element) and not isinstance(
+                    child.children, _LazyChildren
+                ):
+                    stack.append((current, pending, done))
+                    current, pending, done = child, iter(child.children), []
+                    break
+                done.append(child)
+            else:
+                interned = self._intern_node(current, tuple(done))
+                if not stack:
+                    return interned
+                current, pending, done = stack.pop()
+                done.append(interned)
+
+    def _intern_node(
+        self, element: Element, children: tuple[str | Element, ...]
+    ) -> Element:
+        """Intern an element whose children have been interned already."""
+        # Interned children are canonical, so they can be keyed by identity.
+        # Trusted markup is kept apart from equal plain strings.
+        key = (
+            element.tag,
+            _attributes_key(element.attributes),
+            tuple(
+                id(child) if isinstance(child, Element) else _value_key(child)
+                for child in children
+            ),
+        )
+        if (interned := self._elements.get(key)) is not None:
+            return interned
+        if any(new is not old for new, old in zip(children, element.children)):
+            element = Element(element.tag, element.attributes, children)
+        return self._elements.setdefault(key, element)
+
+
+_element_pool = ElementPool()
+
+
+def intern_element(element: Element) -> Element:
+    """Intern an Element tree in the default, module-wide pool."""
+    return _element_pool.intern(element)
+
+
+# ---------------------------------------------------------------------------
+# Indexed queries over a (frozen) Element tree
+# ---------------------------------------------------------------------------
+
+
+class ElementIndex:
+    """
+    An index of the elements in a tree by id, class and tag.
 
-        attributes_str = _render_attributes_mapping(self.attributes)
+    Elements are numbered in document order (the tree itself included,
+    fragments left out), so query results come back in document order, and
+    an element that appears more than once in the tree (like a shared static
+    subtree) is found at each of its places. Since Elements are immutable,
+    the index never goes stale; `ElementIndex.of()` builds it once per tree.
+    """
 
-        # If there's no children, render the tag directly
-        if not self.children:
-            if attributes_str:
-                return f"<{self.tag} {attributes_str} />"
-            return f"<{self.tag} />"
+    def __init__(self, root: Element) -> None:
+        self.elements: list[Element] = []
+        # The position of each element's parent, or -1 for the top
+        self.parents: list[int] = []
+        self.by_id: dict[str, list[int]] = {}
+        self.by_class: dict[str, list[int]] = {}
+        self.by_tag: dict[str, list[int]] = {}
+        # Walk the tree with an explicit stack, so deep trees are fine
+        stack: list[tuple[Element, int]] = [(root, -1)]
+        while stack:
+            element, parent = stack.pop()
+            if element.tag:
+                position = len(self.elements)
+                self.elements.append(element)
+                self.parents.append(parent)
+                self._add(element, position)
+                parent = position
+            children = element.children
+            if isinstance(children, _LazyChildren):
+                raise TypeError("Can't index children produced by an iterator")
+            stack.extend(
+                (child, parent)
+                for child in reversed(children)
+                if isinstance(child, Element)
+            )
+
+    def _add(self, element: Element, position: int) -> None:
+        """Add an element's id, classes and tag to the lookup tables."""
+        self.by_tag.setdefault(element.tag, []).append(position)
+        attributes = element.attributes
+        if not attributes:
+            return
+        if isinstance(value := attributes.get("id"), str):
+            self.by_id.setdefault(value, []).append(position)
+        if isinstance(value := attributes.get("class"), str):
+            for name in dict.fromkeys(value.split()):
+                self.by_class.setdefault(name, []).append(position)
+
+    @staticmethod
+    def of(element: Element) -> ElementIndex:
+        """Return the (cached) index of a tree."""
+        index = element._index
+        if index is None:
+            # Kept on the element itself, so it lives exactly as long as the
+            # tree does
+            index = ElementIndex(element)
+            object.__setattr__(element, "_index", index)
+        return index
+
+    def find_by_id(self, value: str) -> Element | None:
+        """Return the first element whose id is `value`, if any."""
+        positions = self.by_id.get(value)
+        return self.elements[positions[0]] if positions else None
+
+    def find_all_by_class(self, name: str) -> list[Element]:
+        """Return the elements that have the class `name`."""
+        return [self.elements[p] for p in self.by_class.get(name, ())]
+
+    def find_all_by_tag(self, tag: str) -> list[Element]:
+        """Return the elements with the given tag."""
+        return [self.elements[p] for p in self.by_tag.get(tag, ())]
+
+    def select(self, selector: str) -> list[Element]:
+        """
+        Return the elements that match a CSS selector, in document order.
+
+        Supported: type (`p`, `*`), id (`#main`), class (`.nav`) and attribute
+        (`[href]`, `[type=text]`) selectors, combined (`a.nav[href]`), with
+        descendant (`nav a`) and child (`ul > li`) combinators, in lists
+        (`h1, h2`).
+        """
+        positions: set[int] = set()
+        for complex_selector in _parse_selector(selector):
+            positions.update(self._select(complex_selector))
+        return [self.elements[p] for p in sorted(positions)]
+
+    def select_one(self, selector: str) -> Element | None:
+        """Return the first element that matches a CSS selector, if any."""
+        elements = self.select(selector)
+        return elements[0] if elements else None
+
+    def _candidates(self, compound: _Compound) -> Iterable[int]:
+        """Narrow down the elements that might match, using the tables."""
+        if compound.ids:
+            return self.by_id.get(compound.ids[0], ())
+        if compound.classes:
+            return self.by_class.get(compound.classes[0], ())
+        if compound.tag is not None:
+            return self.by_tag.get(compound.tag, ())
+        return range(len(self.elements))
+
+    def _select(self, selector: _ComplexSelector) -> Iterator[int]:
+        """Yield the positions of the elements matching a complex selector."""
+        compounds, combinators = selector
+        last = len(compounds) - 1
+        for position in self._candidates(compounds[last]):
+            if self._matches(position, selector, last):
+                yield position
+
+    def _matches(self, position: int, selector: _ComplexSelector, k: int) -> bool:
+        """Check the element at `position` against compounds up to `k`."""
+        compounds, combinators = selector
+        if not compounds[k].matches(self.elements[position]):
+            return False
+        if k == 0:
+            return True
+        parent = self.parents[position]
+        if combinators[k - 1] == ">":
+            return parent >= 0 and self._matches(parent, selector, k - 1)
+        while parent >= 0:
+            if self._matches(parent, selector, k - 1):
+                return True
+            parent = self.parents[parent]
+        return False
 
-        # Render the tag and children
-        # TODO handle indentation and pretty-printing
-        children_str = _render_children(self.children)
-        if attributes_str:
-            return f"<{self.tag} {attributes_str}>{children_str}</{self.tag}>"
-        return f"<{self.tag}>{children_str}</{self.tag}>"
+
+@dataclass(frozen=True)
+class _Compound:
+    """A compound selector, like `a.nav[href]`: all parts must match."""
+
+    tag: str | None
+    ids: tuple[str, ...]
+    classes: tuple[str, ...]
+    attributes: tuple[tuple[str, str | None], ...]
+
+    def matches(self, element: Element) -> bool:
+        """Return True if the element matches every part of the selector."""
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        attributes = element.attributes
+        for value in self.ids:
+            if attributes.get("id") != value:
+                return False
+        if self.classes:
+            names = attributes.get("class")
+            if not isinstance(names, str):
+                return False
+            present = names.split()
+            if not all(name in present for name in self.classes):
+                return False
+        for name, value in self.attributes:
+            if name not in attributes:
+                return False
+            if value is not None and attributes[name] != value:
+                return False
+        return True
+
+
+# Compound selectors, and the combinators (" " or ">") between them
+type _ComplexSelector = tuple[tuple[_Compound, ...], tuple[str, ...]]
+
+_SELECTOR_TOKEN = re.compile(
+    r"""
+    \s*(?P<combinator>[>,])\s*
+    | (?P<space>\s+)
+    | (?P<tag>\*|[a-zA-Z][\w-]*)
+    | \#(?P<id>[\w-]+)
+    | \.(?P<class>[\w-]+)
+    | \[\s*(?P<name>[\w:-]+)\s*
+        (?:=\s*(?:"(?P<double>[^"]*)"|'(?P<single>[^']*)'|(?P<bare>[\w-]+))\s*)?
+      \]
+    """,
+    re.VERBOSE,
+)
+
+
+@lru_cache(maxsize=256)
+def _parse_selector(selector: str) -> tuple[_ComplexSelector, ...]:
+    """Parse a selector list into its complex selectors."""
+    selectors: list[_ComplexSelector] = []
+    compounds: list[_Compound] = []
+    combinators: list[str] = []
+    parts: dict[str, list] = {"tag": [], "id": [], "class": [], "attribute": []}
+    # What separates the current compound from the previous one, if anything
+    pending: str | None = None
+
+    def end_compound() -> None:
+        nonlocal pending
+        if not any(parts.values()):
+            raise ValueError(f"Invalid selector: {selector!r}")
+        tags = [tag for tag in parts["tag"] if tag != "*"]
+        if len(parts["tag"]) > 1:
+            raise ValueError(f"Invalid selector: {selector!r}")
+        if compounds:
+            combinators.append(pending or " ")
+        compounds.append(
+            _Compound(
+                tag=tags[0].lower() if tags else None,
+                ids=tuple(parts["id"]),
+                classes=tuple(parts["class"]),
+                attributes=tuple(parts["attribute"]),
+            )
+        )
+        for values in parts.values():
+            values.clear()
+        pending = None
+
+    def end_selector() -> None:
+        if any(parts.values()):
+            end_compound()
+        if not compounds or pending is not None:
+            raise ValueError(f"Invalid selector: {selector!r}")
+        selectors.append((tuple(compounds), tuple(combinators)))
+        compounds.clear()
+        combinators.clear()
+
+    text = selector.strip()
+    position = 0
+    while position < len(text):
+        match = _SELECTOR_TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Invalid selector: {selector!r}")
+        position = match.end()
+        if (combinator := match["combinator"]) is not None:
+            if combinator == ",":
+                end_selector()
+                continue
+            if any(parts.values()):
+                end_compound()
+            if not compounds or pending is not None:
+                raise ValueError(f"Invalid selector: {selector!r}")
+            pending = ">"
+        elif match["space"] is not None:
+            if any(parts.values()):
+                end_compound()
+        elif (tag := match["tag"]) is not None:
+            if any(parts.values()):
+                # A type selector can only start a compound selector
+                raise ValueError(f"Invalid selector: {selector!r}")
+            parts["tag"].append(tag)
+        elif (value := match["id"]) is not None:
+            parts["id"].append(value)
+        elif (value := match["class"]) is not None:
+            parts["class"].append(value)
+        else:
+            quoted = match["double"] if match["double"] is not None else match["single"]
+            value = quoted if quoted is not None else match["bare"]
+            parts["attribute"].append((match["name"].lower(), value))
+    end_selector()
+    return tuple(selectors)
+
+
+# ---------------------------------------------------------------------------
+# The compiled intermediate representation of an HTML template
+# ---------------------------------------------------------------------------
+
+# A mix of static strings and interpolation indexes
+type _Parts = tuple[str | int, ...]
+
+
+@dataclass(frozen=True)
+class _CompiledAttribute:
+    """An attribute whose name and/or value may contain interpolations."""
+
+    name: str | _Parts
+    value: str | _Parts | None
+
+
+@dataclass(frozen=True)
+class _CompiledSpread:
+    """An interpolation that provides a mapping of attributes, like `{attrs}`."""
+
+    index: int
+
+
+@dataclass(frozen=True)
+class _CompiledText:
+    """A run of text content that contains interpolations."""
+
+    parts: _Parts
+
+
+@dataclass(frozen=True)
+class _EncodedStartTag:
+    """A start tag whose static markup is encoded ahead of time."""
+
+    # Encoded markup, alternating with attribute values that need substitution
+    pieces: tuple[bytes | _Parts, ...]
+    end_tag: bytes
+
+
+@dataclass(frozen=True)
+class _CompiledElement:
+    """An element whose tag, attributes, or children may contain interpolations."""
+
+    tag: str | _Parts
+    attributes: tuple[_CompiledAttribute | _CompiledSpread, ...]
+    children: tuple[str | _CompiledText | _CompiledElement, ...]
+    # For subtrees without interpolations, the Element every render shares
+    static: Element | None = field(default=None, compare=False, repr=False)
+
+    def is_static(self) -> bool:
+        """Return True if there are no interpolations in the subtree."""
+        return (
+            isinstance(self.tag, str)
+            and all(
+                isinstance(attribute, _CompiledAttribute)
+                and isinstance(attribute.name, str)
+                and not isinstance(attribute.value, tuple)
+                for attribute in self.attributes
+            )
+            # Static child elements were already built when they were compiled
+            and all(
+                isinstance(child, str)
+                or (isinstance(child, _CompiledElement) and child.static is not None)
+                for child in self.children
+            )
+        )
+
+    def prerender(self) -> None:
+        """Render a static subtree once, so later renders can reuse the HTML."""
+        if self.static is not None and self.static._markup is None:
+            # This is part of compiling, not a render of the caller's, so
+            # it's neither limited nor reported to hooks
+            token = _budget.set(None)
+            try:
+                markup = self.static._render_str()
+            finally:
+                _budget.reset(token)
+            object.__setattr__(self.static, "_markup", markup)
+
+    @cached_property
+    def encoded_static(self) -> bytes | None:
+        """The pre-rendered HTML of a static subtree, encoded."""
+        return str(self.static).encode() if self.static is not None else None
+
+    @cached_property
+    def encoded_start_tag(self) -> _EncodedStartTag | None:
+        """
+        Encode the static markup of the start and end tags, if possible.
+
+        Return None if the tag or an attribute name is interpolated, or if the
+        final set of attributes can't be known ahead of time.
+        """
+        if not isinstance(self.tag, str):
+            return None
+        names = set()
+        pieces: list[bytes | _Parts] = [f"<{self.tag}".encode()]
+        for attribute in self.attributes:
+            if isinstance(attribute, _CompiledSpread):
+                return None
+            if not isinstance(attribute.name, str) or attribute.name in names:
+                return None
+            names.add(attribute.name)
+            if isinstance(attribute.value, tuple):
+                pieces.append(f' {attribute.name}="'.encode())
+                pieces.append(attribute.value)
+                pieces.append(b'"')
+            else:
+                markup = _render_attribute(attribute.name, attribute.value)
+                pieces.append(f" {markup}".encode())
+        return _EncodedStartTag(tuple(pieces), f"</{self.tag}>".encode())
+
+    @cached_property
+    def encoded_children(self) -> tuple[bytes | _CompiledText | _CompiledElement, ...]:
+        """The children, with static text escaped and encoded ahead of time."""
+        return tuple(
+            escape(child, quote=False).encode() if isinstance(child, str) else child
+            for child in self.children
+        )
+
+
+@dataclass(frozen=True)
+class _CompiledTemplate:
+    """The compiled form of all templates that share the same static strings."""
+
+    root: _CompiledElement
+    # Start and end tag pairs that can only be checked once values are known
+    dynamic_end_tags: tuple[tuple[str | _Parts, str | _Parts], ...]
+
+    @cached_property
+    def size(self) -> tuple[int, int]:
+        """The number of elements in the template, and how deep they nest."""
+        count, depth = 0, 0
+        pending = [(self.root, 1)]
+        while pending:
+            compiled, level = pending.pop()
+            count += 1
+            depth = max(depth, level)
+            pending.extend(
+                (child, level + 1)
+                for child in compiled.children
+                if isinstance(child, _CompiledElement)
+            )
+        return count, depth
+
+    @cached_property
+    def static_markup(self) -> frozenset[str]:
+        """The HTML of the larger static subtrees, rendered once per shape."""
+        markup: set[str] = set()
+        pending = [self.root]
+        while pending:
+            compiled = pending.pop()
+            if compiled.static is not None:
+                rendered = compiled.static._markup
+                if rendered is not None and len(rendered) >= _MIN_PRECOMPRESSED:
+                    markup.add(rendered)
+                continue
+            pending.extend(
+                child
+                for child in compiled.children
+                if isinstance(child, _CompiledElement)
+            )
+        return frozenset(markup)
+
+
+def _make_parts(pieces: Sequence[str | int], strip: bool = False) -> str | _Parts:
+    """Join adjacent static strings; return a plain string if nothing is dynamic."""
+    if len(pieces) == 1 and isinstance(pieces[0], str):
+        return pieces[0].strip() if strip else pieces[0]
+    parts: list[str | int] = []
+    for piece in pieces:
+        if isinstance(piece, str) and parts and isinstance(parts[-1], str):
+            parts[-1] += piece
+        else:
+            parts.append(piece)
+    if strip and parts:
+        if isinstance(parts[0], str):
+            parts[0] = parts[0].lstrip()
+        if isinstance(parts[-1], str):
+            parts[-1] = parts[-1].rstrip()
+    parts = [part for part in parts if part != ""]
+    if not parts:
+        return ""
+    if len(parts) == 1 and isinstance(parts[0], str):
+        return parts[0]
+    return tuple(parts)
 
 
 # ---------------------------------------------------------------------------
@@ -138,67 +980,462 @@ class Element:
 # ---------------------------------------------------------------------------
 
 
-class HTMLTemplateParser(HTMLParser):
+# Elements whose content is raw text, which is neither parsed nor unescaped
+_RAW_TEXT_TAGS = frozenset({"script", "style"})
+
+# Complete tags that don't contain interpolations are parsed in one go
+_START_TAG_RE = re.compile(
+    r"""<([a-zA-Z][^\s/>]*)"""
+    r"""((?:\s+[^\s/>=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s>"'][^\s>]*))?)*)"""
+    r"""\s*(/?)>"""
+)
+_ATTRIBUTE_RE = re.compile(
+    r"""\s+([^\s/>=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"'][^\s>]*)))?"""
+)
+_END_TAG_RE = re.compile(r"</([a-zA-Z][^\s/>]*)\s*>")
+
+_SPACE_RE = re.compile(r"\s*")
+_TAG_NAME_RE = re.compile(r"[^\s/>]*")
+_ATTRIBUTE_NAME_RE = re.compile(r"[^\s/>=]*")
+_UNQUOTED_VALUE_RE = re.compile(r"[^\s>]*")
+
+
+class _State(IntEnum):
+    """Where in the HTML grammar the parser currently is."""
+
+    DATA = auto()
+    RAW_TEXT = auto()
+    COMMENT = auto()
+    DECLARATION = auto()
+    TAG_NAME = auto()
+    END_TAG_NAME = auto()
+    AFTER_END_TAG_NAME = auto()
+    BEFORE_ATTRIBUTE = auto()
+    ATTRIBUTE_NAME = auto()
+    AFTER_ATTRIBUTE_NAME = auto()
+    BEFORE_VALUE = auto()
+    UNQUOTED_VALUE = auto()
+    QUOTED_VALUE = auto()
+
+
+@dataclass(slots=True)
+class _ElementBuilder:
     """
-    A simple HTML parser that constructs a tree of `Element`s.
+    A mutable element that is still being parsed.
 
-    This builds on the Python standard library's HTMLParser. This is fine for
-    our example purposes, but is imperfect. For example, we want to allow
-    different kinds of interpolations in different parts of the HTML start tag
-    grammar. The standard library's HTMLParser doesn't give us that level of
-    control &mdash; it waits until it has parsed the whole tag before it calls
-    `handle_starttag()` &mdash; so we have to do some hacky things to work
-    around that.
+    Compiled elements are immutable, so appending children one at a time would
+    copy the children over and over again. Instead, the parser collects
+    children here and builds the element just once, when it sees the end tag.
+    """
 
-    A production system would need a more robust parser, but that's potentially
-    a lot of work! Hopefully this is a useful starting point for thinking about
-    how to build a more robust HTML templating system.
+    tag: str | _Parts
+    attributes: list[_CompiledAttribute | _CompiledSpread]
+    children: list[str | _CompiledText | _CompiledElement] = field(default_factory=list)
+
+    def build(self) -> _CompiledElement:
+        """Freeze the builder into a compiled element."""
+        # Intern static names once, so every Element built from them shares them
+        tag = intern(self.tag) if isinstance(self.tag, str) else self.tag
+        attributes = tuple(
+            (
+                _CompiledAttribute(intern(attribute.name), attribute.value)
+                if isinstance(attribute, _CompiledAttribute)
+                and isinstance(attribute.name, str)
+                else attribute
+            )
+            for attribute in self.attributes
+        )
+        children = tuple(self.children)
+        compiled = _CompiledElement(tag, attributes, children)
+        if compiled.is_static():
+            # Nothing to substitute, so the Element can be built right away
+            static = _build_element(compiled, ())
+            return _CompiledElement(tag, attributes, children, static)
+        # Pre-render the largest static subtrees only; their own static
+        # children are rendered as part of them
+        for child in children:
+            if isinstance(child, _CompiledElement):
+                child.prerender()
+        return compiled
+
+
+class HTMLTemplateParser:
+    """
+    A simple HTML parser that compiles a template's strings.
+
+    Like the standard library's `html.parser.HTMLParser`, you `feed()` it
+    text. Unlike `HTMLParser`, you also tell it where each interpolation goes
+    with `feed_interpolation()`. Because the parser always knows where in the
+    HTML grammar it is, it knows exactly what each interpolation stands for: a
+    (part of a) tag name, an attribute name or value, a mapping of attributes,
+    or content. A single pass over the template produces its compiled form.
+
+    This makes no attempt to implement the full HTML5 parsing algorithm; for
+    instance, it doesn't know about void elements like `<br>`, which must be
+    written `<br />`. A production system would need a more robust parser, but
+    that's potentially a lot of work! Hopefully this is a useful starting
+    point for thinking about how to build a more robust HTML templating system.
     """
 
-    root: Element | None
-    stack: list[Element]
-    in_start_tag: bool
+    state: _State
+    root: _CompiledElement | None
+    stack: list[_ElementBuilder]
+    dynamic_end_tags: list[tuple[str | _Parts, str | _Parts]]
 
     def __init__(self) -> None:
-        super().__init__()
-        self.stack = []
+        self.state = _State.DATA
         self.root = None
-        self.in_start_tag = False
-
-    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self.stack = []
+        self.dynamic_end_tags = []
+        # The pieces of the text, tag, attribute, or value currently being parsed
+        self.text: list[str | int] = []
+        self.tag: list[str | int] = []
+        self.attributes: list[_CompiledAttribute | _CompiledSpread] = []
+        self.attribute: list[str | int] = []
+        self.value: list[str | int] = []
+        self.quote = ""
+        self.raw_text_end: re.Pattern[str] | None = None
+
+    def feed(self, s: str) -> None:
+        """Parse a static string from the template."""
+        pos, end = 0, len(s)
+        while pos < end:
+            pos = self._HANDLERS[self.state](self, s, pos)
+
+    def feed_interpolation(self, index: int) -> None:
+        """Note that the template's `index`th interpolation comes next."""
+        match self.state:
+            case _State.DATA | _State.RAW_TEXT:
+                self.text.append(index)
+            case _State.TAG_NAME | _State.END_TAG_NAME:
+                self.tag.append(index)
+            case _State.BEFORE_ATTRIBUTE | _State.ATTRIBUTE_NAME:
+                self.attribute.append(index)
+                self.state = _State.ATTRIBUTE_NAME
+            case _State.AFTER_ATTRIBUTE_NAME:
+                # The previous attribute had no value; this starts another
+                self._end_attribute(has_value=False)
+                self.attribute.append(index)
+                self.state = _State.ATTRIBUTE_NAME
+            case _State.BEFORE_VALUE | _State.UNQUOTED_VALUE:
+                self.value.append(index)
+                self.state = _State.UNQUOTED_VALUE
+            case _State.QUOTED_VALUE:
+                self.value.append(index)
+            case _State.COMMENT | _State.DECLARATION:
+                # Interpolations in comments (and the like) are dropped
+                pass
+            case _State.AFTER_END_TAG_NAME:
+                raise HTMLParseError("Unexpected interpolation in end tag")
+
+    def close(self) -> _CompiledTemplate:
+        """Finish parsing and return the compiled template."""
+        if self.state not in (_State.DATA, _State.COMMENT, _State.DECLARATION):
+            raise HTMLParseError("Unexpected end of template inside a tag")
+        self._flush_text()
+        if self.stack:
+            raise HTMLParseError(f"Unclosed element: {self.stack[-1].tag}")
+        if self.root is None:
+            raise HTMLParseError("No root element")
+        self.root.prerender()
+        return _CompiledTemplate(self.root, tuple(self.dynamic_end_tags))
+
+    # Handlers for each parser state. Each consumes some of `s`, starting at
+    # `pos`, and returns the position at which parsing should continue.
+
+    def _data(self, s: str, pos: int) -> int:
+        while True:
+            lt = s.find("<", pos)
+            if lt < 0:
+                self._add_text(s[pos:])
+                return len(s)
+            if lt > pos:
+                self._add_text(s[pos:lt])
+            # Fast paths for complete start and end tags
+            if match := _START_TAG_RE.match(s, lt):
+                self._flush_text()
+                attributes: list[_CompiledAttribute | _CompiledSpread] = []
+                for attribute in _ATTRIBUTE_RE.finditer(match[2]):
+                    value = None
+                    if attribute.end(1) < attribute.end():
+                        value = attribute[2] or attribute[3] or attribute[4] or ""
+                        value = unescape(value) if "&" in value else value
+                    attributes.append(_CompiledAttribute(attribute[1].lower(), value))
+                self._start_element(match[1].lower(), attributes, bool(match[3]))
+                if self.state is not _State.DATA:
+                    return match.end()
+                pos = match.end()
+                continue
+            if match := _END_TAG_RE.match(s, lt):
+                self._flush_text()
+                self._end_element(match[1].lower())
+                pos = match.end()
+                continue
+            break
+        # Everything else goes through the slower, character-level states
+        if s.startswith("<!--", lt):
+            self.state = _State.COMMENT
+            return lt + 4
+        if s.startswith("</", lt):
+            self._flush_text()
+            self.state = _State.END_TAG_NAME
+            return lt + 2
+        if s.startswith("<!", lt) or s.startswith("<?", lt):
+            self.state = _State.DECLARATION
+            return lt + 2
+        # A tag name is either a letter or an interpolation at the end of `s`
+        if lt + 1 == len(s) or s[lt + 1].isascii() and s[lt + 1].isalpha():
+            self._flush_text()
+            self.state = _State.TAG_NAME
+            return lt + 1
+        self._add_text("<")
+        return lt + 1
+
+    def _raw_text(self, s: str, pos: int) -> int:
+        assert self.raw_text_end is not None
+        match = self.raw_text_end.search(s, pos)
+        if match is None:
+            self.text.append(s[pos:])
+            return len(s)
+        self.text.append(s[pos : match.start()])
+        self._flush_text()
+        self._end_element(self.stack[-1].tag)
+        self.state = _State.DATA
+        return match.end()
+
+    def _comment(self, s: str, pos: int) -> int:
+        end = s.find("-->", pos)
+        if end < 0:
+            return len(s)
+        self.state = _State.DATA
+        return end + 3
+
+    def _declaration(self, s: str, pos: int) -> int:
+        end = s.find(">", pos)
+        if end < 0:
+            return len(s)
+        self.state = _State.DATA
+        return end + 1
+
+    def _tag_name(self, s: str, pos: int) -> int:
+        match = _TAG_NAME_RE.match(s, pos)
+        assert match is not None
+        if name := match.group():
+            self.tag.append(name.lower())
+        if match.end() < len(s):
+            self.state = _State.BEFORE_ATTRIBUTE
+        return match.end()
+
+    def _end_tag_name(self, s: str, pos: int) -> int:
+        match = _TAG_NAME_RE.match(s, pos)
+        assert match is not None
+        if name := match.group():
+            self.tag.append(name.lower())
+        if match.end() < len(s):
+            self.state = _State.AFTER_END_TAG_NAME
+        return match.end()
+
+    def _after_end_tag_name(self, s: str, pos: int) -> int:
+        end = s.find(">", pos)
+        if end < 0:
+            return len(s)
+        tag = _make_parts(self.tag)
+        self.tag = []
+        self._end_element(tag)
+        self.state = _State.DATA
+        return end + 1
+
+    def _before_attribute(self, s: str, pos: int) -> int:
+        pos = _SPACE_RE.match(s, pos).end()  # type: ignore[union-attr]
+        if pos == len(s):
+            return pos
+        if s.startswith(">", pos) or s.startswith("/>", pos):
+            self_closing = s[pos] == "/"
+            tag = _make_parts(self.tag)
+            self.tag = []
+            self._start_element(tag, self.attributes, self_closing)
+            self.attributes = []
+            return pos + 2 if self_closing else pos + 1
+        if s.startswith("/", pos):
+            return pos + 1
+        if s.startswith("=", pos):
+            raise HTMLParseError("Unexpected '=' in start tag")
+        self.state = _State.ATTRIBUTE_NAME
+        return pos
+
+    def _attribute_name(self, s: str, pos: int) -> int:
+        match = _ATTRIBUTE_NAME_RE.match(s, pos)
+        assert match is not None
+        if name := match.group():
+            self.attribute.append(name.lower())
+        if match.end() < len(s):
+            self.state = _State.AFTER_ATTRIBUTE_NAME
+        return match.end()
+
+    def _after_attribute_name(self, s: str, pos: int) -> int:
+        pos = _SPACE_RE.match(s, pos).end()  # type: ignore[union-attr]
+        if pos == len(s):
+            return pos
+        if s.startswith("=", pos):
+            self.state = _State.BEFORE_VALUE
+            return pos + 1
+        self._end_attribute(has_value=False)
+        self.state = _State.BEFORE_ATTRIBUTE
+        return pos
+
+    def _before_value(self, s: str, pos: int) -> int:
+        pos = _SPACE_RE.match(s, pos).end()  # type: ignore[union-attr]
+        if pos == len(s):
+            return pos
+        if s[pos] in "\"'":
+            self.quote = s[pos]
+            self.state = _State.QUOTED_VALUE
+            return pos + 1
+        self.state = _State.UNQUOTED_VALUE
+        return pos
+
+    def _unquoted_value(self, s: str, pos: int) -> int:
+        match = _UNQUOTED_VALUE_RE.match(s, pos)
+        assert match is not None
+        if value := match.group():
+            self.value.append(unescape(value))
+        if match.end() < len(s):
+            self._end_attribute(has_value=True)
+            self.state = _State.BEFORE_ATTRIBUTE
+        return match.end()
+
+    def _quoted_value(self, s: str, pos: int) -> int:
+        end = s.find(self.quote, pos)
+        if end < 0:
+            self.value.append(unescape(s[pos:]))
+            return len(s)
+        self.value.append(unescape(s[pos:end]))
+        self._end_attribute(has_value=True)
+        self.state = _State.BEFORE_ATTRIBUTE
+        return end + 1
+
+    _HANDLERS = {
+        _State.DATA: _data,
+        _State.RAW_TEXT: _raw_text,
+        _State.COMMENT: _comment,
+        _State.DECLARATION: _declaration,
+        _State.TAG_NAME: _tag_name,
+        _State.END_TAG_NAME: _end_tag_name,
+        _State.AFTER_END_TAG_NAME: _after_end_tag_name,
+        _State.BEFORE_ATTRIBUTE: _before_attribute,
+        _State.ATTRIBUTE_NAME: _attribute_name,
+        _State.AFTER_ATTRIBUTE_NAME: _after_attribute_name,
+        _State.BEFORE_VALUE: _before_value,
+        _State.UNQUOTED_VALUE: _unquoted_value,
+        _State.QUOTED_VALUE: _quoted_value,
+    }
+
+    # Helpers that build up the compiled template
+
+    def _add_text(self, text: str) -> None:
+        self.text.append(unescape(text) if "&" in text else text)
+
+    def _flush_text(self) -> None:
+        # Ignore leading and trailing whitespace entirely for now
+        # TODO handle whitespace in a more sophisticated way
+        if not self.text:
+            return
+        text = _make_parts(self.text, strip=True)
+        self.text = []
+        if not text:
+            return
+        if not self.stack:
+            raise HTMLParseError(f"Data outside of root element: {text}")
+        self.stack[-1].children.append(
+            text if isinstance(text, str) else _CompiledText(text)
+        )
+
+    def _end_attribute(self, has_value: bool) -> None:
+        name = _make_parts(self.attribute)
+        self.attribute = []
+        if has_value:
+            value = _make_parts(self.value)
+            self.value = []
+            self.attributes.append(_CompiledAttribute(name, value))
+        elif isinstance(name, tuple) and len(name) == 1:
+            # A lone interpolation, like `<p {attrs}>`, provides attributes
+            assert isinstance(name[0], int)
+            self.attributes.append(_CompiledSpread(name[0]))
+        else:
+            self.attributes.append(_CompiledAttribute(name, None))
+
+    def _start_element(
+        self,
+        tag: str | _Parts,
+        attributes: list[_CompiledAttribute | _CompiledSpread],
+        self_closing: bool,
+    ) -> None:
+        if not tag:
+            raise HTMLParseError("Missing tag name")
         if self.root is not None:
             raise HTMLParseError(f"Multiple root elements ({self.root.tag} and {tag})")
+        self.stack.append(_ElementBuilder(tag, attributes))
+        if self_closing:
+            self._end_element(tag)
+            self.state = _State.DATA
+        elif isinstance(tag, str) and tag in _RAW_TEXT_TAGS:
+            self.raw_text_end = re.compile(rf"</{tag}\s*>", re.IGNORECASE)
+            self.state = _State.RAW_TEXT
+        else:
+            self.state = _State.DATA
 
-        attributes = {key: value for key, value in attrs}
-        element = Element(tag, attributes, [])
-        self.stack.append(element)
-        self.in_start_tag = False
-
-    def handle_endtag(self, tag: str) -> None:
-        element = self.stack.pop()
-        if element.tag != tag:
+    def _end_element(self, tag: str | _Parts) -> None:
+        if not self.stack:
             raise HTMLParseError(f"Unexpected end tag: {tag}")
+        builder = self.stack.pop()
+        if builder.tag != tag:
+            # If either tag is interpolated, we can only check that they
+            # match once we know the interpolated values.
+            if isinstance(builder.tag, str) and isinstance(tag, str):
+                raise HTMLParseError(f"Unexpected end tag: {tag}")
+            self.dynamic_end_tags.append((builder.tag, tag))
+        element = builder.build()
         if not self.stack:
             self.root = element
         else:
-            self.stack[-1] = self.stack[-1].append(element)
+            self.stack[-1].children.append(element)
+
+
+# ---------------------------------------------------------------------------
+# Compiling and caching template "shapes"
+# ---------------------------------------------------------------------------
 
-    def handle_data(self, data: str) -> None:
-        # Ignore whitespace entirely for now
-        # TODO handle whitespace in a more sophisticated way
-        data = data.strip()
-        if not data:
-            return
-        if not self.stack:
-            raise HTMLParseError(f"Data outside of root element: {data}")
-        self.stack[-1] = self.stack[-1].append(data)
 
-    def parse_starttag(self, i: int) -> int:
-        # A small hack to allow us to know when we're in a start tag
-        # (but haven't finished parsing it yet)
-        # TODO: just how accurate is this? Is there a better way?
-        self.in_start_tag = True
-        return super().parse_starttag(i)
+# The number of distinct template shapes whose compiled form we keep around
+HTML_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=HTML_CACHE_SIZE)
+def _compile(strings: tuple[str, ...]) -> _CompiledTemplate:
+    """Parse the static strings of a template, noting where values go."""
+    start = time.perf_counter() if _hooks else 0.0
+    budget = _budget.get()
+    parser = HTMLTemplateParser()
+    for index, s in enumerate(strings):
+        if index:
+            parser.feed_interpolation(index - 1)
+        parser.feed(s)
+        if budget is not None:
+            budget.check_time()
+    compiled = parser.close()
+    if _hooks and start:
+        _emit("parse", _shape_label(strings), start, strings=len(strings))
+    return compiled
+
+
+def html_cache_info():
+    """Return hit, miss, and size statistics for the compiled template cache."""
+    return _compile.cache_info()
+
+
+def html_cache_clear() -> None:
+    """Discard all compiled templates."""
+    _compile.cache_clear()
 
 
 # ---------------------------------------------------------------------------
@@ -206,114 +1443,2310 @@ class HTMLTemplateParser(HTMLParser):
 # ---------------------------------------------------------------------------
 
 
-def _process_start_tag_interpolation(value: object) -> str:
-    """
-    Process an interpolation value in a start tag.
+def _process_tag_interpolation(value: object) -> str:
+    """Process an interpolation value in a tag name or attribute name."""
+    if isinstance(value, str):
+        return value.lower()
+    raise HTMLParseError(f"Unsupported tag interpolation: {type(value)}")
 
-    Return the string representation of the value to feed to the parser.
+
+class InterpolationProcessors[T]:
+    """
+    A registry of the processors for interpolation values in one context.
+
+    A processor takes a value and returns what it contributes to the HTML:
+    a string for an attribute value, or a sequence of children for content.
+    The processor for a value is chosen by its type: a processor registered
+    for exactly that type wins, then objects with an `__html__()` method are
+    trusted, then processors registered for base classes (following the
+    method resolution order), then those registered for abstract base
+    classes, in the order they were registered. The choice is cached per
+    type, so after the first value of each type, a lookup is one dict access.
     """
+
+    def __init__(self, context: str, html: Callable[[object], T]) -> None:
+        self.context = context
+        self._html = html
+        self._registry: dict[type, Callable[[object], T]] = {}
+        # The processor chosen for each type seen so far (cleared, never
+        # replaced, so it can be looked up directly in hot loops)
+        self.cache: dict[type, Callable[[object], T]] = {}
+
+    def register[F: Callable[..., T]](
+        self, cls: type, processor: F | None = None
+    ) -> F | Callable[[F], F]:
+        """
+        Register a processor for values of type `cls`.
+
+        Can also be used as a decorator, like `@processors.register(Money)`.
+        """
+        if processor is None:
+            return lambda processor: self.register(cls, processor)
+        self._registry[cls] = processor
+        self.cache.clear()
+        return processor
+
+    def unregister(self, cls: type) -> None:
+        """Remove the processor registered for `cls`."""
+        del self._registry[cls]
+        self.cache.clear()
+
+    def dispatch(self, cls: type) -> Callable[[object], T]:
+        """Return the processor for values of type `cls`."""
+        if (processor := self.cache.get(cls)) is None:
+            processor = self.cache[cls] = self._find(cls)
+        return processor
+
+    def _find(self, cls: type) -> Callable[[object], T]:
+        """Choose the processor for values of type `cls`."""
+        registry = self._registry
+        if cls in registry:
+            return registry[cls]
+        if hasattr(cls, "__html__"):
+            return self._html
+        for base in cls.__mro__[1:]:
+            if base in registry:
+                return registry[base]
+        for base, processor in registry.items():
+            if issubclass(cls, base):
+                return processor
+        return self._unsupported
+
+    def _unsupported(self, value: object) -> T:
+        raise HTMLParseError(f"Unsupported {self.context} interpolation: {type(value)}")
+
+    def __call__(self, value: object) -> T:
+        """Process a value."""
+        return self.dispatch(type(value))(value)
+
+
+def _trust_attribute(value: object) -> str:
+    # Trust objects that render themselves to HTML
+    return Markup(cast(Markup, value).__html__())
+
+
+attribute_processors = InterpolationProcessors[str]("attribute", _trust_attribute)
+_attribute_cache = attribute_processors.cache
+
+# No need to escape here; attribute values are escaped when rendered
+attribute_processors.register(str, lambda value: value)
+attribute_processors.register(Markup, lambda value: value)
+for _number in (int, float, Decimal, Fraction):
+    attribute_processors.register(_number, str)
+# True and False are ambiguous as values; use a spread to set boolean attributes
+attribute_processors.register(bool, attribute_processors._unsupported)
+attribute_processors.register(date, lambda value: value.isoformat())
+attribute_processors.register(time_of_day, lambda value: value.isoformat())
+
+
+def _process_attribute_interpolation(value: object) -> str:
+    """Process an interpolation value in an attribute value."""
+    try:
+        processor = _attribute_cache[type(value)]
+    except KeyError:
+        processor = attribute_processors.dispatch(type(value))
+    return processor(value)
+
+
+def _process_spread_interpolation(value: object) -> Mapping[str, str | None]:
+    """Process an interpolation value that stands in for attributes."""
     if isinstance(value, Mapping):
-        # Render a collection of attributes in a mapping
-        return _render_attributes_mapping(value)
-    if isinstance(value, str):
-        # Escape a value to be used in an attribute
-        value = escape(value, quote=True)
-        # TODO We currently assume that we're inside an attribute value in
-        # the parse, but this may not always be the case.
-        return f'"{value}"'
+        return value
     raise HTMLParseError(f"Unsupported start tag interpolation: {type(value)}")
 
 
-def _process_content_interpolation(value: object) -> str:
+def _trust_content(value: object) -> Sequence[str | Element]:
+    # Trust objects that render themselves to HTML
+    return (Markup(cast(Markup, value).__html__()),)
+
+
+def _eager_content(value: object) -> Sequence[str | Element]:
+    # Sequences (like lists) can be read any number of times, so build their
+    # items right away, in a fragment that can be compared and hashed
+    children = [
+        child
+        for item in cast(Sequence[object], value)
+        for child in _process_content_interpolation(item)
+    ]
+    return (Element("", {}, children),)
+
+
+def _lazy_content(value: object) -> Sequence[str | Element]:
+    # Keep other iterables (like generators) lazy, in a fragment, so that
+    # they are only consumed, one item at a time, when rendered
+    children = _LazyChildren(cast(Iterable[object], value))
+    return (Element("", {}, cast(Sequence[str | Element], children)),)
+
+
+content_processors = InterpolationProcessors[Sequence[str | Element]](
+    "content", _trust_content
+)
+_content_cache = content_processors.cache
+
+# Allow nesting elements in content; they become children as-is
+content_processors.register(Element, lambda value: (value,))
+# Allow nesting templates in content by first processing them recursively
+# with the html function
+content_processors.register(Template, lambda value: (html(value),))
+# No need to escape here; content is escaped when rendered
+content_processors.register(str, lambda value: (value,))
+content_processors.register(Markup, lambda value: (value,))
+for _number in (int, float, Decimal, Fraction):
+    content_processors.register(_number, lambda value: (str(value),))
+content_processors.register(bool, content_processors._unsupported)
+content_processors.register(date, lambda value: (value.isoformat(),))
+content_processors.register(time_of_day, lambda value: (value.isoformat(),))
+# Mappings and bytes are iterable, but not content (bytes would render as a
+# list of numbers); these must come before Sequence and Iterable
+content_processors.register(Mapping, content_processors._unsupported)
+for _binary in (bytes, bytearray, memoryview):
+    content_processors.register(_binary, content_processors._unsupported)
+content_processors.register(Sequence, _eager_content)
+content_processors.register(Iterable, _lazy_content)
+
+
+def _process_content_interpolation(value: object) -> Sequence[str | Element]:
     """
     Process an interpolation value outside of a start tag.
 
-    Return the string representation of the value to feed to the parser.
+    Return the children that the value contributes to its parent element.
     """
-    if isinstance(value, Element):
-        # Allow nesting elements in content
-        return str(value)
-    if isinstance(value, Template):
-        # Allow nesting templates in content by first processing them
-        # recursively with the html function
-        element = html(value)
-        return str(element)
-    if isinstance(value, str):
-        # Escape a value to be used in content
-        return escape(value, quote=False)
-    # TODO support "component" interpolations: callables that take
-    # the attributes and children and return an Element for rendering
-    raise HTMLParseError(f"Unsupported content interpolation: {type(value)}")
+    try:
+        processor = _content_cache[type(value)]
+    except KeyError:
+        processor = content_processors.dispatch(type(value))
+    return processor(value)
 
 
-def _invoke_components(element: Element, components: dict[str, Callable]) -> Element:
-    """Recursively invoke any component functions in the Element tree."""
-    children = [
-        _invoke_components(child, components) if isinstance(child, Element) else child
-        for child in element.children
+class _LazyChildren:
+    """
+    Children produced on demand from an iterable of content values.
+
+    Each item is processed like a content interpolation as it's reached. An
+    iterator (such as a generator) can only be rendered once.
+    """
+
+    __slots__ = ("iterable",)
+
+    def __init__(self, iterable: Iterable[object]) -> None:
+        self.iterable = iterable
+
+    def __iter__(self) -> Iterator[str | Element]:
+        for value in self.iterable:
+            yield from _process_content_interpolation(value)
+
+    def __repr__(self) -> str:
+        return f"_LazyChildren({self.iterable!r})"
+
+
+# ---------------------------------------------------------------------------
+# Building an Element tree from a compiled template and its values
+# ---------------------------------------------------------------------------
+
+
+def _resolve_tag(
+    tag: str | _Parts, interpolations: tuple[Interpolation, ...]
+) -> str | Callable:
+    """Determine the tag name, or the component to invoke in its place."""
+    if isinstance(tag, str):
+        return tag
+    if len(tag) == 1 and isinstance(tag[0], int):
+        value = interpolations[tag[0]].value
+        if callable(value):
+            return value
+    return _resolve_name(tag, interpolations)
+
+
+def _resolve_name(name: str | _Parts, interpolations: tuple[Interpolation, ...]) -> str:
+    """Determine a tag or attribute name that may contain interpolations."""
+    if isinstance(name, str):
+        return name
+    return "".join(
+        (
+            part
+            if isinstance(part, str)
+            else _process_tag_interpolation(interpolations[part].value)
+        )
+        for part in name
+    )
+
+
+def _resolve_attribute_value(
+    value: str | _Parts | None, interpolations: tuple[Interpolation, ...]
+) -> str | None:
+    """Determine an attribute value that may contain interpolations."""
+    if value is None or isinstance(value, str):
+        return value
+    parts = [
+        (
+            part
+            if isinstance(part, str)
+            else _process_attribute_interpolation(interpolations[part].value)
+        )
+        for part in value
     ]
-    if element.tag in components:
-        component = components[element.tag]
-        return component(element.attributes, children)
-    return Element(element.tag, element.attributes, children)
+    if not any(isinstance(part, Markup) for part in parts):
+        return "".join(parts)
+    # Keep trusted values trusted by escaping everything else up front
+    return Markup(
+        "".join(
+            part if isinstance(part, Markup) else escape(part, quote=True)
+            for part in parts
+        )
+    )
 
 
-def _make_component_name(expr: str) -> str:
-    """Convert an expr into a component name safe for use in HTML."""
-    # This is basically a specialized slugify function
-    cleaned = (
-        re.sub(r"[-\s]+", "-", re.sub(r"[^a-zA-Z0-9\s-]", "", expr)).strip("-").lower()
+def _build_text(
+    parts: _Parts,
+    interpolations: tuple[Interpolation, ...],
+    children: list[str | Element],
+) -> None:
+    """Append the children produced by a run of text with interpolations."""
+    text: list[str] = []
+
+    def flush() -> None:
+        # Just like the parser, ignore leading and trailing whitespace
+        data = "".join(text).strip()
+        if data:
+            children.append(data)
+        text.clear()
+
+    for part in parts:
+        if isinstance(part, str):
+            text.append(part)
+            continue
+        for item in _process_content_interpolation(interpolations[part].value):
+            # Trusted markup stays a separate child, so it's never escaped
+            if isinstance(item, str) and not isinstance(item, Markup):
+                text.append(item)
+            else:
+                flush()
+                children.append(item)
+    flush()
+
+
+def _build_attributes(
+    compiled: Sequence[_CompiledAttribute | _CompiledSpread],
+    interpolations: tuple[Interpolation, ...],
+) -> dict[str, str | None]:
+    """Substitute interpolation values into compiled attributes."""
+    attributes: dict[str, str | None] = {}
+    for attribute in compiled:
+        if isinstance(attribute, _CompiledSpread):
+            value = interpolations[attribute.index].value
+            for name, item in _process_spread_interpolation(value).items():
+                attributes[intern(name) if type(name) is str else name] = item
+        elif isinstance(attribute.name, str):
+            # Static names were interned when compiled
+            value = _resolve_attribute_value(attribute.value, interpolations)
+            attributes[attribute.name] = value
+        else:
+            name = intern(_resolve_name(attribute.name, interpolations))
+            attributes[name] = _resolve_attribute_value(attribute.value, interpolations)
+    return attributes
+
+
+def _make_element(
+    tag: str, attributes: dict[str, str | None], children: list[str | Element]
+) -> Element:
+    """Create an Element from built parts, whose names are already interned."""
+    return Element(
+        tag,
+        _Attributes(tuple(attributes.items())) if attributes else _NO_ATTRIBUTES,
+        tuple(children),
     )
-    return f"component-{cleaned}-component"
+
+
+def _build_element(
+    compiled: _CompiledElement,
+    interpolations: tuple[Interpolation, ...],
+    budget: RenderBudget | None = None,
+) -> Element:
+    """
+    Substitute interpolation values into a compiled element.
+
+    With a `budget`, its depth is kept at the depth of the element whose
+    content is being built, so templates nested there start from it.
+    """
+    if compiled.static is not None:
+        return compiled.static
+    base = budget.depth if budget is not None else 0
+    # Build the tree with an explicit stack of the ancestors that are still
+    # being built, so that deep trees don't hit the recursion limit
+    stack: list[_BuildFrame] = []
+    tag = _resolve_tag(compiled.tag, interpolations)
+    attributes = _build_attributes(compiled.attributes, interpolations)
+    pending = iter(compiled.children)
+    children: list[str | Element] = []
+    while True:
+        for child in pending:
+            if isinstance(child, str):
+                children.append(child)
+            elif isinstance(child, _CompiledText):
+                if budget is not None:
+                    budget.depth = base + len(stack) + 1
+                _build_text(child.parts, interpolations, children)
+            elif child.static is not None:
+                children.append(child.static)
+            else:
+                stack.append((tag, attributes, pending, children))
+                tag = _resolve_tag(child.tag, interpolations)
+                attributes = _build_attributes(child.attributes, interpolations)
+                pending, children = iter(child.children), []
+                break
+        else:
+            if callable(tag):
+                # Handle component interpolations: the component decides what
+                # to do with the attributes and (already built) children
+                if (budget := _budget.get()) is not None:
+                    budget.check_time()
+                if _hooks:
+                    element = _timed_component(tag, attributes, children)
+                else:
+                    element = tag(attributes, children)
+            else:
+                element = _make_element(tag, attributes, children)
+            if not stack:
+                return element
+            tag, attributes, pending, children = stack.pop()
+            children.append(element)
+
+
+# An element whose children are still being built: its tag (or component),
+# attributes, the compiled children still to build, and those already built
+type _BuildFrame = tuple[
+    str | Callable,
+    dict[str, str | None],
+    Iterator[str | _CompiledText | _CompiledElement],
+    list[str | Element],
+]
+
+
+def _check_end_tags(
+    compiled: _CompiledTemplate, interpolations: tuple[Interpolation, ...]
+) -> None:
+    """Check that interpolated start and end tags match."""
+    for start, end in compiled.dynamic_end_tags:
+        end_tag = _resolve_tag(end, interpolations)
+        if _resolve_tag(start, interpolations) != end_tag:
+            raise HTMLParseError(f"Unexpected end tag: {end_tag}")
 
 
 # ---------------------------------------------------------------------------
 # The main html() template processing function
 # ---------------------------------------------------------------------------
 
-# TODO we should re-structure this to be a bunch cleaner. Soon! -Dave
-
 
 def html(template: Template) -> Element:
     """
     Convert a Template to an Element.
 
-    A more sophisticated version of this function would probably create an
-    intermediate representation of the HTML template that retains interpolation
-    details, and then walk *that* representation to build the Element tree.
+    The template's static strings are parsed just once (see `_compile()`);
+    after that, converting a template with the same "shape" only needs to
+    substitute the new interpolation values into the compiled form.
+    """
+    compiled = _compile(template.strings)
+    interpolations = template.interpolations
+    if (budget := _budget.get()) is not None:
+        return _limited_build(budget, template.strings, compiled, interpolations)
+    if _hooks:
+        return _timed_build(template.strings, compiled, interpolations)
+    _check_end_tags(compiled, interpolations)
+    return _build_element(compiled.root, interpolations)
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation hooks, for finding out where rendering time goes
+# ---------------------------------------------------------------------------
+
 
-    But we want to keep things simple for this example code, so we're going to
-    do all the fun stuff right here in this function.
+@dataclass(frozen=True)
+class RenderEvent:
     """
-    parser = HTMLTemplateParser()
+    A timed phase of turning templates into HTML, as reported to hooks.
+
+    `phase` is one of "parse" (compiling a new template shape), "build"
+    (substituting values into a compiled template, including any components
+    and nested templates), "component" (one component call) or "render"
+    (producing HTML). `shape` names the template shape, or the component.
+    """
+
+    phase: str
+    shape: str
+    seconds: float
+    # Counters for the phase, like "elements" built or "bytes" rendered
+    counts: Mapping[str, int] = field(default_factory=dict)
+
+
+type RenderHook = Callable[[RenderEvent], object]
+
+# The registered hooks; while there are none, nothing is measured
+_hooks: tuple[RenderHook, ...] = ()
+_hooks_lock = threading.Lock()
+_uncounted_escapes = (_escape_text, _escape_attribute_value)
+# Which template shape produced each Element built while hooks are registered
+_element_shapes: dict[int, str] = {}
+# The escape calls of the instrumented render in progress in this context, if
+# any, counted only while hooks are registered
+_render_escapes: ContextVar[list[int] | None] = ContextVar(
+    "_render_escapes", default=None
+)
+
+
+def _counted[F: Callable[[str], str]](escape_function: F) -> F:
+    """Wrap an escaping function so that its calls are counted."""
+
+    def counted(value: str) -> str:
+        if (escapes := _render_escapes.get()) is not None:
+            escapes[0] += 1
+        return escape_function(value)
+
+    return cast(F, counted)
+
+
+def add_render_hook(hook: RenderHook) -> None:
+    """
+    Call `hook` with a `RenderEvent` for each instrumented phase.
+
+    Instrumentation only costs anything while at least one hook is
+    registered.
+    """
+    global _hooks, _escape_text, _escape_attribute_value
+    with _hooks_lock:
+        if not _hooks:
+            _escape_text, _escape_attribute_value = map(_counted, _uncounted_escapes)
+        _hooks = (*_hooks, hook)
+
+
+def remove_render_hook(hook: RenderHook) -> None:
+    """Stop calling a hook registered with `add_render_hook()`."""
+    global _hooks, _escape_text, _escape_attribute_value
+    with _hooks_lock:
+        hooks = list(_hooks)
+        hooks.remove(hook)
+        _hooks = tuple(hooks)
+        if not _hooks:
+            _escape_text, _escape_attribute_value = _uncounted_escapes
+            _element_shapes.clear()
+
+
+@contextmanager
+def render_hooks(*hooks: RenderHook) -> Iterator[None]:
+    """Register hooks for the duration of a `with` block."""
+    for hook in hooks:
+        add_render_hook(hook)
+    try:
+        yield
+    finally:
+        for hook in hooks:
+            remove_render_hook(hook)
+
+
+def _emit(phase: str, shape: str, start: float, **counts: int) -> None:
+    """Report a phase that began at `start` to every hook."""
+    event = RenderEvent(phase, shape, time.perf_counter() - start, counts)
+    for hook in _hooks:
+        hook(event)
+
+
+@lru_cache(maxsize=HTML_CACHE_SIZE)
+def _shape_label(strings: tuple[str, ...]) -> str:
+    """A short, readable name for a template shape."""
+    label = " ".join("{}".join(strings).split())
+    return label if len(label) <= 60 else f"{label[:57]}..."
+
+
+def _element_shape(element: Element) -> str:
+    """Name the template shape an element was built from, if known."""
+    if (shape := _element_shapes.get(id(element))) is not None:
+        return shape
+    return f"<{element.tag}> element" if element.tag else "fragment"
+
+
+def _note_shape(element: Element, shape: str) -> None:
+    """Remember which template shape an element was built from."""
+    if id(element) not in _element_shapes:
+        weakref.finalize(element, _element_shapes.pop, id(element), None)
+    _element_shapes[id(element)] = shape
+
+
+def _component_name(component: Callable) -> str:
+    """Name a component in render events."""
+    return getattr(component, "__qualname__", None) or repr(component)
+
+
+def _count_elements(element: Element) -> int:
+    """Count the elements in a tree, without consuming lazy children."""
+    count = 0
+    pending = [element]
+    while pending:
+        element = pending.pop()
+        count += 1
+        if isinstance(element.children, tuple):
+            pending.extend(c for c in element.children if isinstance(c, Element))
+    return count
+
+
+def _timed_build(
+    strings: tuple[str, ...],
+    compiled: _CompiledTemplate,
+    interpolations: tuple[Interpolation, ...],
+    budget: RenderBudget | None = None,
+) -> Element:
+    """Implement `html()` while hooks are registered."""
+    start = time.perf_counter()
+    _check_end_tags(compiled, interpolations)
+    element = _build_element(compiled.root, interpolations, budget)
+    if _hooks:
+        # Unless the last hook was removed meanwhile
+        shape = _shape_label(strings)
+        _emit("build", shape, start, elements=_count_elements(element))
+        _note_shape(element, shape)
+    return element
+
+
+def _timed_component(
+    component: Callable, attributes: dict[str, str | None], children: list
+) -> Element:
+    """Call a component while hooks are registered."""
+    start = time.perf_counter()
+    element = component(attributes, children)
+    _emit("component", _component_name(component), start)
+    return element
+
+
+def _timed_render[R: (str, bytes, list[bytes])](
+    shape: str, render: Callable[[], R]
+) -> R:
+    """Render while hooks are registered, reporting the size and escapes."""
+    if _render_escapes.get() is not None:
+        # Nested renders (like a child rendered to bytes) are part of the
+        # outermost one
+        return render()
+    escapes = [0]
+    start = time.perf_counter()
+    token = _render_escapes.set(escapes)
+    try:
+        result = render()
+    finally:
+        _render_escapes.reset(token)
+    if isinstance(result, str):
+        size = len(result.encode())
+    elif isinstance(result, bytes):
+        size = len(result)
+    else:
+        size = sum(map(len, result))
+    _emit("render", shape, start, bytes=size, escapes=escapes[0])
+    return result
+
+
+class _Totals:
+    """Running totals for one row of a `RenderStats` table."""
+
+    __slots__ = ("calls", "seconds", "counts")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.counts: dict[str, int] = {}
+
+
+class RenderStats:
+    """
+    A render hook that adds up the cost of each phase, per template shape.
+
+    Register it (for instance, with `render_hooks()`), render some pages,
+    then call `print_table()` to see where the time went.
+    """
+
+    COUNTERS = ("elements", "bytes", "escapes")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: dict[tuple[str, str], _Totals] = {}
+
+    def __call__(self, event: RenderEvent) -> None:
+        with self._lock:
+            totals = self._totals.get((event.shape, event.phase))
+            if totals is None:
+                totals = self._totals[(event.shape, event.phase)] = _Totals()
+            totals.calls += 1
+            totals.seconds += event.seconds
+            for name, count in event.counts.items():
+                totals.counts[name] = totals.counts.get(name, 0) + count
+
+    def rows(self) -> list[tuple[str, str, int, float, dict[str, int]]]:
+        """Return (shape, phase, calls, seconds, counts), costliest first."""
+        with self._lock:
+            rows = [
+                (shape, phase, t.calls, t.seconds, dict(t.counts))
+                for (shape, phase), t in self._totals.items()
+            ]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    def clear(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._totals.clear()
+
+    def table(self) -> str:
+        """Format the totals as a table, costliest rows first."""
+        lines = [
+            f"{'phase':<10} {'calls':>8} {'total ms':>10} {'us/call':>10} "
+            + " ".join(f"{name:>10}" for name in self.COUNTERS)
+            + "  shape"
+        ]
+        for shape, phase, calls, seconds, counts in self.rows():
+            lines.append(
+                f"{phase:<10} {calls:>8} {seconds * 1e3:>10.2f} "
+                f"{seconds / calls * 1e6:>10.1f} "
+                + " ".join(
+                    f"{counts[name]:>10}" if name in counts else f"{'':>10}"
+                    for name in self.COUNTERS
+                )
+                + f"  {shape}"
+            )
+        return "\n".join(lines)
+
+    def print_table(self, file: IO[str] | None = None) -> None:
+        """Print the totals as a table."""
+        print(self.table(), file=file)
+
+
+# ---------------------------------------------------------------------------
+# Limits on the work that building and rendering HTML may do
+# ---------------------------------------------------------------------------
+
+
+class RenderBudget:
+    """
+    The limits set with `render_limits()`, and how much has been used.
+
+    Elements are counted twice over: once as templates are built (from the
+    number of elements in each template, so values like component output
+    aren't included) and once as they're rendered. Each count is checked
+    against `max_nodes`. Depth counts the elements of templates as they're
+    built, a nested template starting at the depth where it's inserted, and
+    elements (and fragments) as they're rendered.
+    """
+
+    __slots__ = (
+        "max_nodes",
+        "max_depth",
+        "max_bytes",
+        "max_seconds",
+        "deadline",
+        "nodes_built",
+        "nodes_rendered",
+        "bytes_rendered",
+        "depth",
+    )
+
+    def __init__(
+        self,
+        max_nodes: int | None = None,
+        max_depth: int | None = None,
+        max_bytes: int | None = None,
+        max_seconds: float | None = None,
+    ) -> None:
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.deadline = (
+            time.perf_counter() + max_seconds if max_seconds is not None else None
+        )
+        self.nodes_built = 0
+        self.nodes_rendered = 0
+        self.bytes_rendered = 0
+        # The depth that templates being built are inserted at
+        self.depth = 0
+
+    def exceeded(self, limit: str) -> RenderLimitExceeded:
+        """Return the exception for going over one of the limits."""
+        return RenderLimitExceeded(limit, getattr(self, limit))
+
+    def check_time(self) -> None:
+        """Raise if the time allowed has run out."""
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise self.exceeded("max_seconds")
+
+    def charge(self, compiled: _CompiledTemplate) -> None:
+        """Account for building a template's elements."""
+        self.check_time()
+        self.nodes_built += compiled.size[0]
+        if self.max_nodes is not None and self.nodes_built > self.max_nodes:
+            raise self.exceeded("max_nodes")
+
+    def check_depth(self, depth: int) -> None:
+        """Raise if a template `depth` elements deep can't go at this depth."""
+        if self.max_depth is not None and self.depth + depth > self.max_depth:
+            raise self.exceeded("max_depth")
+
+    def render_node(self, depth: int) -> None:
+        """Account for rendering an element at the given depth."""
+        self.nodes_rendered += 1
+        if self.max_nodes is not None and self.nodes_rendered > self.max_nodes:
+            raise self.exceeded("max_nodes")
+        if self.max_depth is not None and depth > self.max_depth:
+            raise self.exceeded("max_depth")
+        if not self.nodes_rendered & 0xFF:
+            self.check_time()
+
+    def render_chunk(self, chunk: str) -> None:
+        """Account for rendering a chunk of HTML."""
+        self.bytes_rendered += len(chunk) if chunk.isascii() else len(chunk.encode())
+        if self.max_bytes is not None and self.bytes_rendered > self.max_bytes:
+            raise self.exceeded("max_bytes")
+
+
+# The budget in effect, if any
+_budget: ContextVar[RenderBudget | None] = ContextVar("_budget", default=None)
+
+
+@contextmanager
+def render_limits(
+    max_nodes: int | None = None,
+    max_depth: int | None = None,
+    max_bytes: int | None = None,
+    max_seconds: float | None = None,
+) -> Iterator[RenderBudget]:
+    """
+    Limit the work done by `html()` and rendering inside a `with` block.
 
-    # Keep track of component invocations. We'll feed a "slugified" version of
-    # the component's expression to the parser, and then replace the slug with
-    # an actual component invocation when we're done.
-    components: dict[str, Callable] = {}
-
-    # TODO: consider moving all of this into an overridden parser.feed() method?
-    for item in template:
-        match item:
-            case str() as s:
-                # String content is easy: just continue to parse it as-is
-                parser.feed(s)
-            case Interpolation() as i:
-                # Interpolations are more complex. They can be strings, dicts,
-                # Elements, or Templates. It matters *where* in the HTML grammar
-                # they appear, so we need to handle each case separately.
-                if parser.in_start_tag:
-                    value = _process_start_tag_interpolation(i.value)
+    The limits cover everything built and rendered in the block (and in
+    tasks it starts): the number of elements, how deeply they nest, the
+    size of the rendered UTF-8 output, and the time since the block began.
+    Going over any of them raises `RenderLimitExceeded` as soon as it's
+    noticed. The budget, with what has been used, is the `as` target.
+    """
+    budget = RenderBudget(max_nodes, max_depth, max_bytes, max_seconds)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+def _limited_build(
+    budget: RenderBudget,
+    strings: tuple[str, ...],
+    compiled: _CompiledTemplate,
+    interpolations: tuple[Interpolation, ...],
+) -> Element:
+    """Implement `html()` while limits are in effect."""
+    budget.charge(compiled)
+    budget.check_depth(compiled.size[1])
+    base = budget.depth
+    try:
+        if _hooks:
+            return _timed_build(strings, compiled, interpolations, budget)
+        _check_end_tags(compiled, interpolations)
+        return _build_element(compiled.root, interpolations, budget)
+    finally:
+        budget.depth = base
+
+
+def _check_tree_depth(element: Element, budget: RenderBudget) -> None:
+    """Check how deep a tree nests, for builds that can't track the depth."""
+    if budget.max_depth is None:
+        return
+    max_depth = budget.max_depth - budget.depth
+    stack = [(element, 1)]
+    while stack:
+        element, depth = stack.pop()
+        if depth > max_depth:
+            raise budget.exceeded("max_depth")
+        if not isinstance(element.children, _LazyChildren):
+            stack.extend(
+                (child, depth + 1)
+                for child in element.children
+                if isinstance(child, Element)
+            )
+
+
+def _limited_chunks(
+    nodes: Iterable[str | Element], budget: RenderBudget, depth: int = 0
+) -> Iterator[str]:
+    """
+    Render elements and text like `iter_chunks()`, within a budget.
+
+    `depth` is the depth of their parent, for nodes rendered into an element
+    whose start tag has already been written.
+    """
+    stack: list[tuple[Iterator[str | Element], str]] = []
+    children: Iterator[str | Element] = iter(nodes)
+    end = ""
+    while True:
+        for child in children:
+            if not isinstance(child, Element):
+                chunk = _escape_text(child)
+                budget.render_chunk(chunk)
+                yield chunk
+                continue
+            budget.render_node(depth + len(stack) + 1)
+            start, child_end = _open_element(child)
+            if start:
+                budget.render_chunk(start)
+                yield start
+            if child_end is not None:
+                stack.append((children, end))
+                children, end = iter(child.children), child_end
+                break
+        else:
+            if end:
+                budget.render_chunk(end)
+                yield end
+            if not stack:
+                return
+            children, end = stack.pop()
+
+
+def _render_limited(
+    element: Element, write: Callable[[str], object], budget: RenderBudget
+) -> None:
+    """
+    Render an element like `render_into()`, within a budget.
+
+    The counters are kept in locals while rendering, which is much cheaper
+    than updating the budget for every element and chunk. (So a render
+    started during this one, say by a lazily rendered component, is added
+    to the budget but not checked against what this one has used so far.)
+    """
+    inf = float("inf")
+    max_nodes = budget.max_nodes if budget.max_nodes is not None else inf
+    max_depth = budget.max_depth if budget.max_depth is not None else inf
+    max_bytes = budget.max_bytes if budget.max_bytes is not None else inf
+    # Count against what's left, from zero
+    max_nodes -= budget.nodes_rendered
+    max_bytes -= budget.bytes_rendered
+    nodes = size = 0
+    stack: list[tuple[Iterator[str | Element], str]] = []
+    children: Iterator[str | Element] = iter((element,))
+    end = ""
+    try:
+        while True:
+            for child in children:
+                if isinstance(child, Element):
+                    nodes += 1
+                    if nodes > max_nodes:
+                        raise budget.exceeded("max_nodes")
+                    if len(stack) >= max_depth:
+                        raise budget.exceeded("max_depth")
+                    if not nodes & 0xFF:
+                        budget.check_time()
+                    chunk, child_end = _open_element(child)
                 else:
-                    value = i.value
-                    # Handle component interpolations
-                    if callable(value):
-                        components[_make_component_name(i.expression)] = value
-                        value = _make_component_name(i.expression)
-                    # TODO what if we're in an end tag?
-                    value = _process_content_interpolation(value)
-                parser.feed(value)
-    parser.close()
-    if not parser.root:
-        raise HTMLParseError("No root element")
-    return _invoke_components(parser.root, components)
+                    chunk, child_end = _escape_text(child), None
+                if chunk:
+                    size += len(chunk) if chunk.isascii() else len(chunk.encode())
+                    if size > max_bytes:
+                        raise budget.exceeded("max_bytes")
+                    write(chunk)
+                if child_end is not None:
+                    stack.append((children, end))
+                    children, end = iter(cast(Element, child).children), child_end
+                    break
+            else:
+                if end:
+                    size += len(end) if end.isascii() else len(end.encode())
+                    if size > max_bytes:
+                        raise budget.exceeded("max_bytes")
+                    write(end)
+                if not stack:
+                    return
+                children, end = stack.pop()
+    finally:
+        budget.nodes_rendered += nodes
+        budget.bytes_rendered += size
+
+
+# ---------------------------------------------------------------------------
+# Opt-in memoization of components
+# ---------------------------------------------------------------------------
+
+
+class ComponentCacheInfo(NamedTuple):
+    """Statistics for a memoized component's cache."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of calls answered from the cache."""
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
+def _value_key(value: str | None) -> object:
+    """Return a key for a string that tells trusted markup apart."""
+    return (Markup, str(value)) if isinstance(value, Markup) else value
+
+
+def _attributes_key(attributes: Mapping[str, str | None]) -> tuple:
+    """Return a hashable key for a mapping of attributes, in order."""
+    return tuple((name, _value_key(value)) for name, value in attributes.items())
+
+
+# Marks the end of an element's children in a key
+_END_OF_CHILDREN = object()
+
+
+def _children_key(children: Sequence[str | Element]) -> tuple:
+    """Return a hashable key for the structure and content of children."""
+    # A flat sequence of tokens, rather than nested tuples, so that neither
+    # building nor hashing the key of a deep tree hits the recursion limit
+    key: list[object] = []
+    stack = [iter(_key_children(children))]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, Element):
+                key.append((Element, child.tag, _attributes_key(child.attributes)))
+                stack.append(iter(_key_children(child.children)))
+                break
+            key.append(_value_key(child))
+        else:
+            stack.pop()
+            if stack:
+                key.append(_END_OF_CHILDREN)
+    return tuple(key)
+
+
+def _key_children(children: Sequence[str | Element]) -> Sequence[str | Element]:
+    if isinstance(children, _LazyChildren):
+        # Computing a key would consume the children
+        raise TypeError("Lazy children can't be used as a cache key")
+    return children
+
+
+class MemoizedComponent:
+    """
+    A component that reuses its output when called with equal inputs.
+
+    Calls are keyed on the structure of the attributes and children, so the
+    wrapped component must be a pure function of them. The same Element is
+    returned on every hit; treat it as immutable.
+    """
+
+    def __init__(
+        self,
+        component: Callable,
+        maxsize: int = 128,
+        ttl: float | None = None,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.component = component
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.is_async = inspect.iscoroutinefunction(component)
+        # Map keys to (expiry time, element), least recently used first
+        self._cache: OrderedDict[tuple, tuple[float, Element]] = OrderedDict()
+        # (expiry time, key) as stored, soonest to expire first
+        self._expiries: deque[tuple[float, tuple]] = deque()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        update_wrapper(self, component)
+
+    def _lookup(self, key: tuple) -> Element | None:
+        """Return the cached element for `key`, or None."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if self.ttl is None or entry[0] > self.timer():
+                    self._cache.move_to_end(key)
+                    self._hits += 1
+                    return entry[1]
+                del self._cache[key]
+            self._misses += 1
+            return None
+
+    def _store(self, key: tuple, element: Element) -> None:
+        """
+        Cache `element` for `key`, evicting expired entries and then the least
+        recently used.
+        """
+        now = self.timer()
+        expires = now + self.ttl if self.ttl is not None else 0.0
+        with self._lock:
+            self._cache[key] = (expires, element)
+            self._cache.move_to_end(key)
+            if self.ttl is not None:
+                # With a fixed TTL, entries expire in the order they were stored
+                self._expiries.append((expires, key))
+                while self._expiries and self._expiries[0][0] <= now:
+                    expired, old_key = self._expiries.popleft()
+                    entry = self._cache.get(old_key)
+                    # Unless the entry has been stored again since
+                    if entry is not None and entry[0] == expired:
+                        del self._cache[old_key]
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+            if len(self._expiries) > 2 * self.maxsize:
+                # Drop what was evicted or stored again, so the expiries
+                # don't keep old keys alive
+                cache = self._cache
+                self._expiries = deque(
+                    (expires, key)
+                    for expires, key in self._expiries
+                    if (entry := cache.get(key)) is not None and entry[0] == expires
+                )
+
+    def __call__(
+        self, attributes: Mapping[str, str | None], children: Sequence[str | Element]
+    ) -> object:
+        """Invoke the component, or return its cached output."""
+        try:
+            key = (_attributes_key(attributes), _children_key(children))
+            hash(key)
+        except TypeError:
+            # Unhashable values can't be cached; just call the component
+            return self.component(attributes, children)
+        if self.is_async:
+            return self._call_async(key, attributes, children)
+        element = self._lookup(key)
+        if element is None:
+            element = self.component(attributes, children)
+            self._store(key, element)
+        return element
+
+    async def _call_async(
+        self,
+        key: tuple,
+        attributes: Mapping[str, str | None],
+        children: Sequence[str | Element],
+    ) -> Element:
+        """Like `__call__()`, for async components."""
+        element = self._lookup(key)
+        if element is None:
+            element = await self.component(attributes, children)
+            self._store(key, element)
+        return element
+
+    def cache_info(self) -> ComponentCacheInfo:
+        """Return statistics for the cache."""
+        with self._lock:
+            return ComponentCacheInfo(
+                self._hits, self._misses, self.maxsize, len(self._cache)
+            )
+
+    def cache_clear(self) -> None:
+        """Empty the cache and reset its statistics."""
+        with self._lock:
+            self._cache.clear()
+            self._expiries.clear()
+            self._hits = self._misses = 0
+
+
+def memoize_component(
+    maxsize: int = 128, ttl: float | None = None
+) -> Callable[[Callable], MemoizedComponent]:
+    """
+    Decorate a component so that its output is cached.
+
+    Up to `maxsize` distinct calls are kept, least recently used first out.
+    If `ttl` is given, cached output expires after that many seconds.
+    """
+
+    def decorator(component: Callable) -> MemoizedComponent:
+        return MemoizedComponent(component, maxsize=maxsize, ttl=ttl)
+
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Caching fragments of a page, by key
+# ---------------------------------------------------------------------------
+
+
+class FragmentCacheInfo(NamedTuple):
+    """Statistics for a fragment cache."""
+
+    hits: int
+    misses: int
+    currsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+# A cached fragment (an Element, or its HTML) and when it expires, if ever
+type _FragmentEntry = tuple[Element | Markup, float | None]
+
+
+class FragmentBackend(Protocol):
+    """Where a `FragmentCache` keeps its fragments."""
+
+    def get(self, key: str) -> _FragmentEntry | None: ...
+
+    def set(self, key: str, fragment: Element, expires: float | None) -> None: ...
+
+    def delete_prefix(self, prefix: str) -> int: ...
+
+    def clear(self) -> None: ...
+
+    def __len__(self) -> int: ...
+
+
+class MemoryBackend:
+    """
+    Keep fragments in memory, as Elements, least recently used first out.
+
+    Elements are kept as-is (with their HTML rendered once), so a hit costs
+    nothing to build or render, and the tree is still there to query.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, _FragmentEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> _FragmentEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, fragment: Element, expires: float | None) -> None:
+        with self._lock:
+            self._entries[key] = (fragment, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskBackend:
+    """
+    Keep fragments on disk, as HTML files in a directory.
+
+    Fragments survive restarts and can be shared by worker processes (the
+    expiry times are wall-clock times). Each file starts with a line of JSON
+    holding the key and expiry time, followed by the HTML.
+    """
+
+    def __init__(self, directory: str | os.PathLike[str]) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / f"{digest}.html"
+
+    @staticmethod
+    def _read(path: Path) -> tuple[dict, str] | None:
+        """Read a fragment file's header and HTML, if it (still) exists."""
+        try:
+            header, _, text = path.read_text(encoding="utf-8").partition("\n")
+            entry = json.loads(header)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            entry = None
+        if isinstance(entry, dict) and isinstance(entry.get("key"), str):
+            return entry, text
+        # A corrupt file (say, one cut short by a full disk) is a miss, and
+        # is dropped so it's written afresh
+        path.unlink(missing_ok=True)
+        return None
+
+    def get(self, key: str) -> _FragmentEntry | None:
+        entry = self._read(self._path(key))
+        if entry is None or entry[0]["key"] != key:
+            return None
+        return Markup(entry[1]), entry[0].get("expires")
+
+    def set(self, key: str, fragment: Element, expires: float | None) -> None:
+        header = json.dumps({"key": key, "expires": expires})
+        path = self._path(key)
+        # Write to a temporary file first, so readers never see half a file
+        temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_text(f"{header}\n{fragment}", encoding="utf-8")
+        temporary.replace(path)
+
+    def delete_prefix(self, prefix: str) -> int:
+        deleted = 0
+        for path in self.directory.glob("*.html"):
+            entry = self._read(path)
+            if entry is not None and entry[0]["key"].startswith(prefix):
+                path.unlink(missing_ok=True)
+                deleted += 1
+        return deleted
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.html"):
+            path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.directory.glob("*.html"))
+
+
+class FragmentCache:
+    """
+    A cache of page fragments, keyed by strings, for use with `Cached`.
+
+    Keys are best built from what the fragment depends on, with a common
+    prefix for related fragments (like `"product:42:"`), so that they can be
+    invalidated together with `invalidate()`.
+    """
+
+    def __init__(
+        self,
+        backend: FragmentBackend | None = None,
+        timer: Callable[[], float] = time.time,
+    ) -> None:
+        self.backend: FragmentBackend = (
+            backend if backend is not None else MemoryBackend()
+        )
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def fetch(self, cached: Cached) -> Element | Markup:
+        """Return the fragment for a `Cached` value, building it on a miss."""
+        entry = self.backend.get(cached.key)
+        if entry is not None and (entry[1] is None or entry[1] > self.timer()):
+            with self._lock:
+                self._hits += 1
+            return entry[0]
+        with self._lock:
+            self._misses += 1
+        fragment = cached.build()
+        expires = self.timer() + cached.ttl if cached.ttl is not None else None
+        self.backend.set(cached.key, fragment, expires)
+        return fragment
+
+    def invalidate(self, prefix: str) -> int:
+        """Drop every fragment whose key starts with `prefix`; return how many."""
+        return self.backend.delete_prefix(prefix)
+
+    def cache_info(self) -> FragmentCacheInfo:
+        """Return hit, miss, and size statistics."""
+        with self._lock:
+            return FragmentCacheInfo(self._hits, self._misses, len(self.backend))
+
+    def cache_clear(self) -> None:
+        """Drop every fragment and reset the statistics."""
+        self.backend.clear()
+        with self._lock:
+            self._hits = self._misses = 0
+
+
+# The cache used by `Cached` values that don't name one
+fragment_cache = FragmentCache()
+
+
+@dataclass(frozen=True, eq=False)
+class Cached:
+    """
+    A content value whose HTML is cached, like `{Cached("sidebar", sidebar)}`.
+
+    `content` is what to render on a miss: a Template, an Element, or a
+    function (with no arguments) that returns one of those, so that even
+    the values for the fragment aren't computed on a hit. Fragments are
+    kept for `ttl` seconds (forever if None) in `cache`.
+    """
+
+    key: str
+    content: Template | Element | Callable[[], Template | Element]
+    ttl: float | None = None
+    cache: FragmentCache | None = None
+
+    def build(self) -> Element:
+        """
+        Build the fragment and render it once, ready to be reused.
+
+        The result is a fragment holding the built element and its HTML, so
+        an element passed in as `content` is left as it is.
+        """
+        content = self.content
+        if callable(content):
+            content = content()
+        element = html(content) if isinstance(content, Template) else content
+        if not isinstance(element, Element):
+            raise HTMLParseError(f"Unsupported cached content: {type(element)}")
+        # Render (and so consume any lazy children) just once, as for static
+        # subtrees; the fragment is new, so only the cache ever sees it
+        fragment = Element.fragment((element,))
+        object.__setattr__(fragment, "_markup", str(element))
+        return fragment
+
+
+def _process_cached(value: Cached) -> Sequence[str | Element]:
+    cache = value.cache if value.cache is not None else fragment_cache
+    return (cache.fetch(value),)
+
+
+content_processors.register(Cached, _process_cached)
+
+
+# ---------------------------------------------------------------------------
+# Rendering templates straight to bytes
+# ---------------------------------------------------------------------------
+
+
+def _render_children_bytes(
+    children: Sequence[str | Element], write: Callable[[bytes], object]
+) -> None:
+    """Render already built children to UTF-8 encoded HTML."""
+    for child in children:
+        if isinstance(child, Element):
+            write(bytes(child))
+        else:
+            write(_escape_text(child).encode())
+
+
+def _open_compiled_bytes(
+    compiled: _CompiledElement,
+    interpolations: tuple[Interpolation, ...],
+    write: Callable[[bytes], object],
+) -> bytes | None:
+    """
+    Render the markup that opens a compiled element as UTF-8 encoded HTML.
+
+    Also return the end tag if the compiled children still need to be
+    rendered, or None if the element has been rendered completely.
+    """
+    if compiled.encoded_static is not None:
+        write(compiled.encoded_static)
+        return None
+    start_tag = compiled.encoded_start_tag
+    if start_tag is None:
+        # Fall back to building the element (for instance, for components)
+        write(bytes(_build_element(compiled, interpolations)))
+        return None
+
+    for piece in start_tag.pieces:
+        if isinstance(piece, bytes):
+            write(piece)
+        else:
+            value = cast(str, _resolve_attribute_value(piece, interpolations))
+            write(_escape_attribute_value(value).encode())
+
+    # Interpolated text may turn out to be empty, in which case the element
+    # has no children after all
+    if all(isinstance(child, _CompiledText) for child in compiled.children):
+        children: list[str | Element] = []
+        for child in compiled.children:
+            _build_text(cast(_CompiledText, child).parts, interpolations, children)
+        if not children:
+            write(b" />")
+            return None
+        write(b">")
+        _render_children_bytes(children, write)
+        write(start_tag.end_tag)
+        return None
+
+    write(b">")
+    return start_tag.end_tag
+
+
+def _render_compiled_bytes(
+    compiled: _CompiledElement,
+    interpolations: tuple[Interpolation, ...],
+    write: Callable[[bytes], object],
+) -> None:
+    """
+    Render a compiled element and its values to UTF-8 encoded HTML.
+
+    The output is the same as building the element and rendering it, but
+    static markup is written as-is and only interpolated values are escaped
+    and encoded.
+    """
+    end = _open_compiled_bytes(compiled, interpolations, write)
+    if end is None:
+        return
+    # Walk the compiled tree with an explicit stack, as Element.render_into()
+    # walks an Element tree
+    stack: list[tuple[Iterator[bytes | _CompiledText | _CompiledElement], bytes]] = []
+    pending = iter(compiled.encoded_children)
+    while True:
+        for child in pending:
+            if isinstance(child, bytes):
+                write(child)
+            elif isinstance(child, _CompiledText):
+                children: list[str | Element] = []
+                _build_text(child.parts, interpolations, children)
+                _render_children_bytes(children, write)
+            elif child_end := _open_compiled_bytes(child, interpolations, write):
+                stack.append((pending, end))
+                pending, end = iter(child.encoded_children), child_end
+                break
+        else:
+            write(end)
+            if not stack:
+                return
+            pending, end = stack.pop()
+
+
+def html_chunks(template: Template) -> list[bytes]:
+    """
+    Convert a Template straight to UTF-8 encoded HTML chunks.
+
+    This is equivalent to `[bytes(html(template))]`, but skips building most
+    of the Element tree, and the chunks are ready to pass to, for instance,
+    `writelines()` on a binary stream.
+    """
+    if _budget.get() is not None:
+        # Limits are checked while building and rendering Elements
+        return [bytes(html(template))]
+    if _hooks:
+        shape = _shape_label(template.strings)
+        return _timed_render(shape, lambda: _html_chunks(template))
+    return _html_chunks(template)
+
+
+def _html_chunks(template: Template) -> list[bytes]:
+    """Implement `html_chunks()`."""
+    compiled = _compile(template.strings)
+    interpolations = template.interpolations
+    _check_end_tags(compiled, interpolations)
+    chunks: list[bytes] = []
+    _render_compiled_bytes(compiled.root, interpolations, chunks.append)
+    return chunks
+
+
+def html_bytes(template: Template) -> bytes:
+    """Convert a Template straight to UTF-8 encoded HTML."""
+    if _budget.get() is not None:
+        # Limits are checked while building and rendering Elements
+        return bytes(html(template))
+    if _hooks:
+        shape = _shape_label(template.strings)
+        return _timed_render(shape, lambda: _html_bytes(template))
+    return _html_bytes(template)
+
+
+def _html_bytes(template: Template) -> bytes:
+    """Implement `html_bytes()`."""
+    compiled = _compile(template.strings)
+    interpolations = template.interpolations
+    _check_end_tags(compiled, interpolations)
+    buffer = bytearray()
+    _render_compiled_bytes(compiled.root, interpolations, buffer.extend)
+    return bytes(buffer)
+
+
+# ---------------------------------------------------------------------------
+# Rendering with Content-Length and ETag headers, and conditional requests
+# ---------------------------------------------------------------------------
+
+
+class TaggedHTML(NamedTuple):
+    """UTF-8 encoded HTML, with its length and a strong ETag for its content."""
+
+    body: bytes
+    content_length: int
+    etag: str
+
+    def headers(self) -> list[tuple[str, str]]:
+        """Return the Content-Length and ETag headers for the body."""
+        return [("Content-Length", str(self.content_length)), ("ETag", self.etag)]
+
+
+class NotModified(NamedTuple):
+    """The client's copy, with this ETag, is still current; send a 304."""
+
+    etag: str
+
+    def headers(self) -> list[tuple[str, str]]:
+        """Return the ETag header for the response."""
+        return [("ETag", self.etag)]
+
+
+def _etag(hexdigest: str) -> str:
+    return f'"{hexdigest[:32]}"'
+
+
+def html_tagged(content: Template | Element) -> TaggedHTML:
+    """
+    Render a Template or Element to UTF-8 encoded HTML, with its length and
+    ETag.
+
+    Templates are rendered as by `html_bytes()`, and Elements as by
+    `render_bytes_into()`. Each chunk is hashed as it is written, so the body
+    is produced and hashed in one pass.
+    """
+    if not isinstance(content, Element) and (_budget.get() is not None or _hooks):
+        # Limits and hooks are handled by html_bytes()
+        body = html_bytes(content)
+        return TaggedHTML(body, len(body), _etag(hashlib.sha256(body).hexdigest()))
+    digest = hashlib.sha256()
+    update = digest.update
+    buffer = bytearray()
+    extend = buffer.extend
+
+    def write(chunk: bytes) -> None:
+        extend(chunk)
+        update(chunk)
+
+    if isinstance(content, Element):
+
+        def render() -> bytes:
+            content.render_bytes_into(write)
+            return bytes(buffer)
+
+        body = _timed_render(_element_shape(content), render) if _hooks else render()
+        return TaggedHTML(body, len(body), _etag(digest.hexdigest()))
+    compiled = _compile(content.strings)
+    interpolations = content.interpolations
+    _check_end_tags(compiled, interpolations)
+    _render_compiled_bytes(compiled.root, interpolations, write)
+    return TaggedHTML(bytes(buffer), len(buffer), _etag(digest.hexdigest()))
+
+
+class ETagStore:
+    """
+    The ETags of recently rendered templates, keyed by shape and values.
+
+    Up to `maxsize` ETags are kept, least recently used first out.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self._etags: OrderedDict[tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        """Return the ETag stored for `key`, if any."""
+        with self._lock:
+            etag = self._etags.get(key)
+            if etag is not None:
+                self._etags.move_to_end(key)
+            return etag
+
+    def set(self, key: tuple, etag: str) -> None:
+        """Store the ETag for `key`, evicting the least recently used."""
+        with self._lock:
+            self._etags[key] = etag
+            self._etags.move_to_end(key)
+            while len(self._etags) > self.maxsize:
+                self._etags.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all stored ETags."""
+        with self._lock:
+            self._etags.clear()
+
+    def __len__(self) -> int:
+        return len(self._etags)
+
+
+# The store used by html_conditional() when not given one
+etag_store = ETagStore()
+
+# Values that can't change once created, and so can key a rendered page
+_IMMUTABLE_TYPES = frozenset(
+    {str, Markup, int, float, Decimal, Fraction, date, datetime, time_of_day}
+)
+
+
+def _input_key(value: object) -> object:
+    """
+    Return a hashable key for an interpolated value and what it renders.
+
+    Raise TypeError for values whose output may change without them
+    comparing unequal, like iterators and objects with `__html__()`.
+    """
+    if value is None or type(value) in _IMMUTABLE_TYPES:
+        # Include the type, so that 1, 1.0 and "1" are told apart
+        return (type(value), value)
+    if isinstance(value, Template):
+        return (
+            Template,
+            value.strings,
+            tuple(
+                (_input_key(i.value), i.conversion, i.format_spec)
+                for i in value.interpolations
+            ),
+        )
+    if isinstance(value, Element):
+        return (Element, _children_key((value,)))
+    if isinstance(value, (list, tuple)):
+        return (tuple, tuple(map(_input_key, value)))
+    if isinstance(value, Mapping):
+        return (dict, tuple((name, _input_key(v)) for name, v in value.items()))
+    if inspect.isfunction(value) or isinstance(value, MemoizedComponent):
+        # Components are assumed to be pure functions of their inputs
+        return value
+    raise TypeError(f"Can't key a page on {type(value)}")
+
+
+def _if_none_match(header: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag, as weak comparison."""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def html_conditional(
+    template: Template, if_none_match: str | None, store: ETagStore | None = None
+) -> TaggedHTML | NotModified:
+    """
+    Render a Template as by `html_tagged()`, unless the client has it already.
+
+    `if_none_match` is the request's If-None-Match header, if any. When the
+    ETag stored for this template shape and these values matches it, the
+    template isn't rendered at all and `NotModified` is returned; this
+    assumes components are pure functions of their inputs. Values that
+    can't key a page (such as generators) always lead to a render.
+    """
+    store = store if store is not None else etag_store
+    try:
+        key = cast(tuple, _input_key(template))
+        hash(key)
+    except TypeError:
+        key = None
+    if key is not None and if_none_match is not None:
+        etag = store.get(key)
+        if etag is not None and _if_none_match(if_none_match, etag):
+            return NotModified(etag)
+    tagged = html_tagged(template)
+    if key is not None:
+        store.set(key, tagged.etag)
+    if if_none_match is not None and _if_none_match(if_none_match, tagged.etag):
+        return NotModified(tagged.etag)
+    return tagged
+
+
+# ---------------------------------------------------------------------------
+# Compressing HTML as it is rendered
+# ---------------------------------------------------------------------------
+
+# Static markup shorter than this is compressed along with the rest; longer
+# markup is compressed once and reused, at the cost of a flush before it
+_MIN_PRECOMPRESSED = 1024
+# How much text to gather before encoding and compressing it
+_COMPRESS_BATCH = 8192
+
+
+@lru_cache(maxsize=256)
+def _precompress(markup: str, level: int) -> tuple[bytes, bytes]:
+    """
+    Encode markup, and compress it to raw deflate blocks that can be spliced
+    into any deflate stream that has just been fully flushed.
+    """
+    encoded = markup.encode()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return encoded, compressor.compress(encoded) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class CompressingWriter:
+    """
+    Compress HTML chunks as they are written, passing on compressed bytes.
+
+    Pass this as the `write` argument of `Element.render_into()`, and call
+    `close()` once rendering is done. `encoding` is "gzip" or "deflate"
+    (the zlib format, as HTTP's Content-Encoding means it). Chunks in
+    `static` are known to repeat across renders; those are compressed once
+    and the compressed bytes reused, which is sound because the compressor
+    is fully flushed before them, so nothing after refers back past them.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[bytes], object],
+        encoding: str = "gzip",
+        level: int = 6,
+        static: frozenset[str] = frozenset(),
+    ) -> None:
+        if encoding not in ("gzip", "deflate"):
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        self.encoding = encoding
+        self.level = level
+        self.static = static
+        self._write = write
+        # Write a raw deflate stream, with our own header and trailer, so
+        # that precompressed blocks can be spliced in
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._checksum = zlib.crc32 if encoding == "gzip" else zlib.adler32
+        self._value = self._checksum(b"")
+        self._size = 0
+        # Text waiting to be compressed, and its length
+        self._text: list[str] = []
+        self._length = 0
+        if encoding == "gzip":
+            # No file name or modification time; the OS is "unknown"
+            write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff")
+        else:
+            write(zlib.compress(b"", level)[:2])
+
+    def __call__(self, chunk: str) -> None:
+        """Compress a chunk of HTML."""
+        if len(chunk) >= _MIN_PRECOMPRESSED and chunk in self.static:
+            self._compress_text()
+            encoded, compressed = _precompress(chunk, self.level)
+            if flushed := self._compressor.flush(zlib.Z_FULL_FLUSH):
+                self._write(flushed)
+            self._write(compressed)
+            self._value = self._checksum(encoded, self._value)
+            self._size += len(encoded)
+            return
+        # Encoding and compressing text in batches is much cheaper than
+        # doing so for each (typically small) chunk
+        self._text.append(chunk)
+        self._length += len(chunk)
+        if self._length >= _COMPRESS_BATCH:
+            self._compress_text()
+
+    def _compress_text(self) -> None:
+        """Compress the text written since the last batch."""
+        if not self._text:
+            return
+        encoded = "".join(self._text).encode()
+        self._text.clear()
+        self._length = 0
+        if compressed := self._compressor.compress(encoded):
+            self._write(compressed)
+        self._value = self._checksum(encoded, self._value)
+        self._size += len(encoded)
+
+    def close(self) -> None:
+        """Finish the stream, writing what's left and the trailer."""
+        self._compress_text()
+        self._write(self._compressor.flush())
+        if self.encoding == "gzip":
+            self._write(
+                self._value.to_bytes(4, "little")
+                + (self._size & 0xFFFFFFFF).to_bytes(4, "little")
+            )
+        else:
+            self._write(self._value.to_bytes(4, "big"))
+
+
+def iter_compressed(
+    content: Template | Element,
+    encoding: str = "gzip",
+    level: int = 6,
+    buffer_size: int = 16384,
+) -> Iterator[bytes]:
+    """
+    Render a Template or Element to compressed HTML, a chunk at a time.
+
+    The HTML is compressed as it is rendered, so neither the full HTML nor
+    the full compressed output is ever held in memory; chunks of at least
+    `buffer_size` bytes (bar the last) are yielded as they fill. For
+    Templates, the larger static parts of the template are compressed just
+    once per template shape.
+    """
+    if isinstance(content, Template):
+        static = _compile(content.strings).static_markup
+        content = html(content)
+    else:
+        static = frozenset()
+    pending: list[bytes] = []
+    size = 0
+
+    def write(compressed: bytes) -> None:
+        nonlocal size
+        pending.append(compressed)
+        size += len(compressed)
+
+    writer = CompressingWriter(write, encoding, level, static)
+    for chunk in content.iter_chunks():
+        writer(chunk)
+        if size >= buffer_size:
+            yield b"".join(pending)
+            pending.clear()
+            size = 0
+    writer.close()
+    yield b"".join(pending)
+
+
+# ---------------------------------------------------------------------------
+# Rendering many pages across a pool of processes
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class PageJob:
+    """
+    A page to render: a callable that returns a Template or an Element.
+
+    The callable and its arguments are sent to a worker process, so they
+    must be picklable (for instance, a module-level function). If `path` is
+    given, the page is written there as UTF-8 instead of being returned.
+    """
+
+    page: Callable[..., Template | Element]
+    args: tuple = ()
+    kwargs: Mapping[str, object] = field(default_factory=dict)
+    path: str | os.PathLike[str] | None = None
+
+
+@dataclass(frozen=True)
+class BatchReport:
+    """The outcome of `render_many()`."""
+
+    # The rendered pages, in job order; None for pages written to a file
+    results: list[str | None]
+    bytes_rendered: int
+    seconds: float
+
+    @property
+    def pages_per_second(self) -> float:
+        """The number of pages rendered per second."""
+        return len(self.results) / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        """The number of bytes of UTF-8 encoded HTML rendered per second."""
+        return self.bytes_rendered / self.seconds if self.seconds else 0.0
+
+
+def _render_job(job: PageJob) -> tuple[str | None, int]:
+    """Render one page, returning it (or None if written) and its size."""
+    page = job.page(*job.args, **job.kwargs)
+    if job.path is None:
+        text = str(html(page) if isinstance(page, Template) else page)
+        return text, len(text.encode())
+    data = html_bytes(page) if isinstance(page, Template) else bytes(page)
+    path = Path(job.path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return None, len(data)
+
+
+def render_many(
+    jobs: Iterable[PageJob], processes: int | None = None, chunksize: int = 64
+) -> BatchReport:
+    """
+    Render many pages, spreading them across a pool of worker processes.
+
+    Jobs are sent to the workers `chunksize` at a time, which keeps the
+    cost of talking to the workers small next to the cost of rendering.
+    `processes` defaults to the number of CPUs; with 1, pages are rendered
+    in this process.
+    """
+    start = time.perf_counter()
+    if processes == 1:
+        rendered = list(map(_render_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            rendered = list(executor.map(_render_job, jobs, chunksize=chunksize))
+    return BatchReport(
+        results=[text for text, _ in rendered],
+        bytes_rendered=sum(size for _, size in rendered),
+        seconds=time.perf_counter() - start,
+    )
+
+
+# ---------------------------------------------------------------------------
+# An async html() that resolves awaitable interpolations concurrently
+# ---------------------------------------------------------------------------
+
+
+async def _resolve_value(value: object, limiter: asyncio.Semaphore | None) -> object:
+    """Await a value (if needed) and convert any resulting Template."""
+    if inspect.isawaitable(value):
+        if limiter is None:
+            value = await value
+        else:
+            async with limiter:
+                value = await value
+    if isinstance(value, Template):
+        value = await _async_html(value, limiter)
+    return value
+
+
+def _has_components(
+    compiled: _CompiledElement,
+    interpolations: tuple[Interpolation, ...],
+    memo: dict[int, bool],
+) -> bool:
+    """Return True if any element in the compiled subtree is a component."""
+    key = id(compiled)
+    if key not in memo:
+        memo[key] = callable(_resolve_tag(compiled.tag, interpolations)) or any(
+            _has_components(child, interpolations, memo)
+            for child in compiled.children
+            if isinstance(child, _CompiledElement)
+        )
+    return memo[key]
+
+
+async def _async_build_element(
+    compiled: _CompiledElement,
+    interpolations: tuple[Interpolation, ...],
+    limiter: asyncio.Semaphore | None,
+    memo: dict[int, bool],
+) -> Element:
+    """Like `_build_element()`, but components may be async."""
+    # Subtrees without components can't await anything
+    if not _has_components(compiled, interpolations, memo):
+        return _build_element(compiled, interpolations)
+
+    tag = _resolve_tag(compiled.tag, interpolations)
+    attributes = _build_attributes(compiled.attributes, interpolations)
+    children: list[str | Element] = []
+    pending: list[tuple[int, asyncio.Task[Element]]] = []
+    async with asyncio.TaskGroup() as task_group:
+        for child in compiled.children:
+            if isinstance(child, str):
+                children.append(child)
+            elif isinstance(child, _CompiledText):
+                _build_text(child.parts, interpolations, children)
+            else:
+                # Build sibling subtrees concurrently, keeping their place
+                coroutine = _async_build_element(child, interpolations, limiter, memo)
+                pending.append((len(children), task_group.create_task(coroutine)))
+                children.append("")
+    for index, task in pending:
+        children[index] = task.result()
+
+    if callable(tag):
+        if (budget := _budget.get()) is not None:
+            budget.check_time()
+        start = time.perf_counter()
+        element = await _resolve_value(tag(attributes, children), limiter)
+        if _hooks:
+            _emit("component", _component_name(tag), start)
+        return cast(Element, element)
+    return _make_element(tag, attributes, children)
+
+
+async def _async_html(template: Template, limiter: asyncio.Semaphore | None) -> Element:
+    """Implement `async_html()` with a shared concurrency limiter."""
+    tasks: dict[int, asyncio.Task[object]] = {}
+    async with asyncio.TaskGroup() as task_group:
+        for index, value in enumerate(template.values):
+            if inspect.isawaitable(value) or isinstance(value, Template):
+                coroutine = _resolve_value(value, limiter)
+                tasks[index] = task_group.create_task(coroutine)
+    interpolations = tuple(
+        (
+            Interpolation(
+                tasks[index].result(), i.expression, i.conversion, i.format_spec
+            )
+            if index in tasks
+            else i
+        )
+        for index, i in enumerate(template.interpolations)
+    )
+
+    compiled = _compile(template.strings)
+    if (budget := _budget.get()) is not None:
+        budget.charge(compiled)
+    _check_end_tags(compiled, interpolations)
+    return await _async_build_element(compiled.root, interpolations, limiter, {})
+
+
+async def async_html(template: Template, limit: int | None = None) -> Element:
+    """
+    Convert a Template to an Element, awaiting any awaitable values.
+
+    This is the `html()` function, adapted to allow interpolations that are
+    awaitable (like coroutines) in content and attribute positions, and
+    component functions that are `async`. Everything that can run at the same
+    time does, so a page with several slow fragments takes about as long as
+    its slowest fragment. Pass `limit` to cap how many awaitables run at once.
+    """
+    limiter = asyncio.Semaphore(limit) if limit is not None else None
+    if not _hooks:
+        element = await _async_html(template, limiter)
+    else:
+        start = time.perf_counter()
+        element = await _async_html(template, limiter)
+        shape = _shape_label(template.strings)
+        _emit("build", shape, start, elements=_count_elements(element))
+        _note_shape(element, shape)
+    if (budget := _budget.get()) is not None:
+        # Nested templates are built concurrently, before it's known where
+        # they go, so the depth is checked once the tree is complete
+        _check_tree_depth(element, budget)
+    return element
+
+
+# ---------------------------------------------------------------------------
+# Streaming html() output as the values it needs become ready
+# ---------------------------------------------------------------------------
+
+
+class _Flush:
+    """The type of `FLUSH`."""
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "FLUSH"
+
+
+# Interpolate this in content to send everything before it straight away
+# when streaming; it renders as nothing
+FLUSH = _Flush()
+content_processors.register(_Flush, lambda value: ())
+
+
+def _start_tag_indexes(compiled: _CompiledElement) -> list[int]:
+    """Return the interpolations needed to render an element's start tag."""
+    indexes = [part for part in compiled.tag if isinstance(part, int)]
+    for attribute in compiled.attributes:
+        if isinstance(attribute, _CompiledSpread):
+            indexes.append(attribute.index)
+            continue
+        for parts in (attribute.name, attribute.value):
+            if isinstance(parts, tuple):
+                indexes.extend(part for part in parts if isinstance(part, int))
+    return indexes
+
+
+def _subtree_indexes(compiled: _CompiledElement) -> list[int]:
+    """Return the interpolations needed to render a whole compiled subtree."""
+    indexes: list[int] = []
+    pending = [compiled]
+    while pending:
+        element = pending.pop()
+        indexes.extend(_start_tag_indexes(element))
+        for child in element.children:
+            if isinstance(child, _CompiledText):
+                indexes.extend(part for part in child.parts if isinstance(part, int))
+            elif isinstance(child, _CompiledElement):
+                pending.append(child)
+    return indexes
+
+
+class _Stream:
+    """The state of one `stream_html()` call: its values and unsent output."""
+
+    def __init__(
+        self,
+        template: Template,
+        limiter: asyncio.Semaphore | None,
+        buffer_size: int,
+    ) -> None:
+        self.limiter = limiter
+        self.buffer_size = buffer_size
+        # Interpolations are replaced by their resolved values as they're needed
+        self.interpolations = list(template.interpolations)
+        # Start resolving every awaitable value now, so they run concurrently
+        self.tasks = {
+            index: asyncio.ensure_future(_resolve_value(value, limiter))
+            for index, value in enumerate(template.values)
+            if inspect.isawaitable(value) or isinstance(value, Template)
+        }
+        self.chunks: list[str] = []
+        self.size = 0
+        # The limits in effect, if any, checked as the output is written
+        self.budget = _budget.get()
+
+    def write(self, chunk: str) -> None:
+        """Add a chunk to the output that hasn't been sent yet."""
+        if self.budget is not None:
+            self.budget.render_chunk(chunk)
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+
+    def render(self, nodes: Sequence[str | Element], depth: int) -> Iterator[str]:
+        """
+        Render elements and text, the children of an element at `depth`, into
+        the output, yielding it whenever it's full.
+        """
+        if self.budget is not None:
+            # This counts the chunks against the budget itself
+            chunks = _limited_chunks(nodes, self.budget, depth)
+        else:
+            chunks = Element.fragment(nodes).iter_chunks()
+        for chunk in chunks:
+            self.chunks.append(chunk)
+            self.size += len(chunk)
+            if self.size >= self.buffer_size:
+                yield self.take()
+
+    def full(self) -> bool:
+        """Return True if the unsent output should be sent now."""
+        return self.size >= self.buffer_size
+
+    def take(self) -> str:
+        """Return (and forget) the output that hasn't been sent yet."""
+        chunk = "".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return chunk
+
+    def must_wait(self, indexes: Iterable[int]) -> bool:
+        """Return True if any of the given values is still being resolved."""
+        tasks = self.tasks
+        return any(index in tasks and not tasks[index].done() for index in indexes)
+
+    async def resolve(self, indexes: Iterable[int]) -> None:
+        """Wait for the given values, and substitute them."""
+        for index in indexes:
+            if (task := self.tasks.pop(index, None)) is not None:
+                i = self.interpolations[index]
+                self.interpolations[index] = Interpolation(
+                    await task, i.expression, i.conversion, i.format_spec
+                )
+
+    def values(self) -> tuple[Interpolation, ...]:
+        """The interpolations, for helpers that only index the resolved ones."""
+        return cast(tuple[Interpolation, ...], self.interpolations)
+
+    def flushes(self, indexes: Iterable[int]) -> bool:
+        """Return True if any of the given values is `FLUSH`."""
+        return any(self.interpolations[index].value is FLUSH for index in indexes)
+
+    def cancel(self) -> None:
+        """Stop resolving values that are no longer needed."""
+        for task in self.tasks.values():
+            task.cancel()
+
+
+async def _stream_element(
+    compiled: _CompiledElement, stream: _Stream, depth: int = 1
+) -> AsyncIterator[str]:
+    """
+    Render a compiled element, at `depth` in the page, into `stream`, in
+    document order.
+
+    Yield whenever the unsent output should be sent: when the buffer is
+    full, at a `FLUSH`, and before waiting for a value that isn't ready.
+    """
+    if compiled.static is not None:
+        if stream.budget is not None:
+            for chunk in stream.render((compiled.static,), depth - 1):
+                yield chunk
+            return
+        stream.write(str(compiled.static))
+        if stream.full():
+            yield stream.take()
+        return
+
+    indexes = _start_tag_indexes(compiled)
+    if stream.must_wait(indexes) and stream.chunks:
+        yield stream.take()
+    await stream.resolve(indexes)
+    tag = _resolve_tag(compiled.tag, stream.values())
+    if callable(tag):
+        # Components need their children built first, so wait for the subtree
+        indexes = _subtree_indexes(compiled)
+        if stream.must_wait(indexes) and stream.chunks:
+            yield stream.take()
+        await stream.resolve(indexes)
+        element = await _async_build_element(
+            compiled, stream.values(), stream.limiter, {}
+        )
+        for chunk in stream.render((element,), depth - 1):
+            yield chunk
+        return
+
+    if stream.budget is not None:
+        stream.budget.render_node(depth)
+    attributes_str = _render_attributes_mapping(
+        _build_attributes(compiled.attributes, stream.values())
+    )
+    start = f"<{tag} {attributes_str}" if attributes_str else f"<{tag}"
+    end = f"</{tag}>"
+    texts = all(isinstance(child, _CompiledText) for child in compiled.children)
+    if not tag:
+        start, end = "", ""
+    elif texts:
+        # Interpolated text may turn out to be empty, in which case the
+        # element has no children after all
+        indexes = _subtree_indexes(compiled)
+        if stream.must_wait(indexes) and stream.chunks:
+            yield stream.take()
+        await stream.resolve(indexes)
+        children: list[str | Element] = []
+        for child in compiled.children:
+            _build_text(cast(_CompiledText, child).parts, stream.values(), children)
+        if not children:
+            stream.write(f"{start} />")
+        else:
+            stream.write(f"{start}>")
+            for chunk in stream.render(children, depth):
+                yield chunk
+            stream.write(end)
+        if stream.full() or (stream.chunks and stream.flushes(indexes)):
+            yield stream.take()
+        return
+    else:
+        start += ">"
+    stream.write(start)
+    if stream.full():
+        yield stream.take()
+
+    for child in compiled.children:
+        if isinstance(child, str):
+            stream.write(_escape_text(child))
+        elif isinstance(child, _CompiledText):
+            indexes = [part for part in child.parts if isinstance(part, int)]
+            if stream.must_wait(indexes) and stream.chunks:
+                yield stream.take()
+            await stream.resolve(indexes)
+            children = []
+            _build_text(child.parts, stream.values(), children)
+            for chunk in stream.render(children, depth):
+                yield chunk
+            if stream.chunks and stream.flushes(indexes):
+                yield stream.take()
+                continue
+        else:
+            async for chunk in _stream_element(child, stream, depth + 1):
+                yield chunk
+            continue
+        if stream.full():
+            yield stream.take()
+    stream.write(end)
+    if stream.full():
+        yield stream.take()
+
+
+async def stream_html(
+    template: Template, limit: int | None = None, buffer_size: int = 4096
+) -> AsyncIterator[str]:
+    """
+    Render a Template to HTML as it becomes ready, for streaming responses.
+
+    Like `async_html()`, awaitable values are resolved concurrently, but
+    rather than waiting for all of them, the HTML is yielded in chunks, in
+    document order, as soon as everything before each point is ready. So the
+    head and static shell of a page go out while slow fragments load.
+
+    Output is buffered, and a chunk is yielded when `buffer_size` characters
+    have accumulated (0 yields every piece), wherever `FLUSH` is
+    interpolated, and before waiting for a value that isn't ready yet. The
+    chunks joined together equal `str(await async_html(template))`.
+    """
+    limiter = asyncio.Semaphore(limit) if limit is not None else None
+    stream = _Stream(template, limiter, buffer_size)
+    try:
+        compiled = _compile(template.strings)
+        if stream.budget is not None:
+            stream.budget.charge(compiled)
+        indexes = [
+            part
+            for pair in compiled.dynamic_end_tags
+            for tag in pair
+            for part in tag
+            if isinstance(part, int)
+        ]
+        await stream.resolve(indexes)
+        _check_end_tags(compiled, stream.values())
+        async for chunk in _stream_element(compiled.root, stream):
+            yield chunk
+        if stream.chunks:
+            yield stream.take()
+    finally:
+        stream.cancel()
@@ -0,0 +1,413 @@
+"""
+Compute the differences between two Element trees as a list of patches.
+
+This is useful for live updates: rather than re-sending a whole page when
+state changes, a server renders the new tree with `html()`, diffs it
+against the tree the client already has, and sends just the patches.
+
+Patches are applied in order. Each one refers to nodes by their path: the
+indexes of the children to follow from the root, in the tree as it is when
+that patch is applied. Paths count children as the browser does: fragments
+are spliced into their parents, and adjacent text is one text node. A
+`Markup` string is taken to be a single node. As in the browser, patches
+don't merge text nodes: text that a patch leaves next to other text is
+still a node of its own for the patches after it. Children with a key (a
+`data-key` or `id` attribute) are matched by key, so reordering a keyed
+list produces moves rather than a cascade of changes; other children are
+matched in order.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Iterator, Mapping, Sequence, cast
+
+from .web import Element, Markup
+
+type Path = tuple[int, ...]
+type Node = str | Element
+
+# Attributes that identify a child among its siblings, in order of preference
+KEY_ATTRIBUTES = ("data-key", "id")
+
+
+# ---------------------------------------------------------------------------
+# Patch operations
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ReplaceText:
+    """Replace the text node at `path`."""
+
+    path: Path
+    text: str
+
+    def to_json(self) -> list:
+        return ["text", list(self.path), self.text]
+
+
+@dataclass(frozen=True)
+class SetAttribute:
+    """Set (or add) an attribute of the element at `path`."""
+
+    path: Path
+    name: str
+    value: str | None
+
+    def to_json(self) -> list:
+        return ["set", list(self.path), self.name, self.value]
+
+
+@dataclass(frozen=True)
+class RemoveAttribute:
+    """Remove an attribute of the element at `path`."""
+
+    path: Path
+    name: str
+
+    def to_json(self) -> list:
+        return ["unset", list(self.path), self.name]
+
+
+@dataclass(frozen=True)
+class InsertChild:
+    """Insert a node as child number `index` of the element at `path`."""
+
+    path: Path
+    index: int
+    node: Node
+
+    def to_json(self) -> list:
+        return ["insert", list(self.path), self.index, _node_json(self.node)]
+
+
+@dataclass(frozen=True)
+class RemoveChild:
+    """Remove child number `index` of the element at `path`."""
+
+    path: Path
+    index: int
+
+    def to_json(self) -> list:
+        return ["remove", list(self.path), self.index]
+
+
+@dataclass(frozen=True)
+class MoveChild:
+    """Move a child of the element at `path` from one index to another."""
+
+    path: Path
+    from_index: int
+    to_index: int
+
+    def to_json(self) -> list:
+        return ["move", list(self.path), self.from_index, self.to_index]
+
+
+@dataclass(frozen=True)
+class ReplaceNode:
+    """Replace the node at `path` entirely."""
+
+    path: Path
+    node: Node
+
+    def to_json(self) -> list:
+        return ["replace", list(self.path), _node_json(self.node)]
+
+
+type Patch = (
+    ReplaceText
+    | SetAttribute
+    | RemoveAttribute
+    | InsertChild
+    | RemoveChild
+    | MoveChild
+    | ReplaceNode
+)
+
+
+def _node_json(node: Node) -> str | list:
+    """Serialize a node: text as-is, and elements and markup as their HTML."""
+    return node if _is_text(node) else ["html", str(node)]
+
+
+# ---------------------------------------------------------------------------
+# Diffing
+# ---------------------------------------------------------------------------
+
+
+def _is_text(node: Node) -> bool:
+    """Return True if the node is plain text, rather than markup or an element."""
+    return isinstance(node, str) and not isinstance(node, Markup)
+
+
+def _dom_children(element: Element) -> tuple[Node, ...]:
+    """
+    Return an element's children as the browser sees them.
+
+    The children of fragments are spliced in, empty text is dropped, and
+    adjacent text is merged. Lazy children are consumed.
+    """
+    if type(element.children) is tuple and len(element.children) == 1:
+        (only,) = element.children
+        if (isinstance(only, Element) and only.tag) or (_is_text(only) and only):
+            # A common case, like <td>text</td>, with nothing to splice or merge
+            return element.children
+    children: list[Node] = []
+    stack = [iter(element.children)]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, Element) and not child.tag:
+                stack.append(iter(child.children))
+                break
+            if not _is_text(child):
+                children.append(child)
+            elif child:
+                if children and _is_text(children[-1]):
+                    children[-1] = cast(str, children[-1]) + child
+                else:
+                    children.append(child)
+        else:
+            stack.pop()
+    return tuple(children)
+
+
+def _key(node: Node) -> tuple[str, str] | None:
+    """Return the key that identifies a node among its siblings, if any."""
+    if isinstance(node, str) or not (attributes := node.attributes):
+        return None
+    for name in KEY_ATTRIBUTES:
+        value = attributes.get(name)
+        if value is not None:
+            return (node.tag, value)
+    return None
+
+
+def _diff_attributes(
+    path: Path,
+    old: Mapping[str, str | None],
+    new: Mapping[str, str | None],
+    patches: list[Patch],
+) -> None:
+    """Append the patches that turn one set of attributes into another."""
+    if old.items() == new.items():
+        # A quick check that works for the tuples of pairs Elements keep
+        return
+    for name in old:
+        if name not in new:
+            patches.append(RemoveAttribute(path, name))
+    for name, value in new.items():
+        if name not in old or old[name] != value:
+            patches.append(SetAttribute(path, name, value))
+
+
+def _diff_node(path: Path, old: Node, new: Node, patches: list[Patch]) -> None:
+    """Append the patches that turn the node at `path` into `new`."""
+    if old is new:
+        # Shared subtrees (static, memoized or interned) are unchanged
+        return
+    if isinstance(old, str) or isinstance(new, str):
+        if _is_text(old) and _is_text(new):
+            if old != new:
+                patches.append(ReplaceText(path, cast(str, new)))
+        elif type(old) is not type(new) or old != new:
+            # Markup, like an element, is replaced as a whole
+            patches.append(ReplaceNode(path, new))
+        return
+    if old.tag != new.tag:
+        patches.append(ReplaceNode(path, new))
+        return
+    _diff_attributes(path, old.attributes, new.attributes, patches)
+    _diff_children(path, _dom_children(old), _dom_children(new), patches)
+
+
+def _diff_children(
+    path: Path, old: Sequence[Node], new: Sequence[Node], patches: list[Patch]
+) -> None:
+    """Append the patches that turn one list of children into another."""
+    old_keys = [_key(node) for node in old]
+    new_keys = [_key(node) for node in new]
+    if old_keys == new_keys:
+        # The common case: the same children, in the same order
+        for index, (old_node, new_node) in enumerate(zip(old, new)):
+            if old_node is new_node:
+                continue
+            if type(old_node) is str and type(new_node) is str:
+                # Save a call for the most common leaves
+                if old_node != new_node:
+                    patches.append(ReplaceText((*path, index), new_node))
+                continue
+            _diff_node((*path, index), old_node, new_node, patches)
+        return
+
+    # Match old children to new ones: keyed children by key, and the rest
+    # in order
+    new_indexes = {key: index for index, key in enumerate(new_keys) if key}
+    unkeyed_new = [index for index, key in enumerate(new_keys) if key is None]
+    # For each new child, the index of the old child it was matched with
+    matches: dict[int, int] = {}
+    unkeyed = 0
+    for index, key in enumerate(old_keys):
+        if key is not None:
+            if (target := new_indexes.get(key)) is not None and target not in matches:
+                matches[target] = index
+        elif unkeyed < len(unkeyed_new):
+            matches[unkeyed_new[unkeyed]] = index
+            unkeyed += 1
+
+    # Remove unmatched old children, from the end so indexes stay valid
+    kept = set(matches.values())
+    for index in range(len(old) - 1, -1, -1):
+        if index not in kept:
+            patches.append(RemoveChild(path, index))
+
+    # Then put the new children in place, one position at a time. `current`
+    # holds the old indexes of the remaining children, in their current order.
+    current = [index for index in range(len(old)) if index in kept]
+    position = {old_index: index for index, old_index in enumerate(current)}
+    moved = False
+    for target, node in enumerate(new):
+        source = matches.get(target)
+        if source is None:
+            patches.append(InsertChild(path, target, node))
+            current.insert(target, -1)
+            moved = True
+            continue
+        if target >= len(current) or current[target] != source:
+            at = current.index(source, target) if moved else position[source]
+            if at != target:
+                patches.append(MoveChild(path, at, target))
+                current.insert(target, current.pop(at))
+                moved = True
+        _diff_node((*path, target), old[source], node, patches)
+
+
+def diff(old: Element, new: Element) -> list[Patch]:
+    """Return the patches that turn the `old` tree into the `new` one."""
+    patches: list[Patch] = []
+    _diff_node((), old, new, patches)
+    return patches
+
+
+# ---------------------------------------------------------------------------
+# Applying patches (to check them, or to keep a server-side copy in sync)
+# ---------------------------------------------------------------------------
+
+
+def _dom_tree(tree: Element) -> Element:
+    """
+    Return a copy of a tree whose elements' children are those the browser
+    sees, so patches can index (and add to) them directly.
+    """
+    # Walk the tree with an explicit stack, so deep trees are fine
+    stack: list[tuple[Element, Iterator[Node], list[Node]]] = [
+        (tree, iter(_dom_children(tree)), [])
+    ]
+    while True:
+        element, pending, children = stack[-1]
+        for child in pending:
+            if isinstance(child, Element):
+                stack.append((child, iter(_dom_children(child)), []))
+                break
+            children.append(child)
+        else:
+            stack.pop()
+            copy = Element(element.tag, element.attributes, children)
+            if not stack:
+                return copy
+            stack[-1][2].append(copy)
+
+
+def _dom_node(node: Node) -> Node:
+    """Return a node as the browser sees it once it's been added."""
+    return _dom_tree(node) if isinstance(node, Element) else node
+
+
+def _update(node: Node, path: Path, change: Callable[[Element], Node]) -> Node:
+    """Rebuild the nodes along `path`, replacing the last one with `change`."""
+    assert isinstance(node, Element)
+    if not path:
+        return change(node)
+    child = _update(node.children[path[0]], path[1:], change)
+    return _with_child(node, path[0], child)
+
+
+def _update_node(node: Node, path: Path, new: Node) -> Node:
+    """Rebuild the nodes along `path`, replacing the last one with `new`."""
+    if not path:
+        return new
+    return _update(node, path[:-1], lambda e: _with_child(e, path[-1], new))
+
+
+def _with_child(element: Element, index: int, child: Node) -> Element:
+    """Return a copy of `element` with one child replaced."""
+    children = list(element.children)
+    children[index] = child
+    return Element(element.tag, element.attributes, children)
+
+
+def _apply(node: Node, patch: Patch) -> Node:
+    """Apply one patch to a node."""
+    match patch:
+        case ReplaceText(path, text):
+            return _update_node(node, path, text)
+        case ReplaceNode(path, new):
+            return _update_node(node, path, _dom_node(new))
+        case SetAttribute(path, name, value):
+            return _update(
+                node,
+                path,
+                lambda e: Element(e.tag, {**e.attributes, name: value}, e.children),
+            )
+        case RemoveAttribute(path, name):
+            return _update(
+                node,
+                path,
+                lambda e: Element(
+                    e.tag,
+                    {key: v for key, v in e.attributes.items() if key != name},
+                    e.children,
+                ),
+            )
+        case InsertChild(path, index, child):
+            child = _dom_node(child)
+            return _update(
+                node,
+                path,
+                lambda e: Element(
+                    e.tag,
+                    e.attributes,
+                    [*e.children[:index], child, *e.children[index:]],
+                ),
+            )
+        case RemoveChild(path, index):
+            return _update(
+                node,
+                path,
+                lambda e: Element(
+                    e.tag,
+                    e.attributes,
+                    [*e.children[:index], *e.children[index + 1 :]],
+                ),
+            )
+        case MoveChild(path, from_index, to_index):
+
+            def move(e: Element) -> Element:
+                children = list(e.children)
+                children.insert(to_index, children.pop(from_index))
+                return Element(e.tag, e.attributes, children)
+
+            return _update(node, path, move)
+    raise TypeError(f"Unknown patch: {patch!r}")
+
+
+def apply_patches(tree: Element, patches: Sequence[Patch]) -> Node:
+    """
+    Apply patches, in order, returning the patched tree.
+
+    Text nodes that the patches put next to each other are kept apart, as
+    in the browser; they render the same as if merged.
+    """
+    node: Node = _dom_tree(tree)
+    for patch in patches:
+        node = _apply(node, patch)
+    return node
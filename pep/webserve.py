@@ -0,0 +1,438 @@
+"""
+Serve `html()` output over ASGI and WSGI, streaming it as it renders.
+
+`ASGIResponse` and `WSGIResponse` are themselves ASGI and WSGI applications
+for a single response, much like the response classes of web frameworks:
+
+    async def app(scope, receive, send):
+        await ASGIResponse(page(scope["path"]))(scope, receive, send)
+
+    def app(environ, start_response):
+        return WSGIResponse(page(environ["PATH_INFO"]))(environ, start_response)
+
+They take a Template, an Element, or (for ASGI) an awaitable that returns
+either. Templates with awaitable values are rendered with `stream_html()`,
+so the start of the page goes out while slow values load. The rest of the
+page is rendered a chunk at a time, and only as fast as the server takes
+the chunks: the next chunk isn't rendered until the previous one has been
+sent (ASGI) or asked for (WSGI). The response is only started once the
+first chunk is ready, so an error in the template before then can still
+become a 500.
+
+`ASGITestClient` and `WSGITestClient` call an application in-process and
+record when each chunk arrives, for tests and benchmarks.
+"""
+
+import asyncio
+import inspect
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from string.templatelib import Template
+from typing import Any, Awaitable, Callable, Generator, Iterable, Iterator
+
+from .web import Element, async_html, html, html_tagged, stream_html
+
+type Content = Template | Element
+type Headers = Iterable[tuple[str, str]]
+type ASGIApp = Callable[..., Awaitable[None]]
+type WSGIApp = Callable[..., Iterable[bytes]]
+
+CONTENT_TYPE = "text/html; charset=utf-8"
+
+
+# ---------------------------------------------------------------------------
+# Rendering content as a stream of encoded chunks
+# ---------------------------------------------------------------------------
+
+
+def _is_async(template: Template) -> bool:
+    """Return True if the template, or a template nested in it, awaits values."""
+    values = (interpolation.value for interpolation in template.interpolations)
+    return any(
+        inspect.isawaitable(value) or (isinstance(value, Template) and _is_async(value))
+        for value in values
+    )
+
+
+def _iter_encoded(element: Element, buffer_size: int) -> Generator[bytes]:
+    """Render an element to UTF-8 encoded chunks of about `buffer_size`."""
+    pending: list[str] = []
+    size = 0
+    for chunk in element.iter_chunks():
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            yield "".join(pending).encode()
+            pending.clear()
+            size = 0
+    if pending:
+        yield "".join(pending).encode()
+
+
+def _headers(
+    headers: Headers, content_length: int | None = None, etag: str | None = None
+) -> list[tuple[str, str]]:
+    """
+    Add the Content-Length and ETag (replacing any in `headers`), and the
+    Content-Type (unless `headers` has one) to `headers`.
+    """
+    body_headers: list[tuple[str, str]] = []
+    if content_length is not None:
+        body_headers.append(("Content-Length", str(content_length)))
+    if etag is not None:
+        body_headers.append(("ETag", etag))
+    names = {name.lower() for name, _ in body_headers}
+    result = [h for h in headers if h[0].lower() not in names]
+    if not any(name.lower() == "content-type" for name, _ in result):
+        result.append(("Content-Type", CONTENT_TYPE))
+    return [*result, *body_headers]
+
+
+# ---------------------------------------------------------------------------
+# ASGI
+# ---------------------------------------------------------------------------
+
+
+class ASGIResponse:
+    """
+    An ASGI application that sends one HTML response, streaming it.
+
+    With `stream=False`, the page is rendered in full first and sent with
+    Content-Length and ETag headers. Otherwise it is sent in chunks of about
+    `buffer_size` characters as it renders, and rendering stops if the
+    client disconnects.
+    """
+
+    def __init__(
+        self,
+        content: Content | Awaitable[Content],
+        status: int = 200,
+        headers: Headers = (),
+        stream: bool = True,
+        buffer_size: int = 16384,
+    ) -> None:
+        self.content = content
+        self.status = status
+        self.headers = list(headers)
+        self.stream = stream
+        self.buffer_size = buffer_size
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        content = self.content
+        if inspect.isawaitable(content):
+            content = await content
+        if not self.stream:
+            if isinstance(content, Template) and _is_async(content):
+                content = await async_html(content)
+            tagged = html_tagged(content)
+            headers = _headers(self.headers, tagged.content_length, tagged.etag)
+            await self._start(send, headers)
+            await send({"type": "http.response.body", "body": tagged.body})
+            return
+
+        disconnected = asyncio.Event()
+
+        async def watch() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            # The response is only started once the first chunk has been
+            # rendered, so that errors in the template can still become a 500
+            if isinstance(content, Template) and _is_async(content):
+                chunks = stream_html(content, buffer_size=self.buffer_size)
+                async with aclosing(chunks):
+                    first = await anext(chunks, None)
+                    await self._start(send, _headers(self.headers))
+                    if first is not None:
+                        await self._send_chunk(send, first.encode())
+                    async for chunk in chunks:
+                        if disconnected.is_set():
+                            return
+                        await self._send_chunk(send, chunk.encode())
+            else:
+                element = html(content) if isinstance(content, Template) else content
+                encoded = _iter_encoded(element, self.buffer_size)
+                data = next(encoded, None)
+                await self._start(send, _headers(self.headers))
+                if data is not None:
+                    await self._send_chunk(send, data)
+                for data in encoded:
+                    if disconnected.is_set():
+                        return
+                    await self._send_chunk(send, data)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+
+    async def _start(self, send: Callable, headers: list[tuple[str, str]]) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+        )
+
+    @staticmethod
+    async def _send_chunk(send: Callable, data: bytes) -> None:
+        # Awaiting send() is what applies back-pressure: nothing more is
+        # rendered until the server has taken this chunk
+        await send({"type": "http.response.body", "body": data, "more_body": True})
+
+
+# ---------------------------------------------------------------------------
+# WSGI
+# ---------------------------------------------------------------------------
+
+
+class WSGIResponse:
+    """
+    A WSGI application that sends one HTML response, streaming it.
+
+    With `stream=False`, the page is rendered in full first and sent with
+    Content-Length and ETag headers. Otherwise it is returned as an iterable
+    of chunks of about `buffer_size` characters, each rendered only when the
+    server asks for it. Templates with awaitable values are resolved on an
+    event loop of their own, one chunk at a time.
+    """
+
+    def __init__(
+        self,
+        content: Content,
+        status: int = 200,
+        headers: Headers = (),
+        stream: bool = True,
+        buffer_size: int = 16384,
+    ) -> None:
+        self.content = content
+        self.status = status
+        self.headers = list(headers)
+        self.stream = stream
+        self.buffer_size = buffer_size
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        status = f"{self.status} {HTTPStatus(self.status).phrase}"
+        content = self.content
+        if not self.stream:
+            if isinstance(content, Template) and _is_async(content):
+                content = asyncio.run(async_html(content))
+            tagged = html_tagged(content)
+            headers = _headers(self.headers, tagged.content_length, tagged.etag)
+            start_response(status, headers)
+            return [tagged.body]
+        if isinstance(content, Template) and _is_async(content):
+            chunks = self._async_chunks(content)
+        else:
+            element = html(content) if isinstance(content, Template) else content
+            chunks = _iter_encoded(element, self.buffer_size)
+        return self._start_with_first_chunk(chunks, status, start_response)
+
+    def _start_with_first_chunk(
+        self, chunks: Generator[bytes], status: str, start_response: Callable
+    ) -> Iterator[bytes]:
+        """
+        Call `start_response()` once the first chunk has been rendered, so
+        that errors in the template can still become a 500, then stream.
+        """
+        try:
+            first = next(chunks, None)
+            start_response(status, _headers(self.headers))
+            if first is not None:
+                yield first
+            yield from chunks
+        finally:
+            chunks.close()
+
+    def _async_chunks(self, template: Template) -> Generator[bytes]:
+        loop = asyncio.new_event_loop()
+        chunks = stream_html(template, buffer_size=self.buffer_size)
+        try:
+            while True:
+                try:
+                    chunk = loop.run_until_complete(anext(chunks))
+                except StopAsyncIteration:
+                    return
+                yield chunk.encode()
+        finally:
+            # Cancel any values still loading if the server stops early
+            loop.run_until_complete(chunks.aclose())
+            loop.close()
+
+
+# ---------------------------------------------------------------------------
+# In-process test clients
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ClientResponse:
+    """A response received by a test client, and when its chunks arrived."""
+
+    status: int
+    headers: list[tuple[str, str]]
+    chunks: list[bytes] = field(default_factory=list)
+    # Seconds from the request to each chunk's arrival
+    arrivals: list[float] = field(default_factory=list)
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+    @property
+    def text(self) -> str:
+        return self.body.decode()
+
+    def header(self, name: str) -> str | None:
+        """Return the first value of the header `name`, if any."""
+        name = name.lower()
+        return next((v for n, v in self.headers if n.lower() == name), None)
+
+    @property
+    def first_chunk(self) -> float:
+        """Seconds until the first (non-empty) chunk arrived."""
+        return next((t for c, t in zip(self.chunks, self.arrivals) if c), self.total)
+
+    @property
+    def total(self) -> float:
+        """Seconds until the response was complete."""
+        return self.arrivals[-1] if self.arrivals else 0.0
+
+
+class ASGITestClient:
+    """
+    Call an ASGI application in-process, as a server would.
+
+    `read_delay` is how long the client takes to read each chunk; while it
+    does, the application's `send()` doesn't return, as with a slow client.
+    """
+
+    def __init__(self, app: ASGIApp, read_delay: float = 0.0) -> None:
+        self.app = app
+        self.read_delay = read_delay
+
+    async def request(
+        self, path: str = "/", method: str = "GET", headers: Headers = ()
+    ) -> ClientResponse:
+        """Make a request and wait for the whole response."""
+        scope: dict[str, Any] = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ],
+            "server": ("testserver", 80),
+        }
+        done = asyncio.Event()
+        response: ClientResponse | None = None
+        start = time.perf_counter()
+
+        async def receive() -> dict:
+            if not done.is_set():
+                # Don't disconnect until the response is complete
+                await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            nonlocal response
+            if message["type"] == "http.response.start":
+                response = ClientResponse(
+                    message["status"],
+                    [
+                        (name.decode("latin-1"), value.decode("latin-1"))
+                        for name, value in message.get("headers", [])
+                    ],
+                )
+                return
+            assert response is not None, "body sent before the response started"
+            response.chunks.append(message.get("body", b""))
+            response.arrivals.append(time.perf_counter() - start)
+            if not message.get("more_body", False):
+                done.set()
+            elif self.read_delay:
+                await asyncio.sleep(self.read_delay)
+
+        await self.app(scope, receive, send)
+        done.set()
+        if response is None:
+            raise RuntimeError("The application sent no response")
+        return response
+
+    def get(self, path: str = "/", headers: Headers = ()) -> ClientResponse:
+        """Make a GET request outside of any event loop."""
+        return asyncio.run(self.request(path, "GET", headers))
+
+
+class WSGITestClient:
+    """Call a WSGI application in-process, as a server would."""
+
+    def __init__(self, app: WSGIApp) -> None:
+        self.app = app
+
+    def request(
+        self, path: str = "/", method: str = "GET", headers: Headers = ()
+    ) -> ClientResponse:
+        """Make a request and read the whole response."""
+        environ: dict[str, Any] = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "testserver",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            **{
+                "HTTP_" + name.upper().replace("-", "_"): value
+                for name, value in headers
+            },
+        }
+        started: list[tuple[str, list[tuple[str, str]]]] = []
+
+        def start_response(
+            status: str, headers: list[tuple[str, str]], exc_info: object = None
+        ) -> Callable[[bytes], None]:
+            started.append((status, headers))
+            return lambda data: None
+
+        start = time.perf_counter()
+        chunks = self.app(environ, start_response)
+        body: list[bytes] = []
+        arrivals: list[float] = []
+        try:
+            # Applications may call start_response() as late as their first chunk
+            for chunk in chunks:
+                body.append(chunk)
+                arrivals.append(time.perf_counter() - start)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        if not started:
+            raise RuntimeError("The application sent no response")
+        status, response_headers = started[-1]
+        return ClientResponse(
+            int(status.split()[0]), list(response_headers), body, arrivals
+        )
+
+    def get(self, path: str = "/", headers: Headers = ()) -> ClientResponse:
+        """Make a GET request."""
+        return self.request(path, "GET", headers)